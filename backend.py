@@ -0,0 +1,260 @@
+# backend.py
+
+import asyncio
+import os
+import secrets
+import socket
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+# --- CONFIGURATION ---
+LOCK_TTL = 30  # A lock whose holder died is taken over after this many seconds
+LOCK_TIMEOUT = 10  # Give up waiting for a lock after this long
+LOCK_POLL = 0.05
+SQLITE_BUSY_TIMEOUT = 0.02  # Longest a SQLite statement may block the event loop waiting for another process
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Deletes a lock only if it is still held by the caller
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Token bucket: ARGV = rate, capacity, now. Returns 0 when a token was taken,
+# otherwise the milliseconds to wait before one is available.
+TAKE_SCRIPT = """
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate * 1000) + 60000)
+return wait
+"""
+
+
+class LockTimeout(Exception):
+    """Raised when a shared lock could not be acquired in time."""
+
+
+class SharedBackend:
+    """State shared by every shard process: named locks with an expiry and token buckets.
+
+    Subclasses implement `acquire`, `release` and `take`; `lock()` builds an
+    async context manager on top of them.
+    """
+
+    async def acquire(self, name, owner, ttl):
+        """Takes lock `name` for `owner` unless someone else holds it. Returns True on success."""
+        raise NotImplementedError
+
+    async def release(self, name, owner):
+        """Releases lock `name` if `owner` still holds it."""
+        raise NotImplementedError
+
+    async def take(self, bucket, rate, capacity):
+        """Takes a token from `bucket`. Returns 0 on success, else the seconds until one is available."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    @asynccontextmanager
+    async def lock(self, name, ttl=LOCK_TTL, timeout=LOCK_TIMEOUT):
+        """Holds lock `name` for the body of an `async with` block.
+
+        Every acquisition gets its own owner token, so two tasks of the same
+        process exclude each other just like two processes do.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        give_up = time.monotonic() + timeout
+        while not await self.acquire(name, owner, ttl):
+            if time.monotonic() >= give_up:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            await self.release(name, owner)
+
+
+class MemoryBackend(SharedBackend):
+    """Keeps everything in this process; for development and single-process deployments."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._locks = {}    # name -> (owner, expires)
+        self._buckets = {}  # name -> (tokens, updated)
+
+    async def acquire(self, name, owner, ttl):
+        now = self.clock()
+        held = self._locks.get(name)
+        if held is not None and held[1] > now:
+            return False
+        self._locks[name] = (owner, now + ttl)
+        return True
+
+    async def release(self, name, owner):
+        if self._locks.get(name, (None,))[0] == owner:
+            del self._locks[name]
+
+    async def take(self, bucket, rate, capacity):
+        now = self.clock()
+        tokens, updated = self._buckets.get(bucket, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._buckets[bucket] = (tokens - 1, now)
+            return 0
+        self._buckets[bucket] = (tokens, now)
+        return (1 - tokens) / rate
+
+
+class SQLiteBackend(SharedBackend):
+    """Shares state through a SQLite file, for several shard processes on one machine.
+
+    sqlite3 blocks while another process holds the write lock, so statements
+    only wait SQLITE_BUSY_TIMEOUT; a busy database reads as a lock that is
+    held or a bucket that is empty, and the caller polls again with
+    `asyncio.sleep` instead of stalling the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit mode, so every statement (or explicit BEGIN IMMEDIATE block) is atomic on its own
+        self.conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SHARED_SCHEMA)
+        self.conn.execute(f'PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT * 1000)}')
+
+    @staticmethod
+    def _busy(error):
+        return error.sqlite_errorcode in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+    async def acquire(self, name, owner, ttl):
+        now = time.time()
+        try:
+            cursor = self.conn.execute(
+                'INSERT INTO locks (name, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires WHERE locks.expires <= ?',
+                (name, owner, now + ttl, now)
+            )
+        except sqlite3.OperationalError as e:
+            if not self._busy(e):
+                raise
+            return False
+        return cursor.rowcount == 1
+
+    async def release(self, name, owner):
+        # If the database stays busy the lock is left to expire after its ttl
+        give_up = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                self.conn.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+                return
+            except sqlite3.OperationalError as e:
+                if not self._busy(e) or time.monotonic() >= give_up:
+                    raise
+            await asyncio.sleep(LOCK_POLL)
+
+    async def take(self, bucket, rate, capacity):
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError as e:
+            if not self._busy(e):
+                raise
+            return LOCK_POLL
+        try:
+            now = time.time()
+            row = self.conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (bucket,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if tokens >= 1:
+                tokens -= 1
+            self.conn.execute(
+                'INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (bucket, tokens, now)
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    async def close(self):
+        self.conn.close()
+
+
+class RedisBackend(SharedBackend):
+    """Shares state through a Redis-compatible server instead of a SQLite file.
+
+    Only the locks and token buckets move to Redis: users and duels stay in
+    the SQLite database, so every shard process must still run on one host
+    and share its data directory (SQLite WAL does not work over a network
+    filesystem).
+
+    `client` is a `redis.asyncio.Redis` (or anything with the same `set`,
+    `eval` and `aclose` coroutines, such as `bench.fake_redis.FakeRedis`).
+    """
+
+    def __init__(self, client, prefix='duelbot:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a Redis backend: pip install redis") from None
+        return cls(redis.from_url(url), **kwargs)
+
+    async def acquire(self, name, owner, ttl):
+        return bool(await self.client.set(self.prefix + 'lock:' + name, owner, nx=True, px=int(ttl * 1000)))
+
+    async def release(self, name, owner):
+        await self.client.eval(RELEASE_SCRIPT, 1, self.prefix + 'lock:' + name, owner)
+
+    async def take(self, bucket, rate, capacity):
+        wait = await self.client.eval(TAKE_SCRIPT, 1, self.prefix + 'bucket:' + bucket, rate, capacity, time.time())
+        return int(wait) / 1000
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def open_backend(spec, data_dir='./'):
+    """Creates the backend named by `spec`: `memory`, `sqlite`, `sqlite:<path>` or a `redis://` URL."""
+    if spec == 'memory':
+        return MemoryBackend()
+    if spec == 'sqlite':
+        return SQLiteBackend(os.path.join(data_dir, 'shared.db'))
+    if spec.startswith('sqlite:'):
+        return SQLiteBackend(spec[len('sqlite:'):])
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend.from_url(spec)
+    raise ValueError(f"Unknown shared backend: {spec}")
@@ -0,0 +1,89 @@
+# bench/bench_event_loop.py
+
+"""Measures event-loop latency while many guilds call the Codeforces API.
+
+The fake API runs in its own thread so that the old blocking code path
+(a synchronous HTTP call made from a coroutine) can be compared with the
+pooled async client.
+
+    python -m bench.bench_event_loop --guilds 200 --mode async
+    python -m bench.bench_event_loop --guilds 200 --mode blocking
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+
+from bench.fake_codeforces import FakeCodeforces
+from codeforces import CodeforcesClient
+
+
+def start_fake_server(**kwargs):
+    """Runs a FakeCodeforces server on a background thread and returns its base URL."""
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = FakeCodeforces(**kwargs)
+        holder['url'] = loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return holder['url']
+
+
+async def sample_lag(stop, interval=0.01):
+    """Records how late the loop wakes up from a fixed sleep."""
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return lags
+
+
+async def run(args):
+    base_url = start_fake_server(history=args.history, latency=args.latency)
+    client = CodeforcesClient(base_url=base_url, rate=args.rate, retries=0)
+
+    async def guild_async(i):
+        await client.user_status(f"user{i}", start=1, count=10)
+
+    async def guild_blocking(i):
+        with urllib.request.urlopen(f"{base_url}user.status?handle=user{i}&from=1&count=10") as response:
+            json.load(response)
+
+    guild = guild_async if args.mode == 'async' else guild_blocking
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(guild(i) for i in range(args.guilds)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lags = sorted(await sampler)
+    await client.close()
+
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(f"mode={args.mode} guilds={args.guilds} elapsed={elapsed:.2f}s")
+    print(f"loop lag: max={max(lags, default=0) * 1000:.1f}ms p99={p99 * 1000:.1f}ms samples={len(lags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--mode', choices=['async', 'blocking'], default='async')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake API latency in seconds')
+    parser.add_argument('--history', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=1000.0, help='client token bucket rate (calls/s)')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# bench/bench_judge.py
+
+"""Drives the duel judge through hundreds of concurrent duels on a simulated clock.
+
+Submissions (including ones that sit in TESTING for a while, some still
+there at the deadline) are scripted in advance against an in-memory fake of
+`user.status`. The script checks that
+every duel is settled with the right winner, and reports API calls and how
+long after the accepted verdict each winner was declared.
+
+    python -m bench.bench_judge --duels 500
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from duels import DuelEngine, Judge, DEADLINE_GRACE, JUDGE_MIN_INTERVAL
+from storage import Storage
+
+
+class SimClock:
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStatusClient:
+    """Serves scripted submissions that become visible (and judged) as the clock advances."""
+
+    def __init__(self, clock, judging_delay):
+        self.clock = clock
+        self.judging_delay = judging_delay
+        self.submissions = {}  # handle -> list of (submission, final verdict), oldest first
+        self.calls = 0
+
+    def submit(self, handle, sub_id, when, problem, verdict):
+        sub = {'id': sub_id, 'creationTimeSeconds': when, 'problem': problem, 'verdict': None}
+        self.submissions.setdefault(handle, []).append((sub, verdict))
+
+    async def user_status(self, handle, start=1, count=None):
+        self.calls += 1
+        now = self.clock()
+        visible = []
+        for sub, verdict in reversed(self.submissions.get(handle, [])):
+            if sub['creationTimeSeconds'] > now:
+                continue
+            judged = now >= sub['creationTimeSeconds'] + self.judging_delay
+            visible.append(dict(sub, verdict=verdict if judged else 'TESTING'))
+        return visible[start - 1:start - 1 + count] if count else visible[start - 1:]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    t0 = time.time()
+    clock = SimClock(t0)
+    client = FakeStatusClient(clock, args.judging_delay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'))
+        engine = DuelEngine(storage)
+        judge = Judge(engine, client, handle_of=lambda guild_id, discord_id: f"h{discord_id}", clock=clock, rate=args.rate)
+        declared = {}
+
+        async def on_win(duel, winner_id, submission):
+            engine.finish(duel, winner_id)
+            declared[duel['duel_id']] = (winner_id, clock())
+
+        judge.on_win = on_win
+
+        # Submission ids grow with time on Codeforces, so ids are handed out after sorting
+        scripted = []
+        problems = {}
+        for i in range(args.duels):
+            a, b = str(2 * i), str(2 * i + 1)
+            problem = {'contestId': 1000 + i, 'index': 'A', 'name': f"Problem {i}"}
+            duel = engine.reserve(str(i % args.guilds), '0', a, b, 1500)
+            engine.start(duel, problem)
+            duel['start_time'] = duel['start_time'].fromtimestamp(t0, duel['start_time'].tzinfo)
+            duel['deadline'] = t0 + engine.duration
+            problems[duel['duel_id']] = problem
+            for player in (a, b):
+                for _ in range(rng.randint(0, args.noise)):
+                    scripted.append((t0 + rng.uniform(-3600, engine.duration), player, {'contestId': 1, 'index': 'B'}, None))
+                if rng.random() < 0.8:
+                    scripted.append((int(t0 + rng.uniform(30, engine.duration)), player, problem, duel['duel_id']))
+
+        expected = dict.fromkeys(problems)
+        scripted.sort(key=lambda item: item[0])
+        for sub_id, (when, player, problem, duel_id) in enumerate(scripted, start=1):
+            client.submit(f"h{player}", sub_id, when, problem, 'OK')
+            if duel_id is not None and expected[duel_id] is None:
+                expected[duel_id] = (when, sub_id, player)
+
+        start = time.perf_counter()
+        while clock.now < t0 + engine.duration:
+            clock.now += args.step
+            await judge.tick()
+        # At the deadline the duel scheduler gives every remaining duel one last check, and checks
+        # again while a solution is still being judged, as duel_timeout does
+        remaining = list(engine.duels.values())
+        while remaining:
+            for duel in remaining:
+                await judge.check(duel)
+            remaining = [duel for duel in remaining if duel['duel_id'] in engine.duels
+                         and judge.judging(duel) and clock.now < duel['deadline'] + DEADLINE_GRACE]
+            clock.now += JUDGE_MIN_INTERVAL
+        elapsed = time.perf_counter() - start
+
+    wrong = 0
+    delays = []
+    for duel_id, first in expected.items():
+        result = declared.get(duel_id)
+        if first is None:
+            wrong += result is not None
+        elif result is None or result[0] != first[2]:
+            wrong += 1
+        else:
+            delays.append(result[1] - first[0])
+
+    print(f"duels={args.duels} guilds={args.guilds} simulated={engine.duration}s wall={elapsed:.2f}s")
+    print(f"api calls={client.calls} ({client.calls / engine.duration:.2f}/simulated s, judge rate {args.rate}/s)")
+    print(f"wrong or missed winners={wrong}")
+    if delays:
+        print(f"detection delay: median={statistics.median(delays):.0f}s max={max(delays):.0f}s")
+    return wrong == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duels', type=int, default=300)
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--noise', type=int, default=5, help='max unrelated submissions per player')
+    parser.add_argument('--judging-delay', type=float, default=10.0, help='seconds a submission stays in TESTING')
+    parser.add_argument('--step', type=float, default=1.0, help='simulated seconds per judge tick')
+    parser.add_argument('--rate', type=float, default=20.0, help='API calls per second the judge may use')
+    parser.add_argument('--seed', type=int, default=1)
+    raise SystemExit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == '__main__':
+    main()
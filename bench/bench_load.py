@@ -0,0 +1,175 @@
+# bench/bench_load.py
+
+"""Load-tests the bot's real command coroutines across many simulated guilds.
+
+Each guild gets two members who `!register` (answering the verification DM
+through the fake gateway), then one `!challenge`s the other (who accepts by
+reaction), checks `!solved` and opens the `!leaderboard`. Codeforces is a
+local FakeCodeforces server on its own thread, with configurable latency
+and `Call limit exceeded` answers, serving generated or recorded payloads.
+Nothing touches the network, so the suite can run in CI.
+
+Reports throughput, p50/p99 latency per command and memory, and exits with
+status 1 if any command failed or a guild did not end up in a duel.
+
+    python -m bench.bench_load --guilds 1 10 100 1000 10000
+    python -m bench.bench_load --guilds 500 --latency 0.1 --limit-error-rate 0.05
+    python -m bench.bench_load --guilds 50 --recording recorded/
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from bench.fake_codeforces import FakeCodeforces, load_recording
+from bench.fake_discord import FakeChannel, FakeContext, FakeGateway, FakeGuild
+from codeforces import RateLimiter
+
+
+def start_fake_server(**kwargs):
+    """Runs a FakeCodeforces server on a background thread and returns it once it is serving."""
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        holder['server'] = FakeCodeforces(**kwargs)
+        loop.run_until_complete(holder['server'].start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return holder['server']
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def import_bot(data_dir):
+    """Imports bot.py with its data files in `data_dir` and no metrics endpoint."""
+    os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = data_dir
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['SHARED_BACKEND'] = 'memory'
+    os.environ.pop('SHARD_COUNT', None)
+    return importlib.import_module('bot')
+
+
+async def run(args, data_dir):
+    problems, statuses = load_recording(args.recording) if args.recording else (None, None)
+    server = start_fake_server(problems=problems, statuses=statuses, history=args.history, latency=args.latency,
+                               limit_error_rate=args.limit_error_rate, seed=args.seed)
+    duelbot = import_bot(data_dir)
+    duelbot.cf.base_url = server.base_url
+    duelbot.cf.limiter = RateLimiter(rate=args.rate, capacity=args.rate)
+    duelbot.cf.backoff = 0.1
+    duelbot.verifier.interval = duelbot.verifier.retry = args.verify_interval
+    duelbot.verifier.first_check = 0
+    channels = {}
+    duelbot.bot.get_channel = channels.get
+
+    gateway = FakeGateway(duelbot.bot, server, args.reaction_delay)
+    rng = random.Random(args.seed)
+    latencies = {}
+    failures = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def timed(name, command, *params):
+        start = time.perf_counter()
+        try:
+            await command(*params)
+        except Exception as e:
+            failures.append(f"{name}: {e!r}")
+        latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    async def guild_session(i):
+        async with semaphore:
+            guild = FakeGuild(10 ** 17 + i, f"Guild {i}")
+            channel = FakeChannel(gateway)
+            channels[channel.id] = channel
+            first = gateway.member(guild, f"first{i}", handle=f"user{i}a")
+            second = gateway.member(guild, f"second{i}", handle=f"user{i}b")
+            first_ctx, second_ctx = FakeContext(guild, channel, first), FakeContext(guild, channel, second)
+            await asyncio.gather(
+                timed('register', duelbot.register, first_ctx, first.handle),
+                timed('register', duelbot.register, second_ctx, second.handle),
+            )
+            await timed('challenge', duelbot.challenge, first_ctx, second, str(rng.randrange(800, 2600, 100)))
+            await timed('solved', duelbot.solved, first_ctx)
+            await timed('leaderboard', duelbot.leaderboard, first_ctx)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    async with duelbot.bot:
+        start = time.perf_counter()
+        await asyncio.gather(*(guild_session(i) for i in range(args.guilds)))
+        elapsed = time.perf_counter() - start
+        in_duel = len(duelbot.duels.duels)
+        registered = sum(len(duelbot.users.get_guild_users(str(10 ** 17 + i))) for i in range(args.guilds))
+        peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"guilds={args.guilds} commands={total} elapsed={elapsed:.2f}s throughput={total / elapsed:.1f} commands/s "
+          f"(api latency {args.latency * 1000:.0f}ms, limit errors {args.limit_error_rate:.0%}, reaction delay {args.reaction_delay * 1000:.0f}ms)")
+    for name, samples in latencies.items():
+        samples.sort()
+        print(f"  {name:<12} n={len(samples):<6} p50={percentile(samples, 0.5) * 1000:8.1f}ms  "
+              f"p99={percentile(samples, 0.99) * 1000:8.1f}ms  mean={statistics.fmean(samples) * 1000:8.1f}ms")
+    memory = f"max rss={resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB"
+    if peak is not None:
+        memory += f" python heap peak={peak / 2 ** 20:.1f}MB"
+    print(f"  {memory}, codeforces calls={server.calls}, reactions={gateway.reactions}")
+    print(f"  registered={registered}/{2 * args.guilds} duels started={in_duel}/{args.guilds} failures={len(failures)}")
+    for failure in failures[:5]:
+        print(f"    {failure}")
+    return not failures and registered == 2 * args.guilds and in_duel == args.guilds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, nargs='+', default=[100], help='one run per value, each in a fresh process')
+    parser.add_argument('--concurrency', type=int, default=200, help='guild sessions in flight at once')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake API latency in seconds')
+    parser.add_argument('--limit-error-rate', type=float, default=0.0, help='share of API calls answered with Call limit exceeded')
+    parser.add_argument('--history', type=int, default=100, help='generated submissions per handle')
+    parser.add_argument('--recording', help='directory of recorded API responses (see bench.fake_codeforces.load_recording)')
+    parser.add_argument('--rate', type=float, default=200.0, help='client API calls per second')
+    parser.add_argument('--reaction-delay', type=float, default=0.05, help='seconds before a simulated user reacts')
+    parser.add_argument('--verify-interval', type=float, default=0.1, help='seconds between batched verification checks')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the Python heap peak (slower)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if len(args.guilds) > 1:
+        # The bot module holds global state, so every size gets its own interpreter
+        ok = True
+        for guilds in args.guilds:
+            argv = [arg for arg in sys.argv[1:]]
+            index = argv.index('--guilds')
+            end = index + 1
+            while end < len(argv) and not argv[end].startswith('--'):
+                end += 1
+            argv[index:end] = ['--guilds', str(guilds)]
+            ok = subprocess.run([sys.executable, '-m', 'bench.bench_load'] + argv).returncode == 0 and ok
+        sys.exit(0 if ok else 1)
+
+    args.guilds = args.guilds[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = asyncio.run(run(args, tmp))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
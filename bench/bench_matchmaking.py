@@ -0,0 +1,78 @@
+# bench/bench_matchmaking.py
+
+"""Measures how long a matchmaking pass takes as the queue grows.
+
+Every round fills the pools of several guilds with players who have random
+Elo ratings, rating ranges and solved sets, then times `Matchmaker.match()`
+until nobody else can be paired (the clock is advanced between passes so
+waiting windows widen).
+
+    python -m bench.bench_matchmaking --sizes 100 1000 10000
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from bench.fake_codeforces import make_problems
+from matchmaking import Matchmaker
+from problems import ProblemCatalog
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def build_catalog(count, seed):
+    rows = [[p['contestId'], p['index'], p['name'], p.get('rating'), p['tags']] for p in make_problems(count, seed)]
+    catalog = ProblemCatalog(None, None)
+    catalog.__dict__.update(ProblemCatalog._index(rows, {}))
+    return catalog
+
+
+def fill(matchmaker, catalog, size, guilds, solved, rng):
+    ids = list(catalog.ids)
+    for i in range(size):
+        low = rng.randrange(800, 3000, 100)
+        high = min(3500, low + rng.choice((0, 100, 300, 500)))
+        matchmaker.join(str(i % guilds), str(i), rng.gauss(1500, 300), low, high, '0', set(rng.sample(ids, solved)))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    catalog = build_catalog(args.problems, args.seed)
+    print(f"problems={len(catalog)} guilds={args.guilds} solved/player={args.solved}")
+    for size in args.sizes:
+        clock = SimClock()
+        matchmaker = Matchmaker(catalog, clock=clock)
+        fill(matchmaker, catalog, size, args.guilds, args.solved, rng)
+        passes, paired = [], 0
+        while len(matchmaker):
+            start = time.perf_counter()
+            pairs = matchmaker.match()
+            passes.append(time.perf_counter() - start)
+            paired += 2 * len(pairs)
+            if not pairs and clock.now > 600:
+                break
+            clock.now += 30
+        print(f"queued={size:>6}  first pass={passes[0] * 1000:9.2f}ms  median pass={statistics.median(passes) * 1000:8.2f}ms  "
+              f"per player={passes[0] / size * 1e6:6.1f}us  passes={len(passes)}  paired={paired}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 10000])
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--problems', type=int, default=10000)
+    parser.add_argument('--solved', type=int, default=300, help='solved problems per player')
+    parser.add_argument('--seed', type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# bench/bench_memory.py
+
+"""Compares peak memory of parsing Codeforces responses whole against streaming them.
+
+Each mode runs in a fresh interpreter against a FakeCodeforces server in
+another process, so the measured RSS belongs to the bot code alone:
+
+- `dict`: `response.json()` on the full payload, as `challenge` used to do;
+- `stream`: the streamed client methods behind ProblemCatalog and
+  SolvedCache, which decode the response element by element into
+  `__slots__` records.
+
+Both load the problemset, then set up duels by fetching the full history
+of two fresh handles at once. Reports the Python heap peak of every phase
+(tracemalloc) and the peak RSS of each mode's process.
+
+    python -m bench.bench_memory --history 5000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def serve(history, queue):
+    from bench.fake_codeforces import FakeCodeforces
+
+    async def main():
+        server = FakeCodeforces(history=history, latency=0)
+        queue.put(await server.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def measure(mode, base_url, duels, queue):
+    from codeforces import CodeforcesClient
+    from problems import SolvedCache, problem_id
+
+    async def main():
+        client = CodeforcesClient(base_url=base_url, rate=1000.0, retries=0)
+        phases = []
+
+        async def phase(name, coro):
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            await coro
+            phases.append((name, time.perf_counter() - start, tracemalloc.get_traced_memory()[1] / 2 ** 20))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            if mode == 'dict':
+                async def load_problems():
+                    payload, _ = await client.problemset_problems()
+                    return [[p['contestId'], p['index'], p.get('name', ''), p.get('rating'), p.get('tags', [])]
+                            for p in payload['problems'] if 'contestId' in p and 'index' in p]
+
+                async def solved(handle):
+                    submissions = await client.user_status(handle)
+                    return {problem_id(s['problem']['contestId'], s['problem']['index'])
+                            for s in submissions if s.get('verdict') == 'OK' and 'contestId' in s['problem']}
+            else:
+                # The rows ProblemCatalog.refresh builds, and the real SolvedCache
+                async def load_problems():
+                    records, _ = await client.problemset_records()
+                    return [[p.contest_id, p.index, p.name, p.rating, p.tags] for p in records]
+
+                solved = SolvedCache(client, os.path.join(tmp, 'solved.json')).solved
+
+            await phase('problemset', load_problems())
+            for i in range(duels):
+                await phase(f"duel {i + 1}", asyncio.gather(solved(f"{mode}{i}a"), solved(f"{mode}{i}b")))
+        await client.close()
+        return phases, max_rss_mb()
+
+    tracemalloc.start()
+    queue.put(asyncio.run(main()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, default=5000, help='submissions per handle')
+    parser.add_argument('--duels', type=int, default=3, help='duel setups measured per mode')
+    args = parser.parse_args()
+
+    spawn = multiprocessing.get_context('spawn')
+    queue = spawn.Queue()
+    server = spawn.Process(target=serve, args=(args.history, queue), daemon=True)
+    server.start()
+    base_url = queue.get()
+
+    print(f"history={args.history} submissions per handle")
+    results = {}
+    for mode in ('dict', 'stream'):
+        worker = spawn.Process(target=measure, args=(mode, base_url, args.duels, queue))
+        worker.start()
+        results[mode] = queue.get()
+        worker.join()
+        phases, rss = results[mode]
+        for name, elapsed, heap in phases:
+            print(f"{mode:<7} {name:<11} {elapsed * 1000:8.1f}ms  heap peak={heap:7.1f}MB")
+        print(f"{mode:<7} process peak RSS={rss:.1f}MB")
+    server.terminate()
+
+    def per_duel(mode):
+        return max(heap for name, _, heap in results[mode][0] if name.startswith('duel'))
+
+    print(f"heap peak per duel: {per_duel('dict'):.1f}MB -> {per_duel('stream'):.1f}MB; "
+          f"peak RSS: {results['dict'][1]:.1f}MB -> {results['stream'][1]:.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
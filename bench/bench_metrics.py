@@ -0,0 +1,75 @@
+# bench/bench_metrics.py
+
+"""Measures what the command and API instrumentation costs per call.
+
+The per-command hooks (a timer stamp plus a labelled histogram observation)
+and the per-attempt API recording are timed in a tight loop. For scale, the
+in-memory lookup behind `!rank` on a 10,000-user guild is timed too; every
+command also pays discord.py's parsing and dispatch and a Discord round
+trip for its reply, which dwarf both.
+
+    python -m bench.bench_metrics --iterations 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from codeforces import CodeforcesClient
+from metrics import Metrics
+from storage import Storage, UserCache
+
+
+def per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    ctx = SimpleNamespace(command=SimpleNamespace(qualified_name='rank'), command_failed=False, started_at=0.0)
+
+    # The same work as bot.start_command_timer and bot.record_command_latency
+    def hooks():
+        ctx.started_at = time.perf_counter()
+        outcome = 'error' if ctx.command_failed else 'ok'
+        metrics.histogram('command_latency_seconds', (('command', ctx.command.qualified_name), ('outcome', outcome))).observe(time.perf_counter() - ctx.started_at)
+
+    client = CodeforcesClient()
+
+    def api_record():
+        client._record('user.status', 'ok', time.perf_counter())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'))
+        storage.upsert_users([('g', str(i), f"handle{i}", i % 500, 1500) for i in range(args.users)])
+        users = UserCache(storage)
+        users.ranking('g')
+
+        def rank():
+            user = users.get_user('g', '4242')
+            users.ranking('g').rank('4242', user['points'])
+
+        hook_cost = per_call(hooks, args.iterations)
+        api_cost = per_call(api_record, args.iterations)
+        rank_cost = per_call(rank, args.iterations // 10)
+        storage.close()
+
+    print(f"command hooks: {hook_cost * 1e6:.2f}us per command")
+    print(f"api recording: {api_cost * 1e6:.2f}us per request attempt")
+    print(f"!rank lookup ({args.users} users): {rank_cost * 1e6:.2f}us")
+    for label, seconds in (("1ms command", 0.001), ("50ms Discord round trip", 0.05)):
+        print(f"hook overhead on a {label}: {hook_cost / seconds:.3%}")
+
+
+if __name__ == '__main__':
+    main()
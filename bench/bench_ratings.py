@@ -0,0 +1,44 @@
+# bench/bench_ratings.py
+
+"""Compares rebuilding Elo ratings by calling `update()` per duel against `replay()`.
+
+    python -m bench.bench_ratings --duels 100000 --players 500
+"""
+
+import argparse
+import random
+import time
+
+import ratings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duels', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for _ in range(args.duels):
+        a, b = rng.sample(range(args.players), 2)
+        results.append((str(a), str(b), rng.choice((0.0, 0.5, 1.0))))
+
+    start = time.perf_counter()
+    looped = {}
+    for a, b, score in results:
+        looped[a], looped[b] = ratings.update(looped.get(a, ratings.ELO_DEFAULT), looped.get(b, ratings.ELO_DEFAULT), score)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replayed = ratings.replay(results)
+    replay_time = time.perf_counter() - start
+
+    error = max(abs(looped[p] - replayed[p]) for p in looped)
+    print(f"duels={args.duels} players={args.players}")
+    print(f"update() loop: {loop_time:.3f}s  replay: {replay_time:.3f}s  max difference: {error:.2e}")
+
+
+if __name__ == '__main__':
+    main()
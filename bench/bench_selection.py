@@ -0,0 +1,99 @@
+# bench/bench_selection.py
+
+"""Compares duel problem selection latency: the old download-and-scan path
+against the cached ProblemCatalog, cold (empty cache) and warm, where
+the warm pick builds the solved bitset from a set of ids, and the pick
+that reuses the solved bitset, as SolvedCache.bits() does between duels,
+also with a rating range, a tag and a contest-year filter.
+
+    python -m bench.bench_selection --rounds 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from bench.fake_codeforces import FakeCodeforces
+from codeforces import CodeforcesClient
+from problems import ProblemCatalog, problem_id
+
+
+async def old_path(client, solved, rating):
+    """The selection code `challenge` used before the catalog existed."""
+    problems_data, _ = await client.problemset_problems()
+    potential = [p for p in problems_data['problems'] if p.get('rating') == rating and 'contestId' in p and 'index' in p and f"{p.get('contestId')}{p.get('index')}" not in solved]
+    return random.choice(potential) if potential else None
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print(f"{name:<10} median={statistics.median(samples) * 1000:9.3f}ms  max={samples[-1] * 1000:9.3f}ms")
+
+
+async def run(args):
+    server = FakeCodeforces(latency=args.latency)
+    base_url = await server.start()
+    client = CodeforcesClient(base_url=base_url, rate=1000.0, retries=0)
+    solved_rows = random.sample(server.problems, args.solved)
+    solved_str = {f"{p['contestId']}{p['index']}" for p in solved_rows}
+    solved_ids = {problem_id(p['contestId'], p['index']) for p in solved_rows}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old, cold, warm, bitset, filtered = [], [], [], [], []
+        for i in range(args.rounds):
+            rating = random.randrange(800, 3600, 100)
+
+            start = time.perf_counter()
+            await old_path(client, solved_str, rating)
+            old.append(time.perf_counter() - start)
+
+            path = os.path.join(tmp, f"cold{i}.bin")
+            start = time.perf_counter()
+            catalog = ProblemCatalog(client, path)
+            await catalog.ensure_loaded()
+            catalog.pick_matching(rating, rating, exclude=catalog.mask(solved_ids))
+            cold.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            catalog.pick_matching(rating, rating, exclude=catalog.mask(solved_ids))
+            warm.append(time.perf_counter() - start)
+
+            exclude = catalog.mask(solved_ids)
+            start = time.perf_counter()
+            catalog.pick_matching(rating, rating, exclude=exclude)
+            bitset.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            catalog.pick_matching(1400, 1900, tags=('dp',), after_year=2015, exclude=exclude)
+            filtered.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        restored = ProblemCatalog(client, os.path.join(tmp, 'cold0.bin'))
+        restored.load()
+        restore = time.perf_counter() - start
+
+    print(f"problems={len(server.problems)} solved={args.solved} rounds={args.rounds}")
+    report('old', old)
+    report('cold', cold)
+    report('warm', warm)
+    report('bitset', bitset)
+    report('filtered', filtered)
+    print(f"restore from disk: {restore * 1000:.1f}ms")
+    await client.close()
+    await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--solved', type=int, default=2000, help='problems already solved by the duelists')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake API latency in seconds')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# bench/bench_shards.py
+
+"""Races several shards to start and settle the same duels through a shared backend.
+
+Every shard has its own DuelEngine and database connection on one shared
+SQLite file, and they all try to start a duel for each scripted pair and
+then to settle every active duel. The script checks that each duel was
+started and settled exactly once, and measures the combined request rate
+the shards get through one SharedRateLimiter.
+
+Shards are separate processes with `--backend sqlite`, or tasks in this
+process with `--backend memory` or `--backend fake-redis`:
+
+    python -m bench.bench_shards --shards 4 --backend sqlite
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from backend import MemoryBackend, RedisBackend, SQLiteBackend
+from bench.fake_redis import FakeRedis
+from codeforces import SharedRateLimiter
+from duels import DuelEngine
+from storage import Storage
+
+
+async def shard(shard_id, db_path, backend, args, barrier):
+    storage = Storage(db_path)
+    engine = DuelEngine(storage, backend=backend)
+    started = settled = 0
+    for i in range(args.pairs):
+        guild_id = str(i % args.guilds)
+        duel = engine.reserve(guild_id, '0', f"a{i}", f"b{i}", 1500)
+        problem = {'contestId': 1000 + i, 'index': 'A', 'name': f"Problem {i}"}
+        async with engine.guild_lock(guild_id):
+            started += engine.start(duel, problem) is not None
+    await barrier()
+
+    # Every shard now sees every active duel and tries to settle all of them
+    engine = DuelEngine(storage, backend=backend)
+    engine.restore()
+    for duel in list(engine.duels.values()):
+        async with engine.guild_lock(duel['guild_id']):
+            settled += engine.finish(duel, duel['challenger_id'])
+    await barrier()
+
+    limiter = SharedRateLimiter(backend, rate=args.rate, capacity=1)
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        await limiter.acquire()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return started, settled, elapsed
+
+
+def process_main(shard_id, db_path, shared_path, args, barrier, results):
+    async def wait():
+        await asyncio.to_thread(barrier.wait)
+
+    async def main():
+        backend = SQLiteBackend(shared_path)
+        results.put(await shard(shard_id, db_path, backend, args, wait))
+        await backend.close()
+
+    asyncio.run(main())
+
+
+async def run_in_process(db_path, args):
+    backend = MemoryBackend() if args.backend == 'memory' else RedisBackend(FakeRedis())
+    arrived = [0]
+    event = [asyncio.Event()]
+
+    async def barrier():
+        current = event[0]
+        arrived[0] += 1
+        if arrived[0] == args.shards:
+            arrived[0] = 0
+            event[0] = asyncio.Event()
+            current.set()
+        else:
+            await current.wait()
+
+    results = await asyncio.gather(*(shard(i, db_path, backend, args, barrier) for i in range(args.shards)))
+    await backend.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--backend', choices=('sqlite', 'memory', 'fake-redis'), default='sqlite')
+    parser.add_argument('--pairs', type=int, default=200)
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=20.0, help='shared API calls per second')
+    parser.add_argument('--calls', type=int, default=20, help='rate limiter calls per shard')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        Storage(db_path).close()
+        start = time.perf_counter()
+        if args.backend == 'sqlite':
+            barrier = multiprocessing.Barrier(args.shards)
+            queue = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=process_main, args=(i, db_path, os.path.join(tmp, 'shared.db'), args, barrier, queue))
+                for i in range(args.shards)
+            ]
+            for worker in workers:
+                worker.start()
+            results = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+        else:
+            results = asyncio.run(run_in_process(db_path, args))
+        elapsed = time.perf_counter() - start
+
+    started = sum(result[0] for result in results)
+    settled = sum(result[1] for result in results)
+    limiter_time = max(result[2] for result in results)
+    print(f"shards={args.shards} backend={args.backend} pairs={args.pairs} wall={elapsed:.2f}s")
+    print(f"duels started={started} settled={settled} (each should equal {args.pairs})")
+    print(f"rate limiter: {args.shards * args.calls} calls in {limiter_time:.2f}s = "
+          f"{args.shards * args.calls / limiter_time:.1f}/s combined (limit {args.rate}/s)")
+    raise SystemExit(0 if started == settled == args.pairs else 1)
+
+
+if __name__ == '__main__':
+    main()
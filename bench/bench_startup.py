@@ -0,0 +1,134 @@
+# bench/bench_startup.py
+
+"""Measures a cold boot on a large data directory: time from process start
+to the first duel served, and the boot phases the bot reports in on_ready.
+
+A preparation process fills a data directory through the bot's own
+components: a 10,000-problem catalog, a full solved-problem cache, many
+guilds of registered users and a number of running duels. A fresh process
+then imports the bot against it (with the local FakeCodeforces server on a
+thread) and immediately plays one `!challenge` through the fake gateway.
+
+    python -m bench.bench_startup --handles 5000 --solved 1500 --users 200000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def prepare(args):
+    """Runs in its own process: writes the data directory as the bot would."""
+    from bench.bench_load import import_bot
+    from bench.fake_codeforces import make_contests, make_problems
+
+    duelbot = import_bot(args.data_dir)
+    rng = random.Random(args.seed)
+    problems = make_problems(seed=args.seed)
+    contest_years = {c['id']: time.gmtime(c['startTimeSeconds']).tm_year for c in make_contests(problems)}
+    rows = [[p['contestId'], p['index'], p['name'], p.get('rating'), p['tags']] for p in problems]
+    catalog = duelbot.catalog
+    catalog.__dict__.update(catalog._index(rows, contest_years))
+    catalog.etag = '"bench"'
+    catalog.fetched_at = time.time()
+    catalog.save()
+
+    cache = duelbot.solved_cache
+    ids = list(catalog.ids)
+    for h in range(args.handles):
+        cache._entries[f"user{h}"] = [10 ** 9, set(rng.sample(ids, args.solved)), None]
+    cache.save()
+
+    guild_users = args.users // args.guilds
+    duelbot.storage.upsert_users([
+        (str(g), str(g * guild_users + u), f"user{(g * guild_users + u) % args.handles}", rng.randrange(500), 1500)
+        for g in range(args.guilds) for u in range(guild_users)
+    ])
+    problem = {'contestId': 1, 'index': 'A', 'name': 'Problem 0'}
+    for d in range(args.duels):
+        g = d % args.guilds
+        # Players 0 and 1 of guild 0 are kept free for the measured duel
+        first = g * guild_users + 2 + 2 * (d // args.guilds)
+        duelbot.storage.start_duel(str(g), str(first), str(first + 1), problem, 1500, time.time(), '0')
+    duelbot.storage.close()
+
+
+def measure(args):
+    """Runs in a fresh process started at `args.started` (wall-clock time)."""
+    from bench.bench_load import import_bot, start_fake_server
+    from bench.fake_discord import FakeChannel, FakeContext, FakeGateway, FakeGuild, FakeMember
+    from codeforces import RateLimiter
+
+    server = start_fake_server(history=50, latency=0)
+    duelbot = import_bot(args.data_dir)
+    imported = time.time()
+    duelbot.cf.base_url = server.base_url
+    duelbot.cf.limiter = RateLimiter(rate=1000.0, capacity=1000.0)
+
+    async def first_duel():
+        gateway = FakeGateway(duelbot.bot, server, reaction_delay=0)
+        guild = FakeGuild(0, "Guild 0")
+        channel = FakeChannel(gateway)
+        members = []
+        for discord_id in (0, 1):
+            member = FakeMember(gateway, discord_id, f"player{discord_id}", handle=f"user{discord_id}")
+            guild.members[discord_id] = gateway.members[discord_id] = member
+            members.append(member)
+        async with duelbot.bot:
+            await duelbot.challenge(FakeContext(guild, channel, members[0]), members[1], '1500')
+            served = time.time()
+            return served, len(duelbot.duels.duels)
+
+    served, active = asyncio.run(first_duel())
+    print(json.dumps({
+        'phases': duelbot.boot_phases,
+        'imported': imported - args.started,
+        'served': served - args.started,
+        'active': active,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handles', type=int, default=5000, help='handles in the solved-problem cache')
+    parser.add_argument('--solved', type=int, default=1500, help='solved problems per cached handle')
+    parser.add_argument('--users', type=int, default=200000, help='registered users across all guilds')
+    parser.add_argument('--guilds', type=int, default=2000)
+    parser.add_argument('--duels', type=int, default=500, help='duels running at boot')
+    parser.add_argument('--boots', type=int, default=3, help='cold boots measured')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--role', choices=('main', 'prepare', 'measure'), default='main', help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--started', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'prepare':
+        return prepare(args)
+    if args.role == 'measure':
+        return measure(args)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        argv = [sys.executable, '-m', 'bench.bench_startup', '--data-dir', data_dir] + sys.argv[1:]
+        start = time.perf_counter()
+        subprocess.run(argv + ['--role', 'prepare'], check=True)
+        sizes = {name: os.path.getsize(os.path.join(data_dir, name)) for name in sorted(os.listdir(data_dir))}
+        print(f"prepared in {time.perf_counter() - start:.1f}s: " + ", ".join(f"{name} {size / 2 ** 20:.1f}MB" for name, size in sizes.items()))
+        for _ in range(args.boots):
+            started = time.time()
+            output = subprocess.run(argv + ['--role', 'measure', '--started', str(started)], check=True,
+                                    capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in result['phases'])
+            print(f"boot: {phases}")
+            print(f"  bot imported {result['imported']:.2f}s, first duel served {result['served']:.2f}s after process start "
+                  f"({result['active']} duels active)")
+
+
+if __name__ == '__main__':
+    main()
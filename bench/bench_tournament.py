@@ -0,0 +1,174 @@
+# bench/bench_tournament.py
+
+"""Runs a whole Swiss or elimination tournament on a simulated clock.
+
+Every entrant (a player or a team) gets scripted submissions for each round:
+rejected attempts, accepted solutions and unrelated noise, all sitting in
+TESTING for a while, served by the in-memory `user.status` fake from
+bench_judge. At the end of every round the incrementally kept scoreboard is
+checked against ICPC standings recomputed from the script, and the cost of
+an incremental update is compared with re-sorting the whole scoreboard.
+
+    python -m bench.bench_tournament --entrants 48 --format swiss
+    python -m bench.bench_tournament --entrants 16 --team-size 3 --format elimination
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from bench.bench_judge import FakeStatusClient, SimClock
+from storage import Storage
+from tournaments import PENALTY_MINUTES, TournamentManager
+
+
+def icpc_standings(round_, entrants, script):
+    """Recomputes a round's `{entrant: (solved, penalty)}` from scratch."""
+    numbers = {(p['contestId'], p['index']): number for number, p in enumerate(round_['problems'])}
+    cells = {}
+    for when, entrant, number, verdict in sorted(script):
+        accepted, rejected = cells.setdefault((entrant, number), [None, 0])
+        if accepted is not None:
+            continue
+        if verdict == 'OK':
+            cells[(entrant, number)][0] = when
+        else:
+            cells[(entrant, number)][1] += 1
+    standings = {}
+    for entrant in entrants:
+        solved = penalty = 0
+        for number in numbers.values():
+            accepted, rejected = cells.get((entrant, number), (None, 0))
+            if accepted is not None:
+                solved += 1
+                penalty += int(accepted - round_['start']) // 60 + PENALTY_MINUTES * rejected
+        standings[entrant] = (solved, penalty)
+    return standings
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    t0 = time.time()
+    clock = SimClock(t0)
+    client = FakeStatusClient(clock, args.judging_delay)
+    next_id = [1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'))
+        manager = TournamentManager(storage, client, handle_of=lambda guild_id, discord_id: f"h{discord_id}",
+                                    clock=clock, rate=args.rate)
+        scripts = {}  # round number -> [(time, entrant, problem number, verdict)]
+        mismatches = []
+
+        async def pick_problems(tournament, discord_ids):
+            number = len(tournament.history) + 1
+            return [{'contestId': 5000 + number, 'index': chr(ord('A') + i), 'name': f"R{number}{i}", 'rating': 1500}
+                    for i in range(tournament.problem_count)]
+
+        async def on_round_start(tournament):
+            # Script the whole round now; submission ids grow with time, so they are handed out sorted
+            round_ = tournament.round
+            duration = round_['deadline'] - round_['start']
+            subs = []
+            script = scripts[round_['number']] = []
+            for entrant_id in tournament.scoreboard.rows:
+                members = tournament.entrants[entrant_id]['members']
+                skill = rng.random()
+                for number, problem in enumerate(round_['problems']):
+                    for _ in range(rng.randint(0, 2)):
+                        subs.append((round_['start'] + rng.uniform(0, duration), rng.choice(members), problem, 'WRONG_ANSWER', entrant_id, number))
+                    if rng.random() < skill:
+                        subs.append((round_['start'] + rng.uniform(0, duration), rng.choice(members), problem, 'OK', entrant_id, number))
+                for _ in range(rng.randint(0, args.noise)):
+                    subs.append((round_['start'] + rng.uniform(0, duration), rng.choice(members), {'contestId': 1, 'index': 'Z'}, 'OK', None, None))
+            subs.sort(key=lambda sub: sub[0])
+            for when, member, problem, verdict, entrant_id, number in subs:
+                client.submit(f"h{member}", next_id[0], int(when), problem, verdict)
+                next_id[0] += 1
+                if entrant_id is not None:
+                    script.append((int(when), entrant_id, number, verdict))
+
+        manager.pick_problems = pick_problems
+        manager.on_round_start = on_round_start
+
+        tournament = manager.create('1', '0', args.format, 1500, 1500, args.problems, args.minutes)
+        players = iter(range(args.entrants * args.team_size))
+        for i in range(args.entrants):
+            members = [str(next(players)) for _ in range(args.team_size)]
+            entrant_id = members[0] if args.team_size == 1 else f"team:{i}"
+            tournament.add_entrant(entrant_id, f"E{i}", members, rng.uniform(1000, 2000))
+        await manager.start(tournament)
+
+        polls = 0
+        original_poll = manager.poll
+
+        async def counted_poll(tournaments=None):
+            nonlocal polls
+            polls += 1
+            return await original_poll(tournaments)
+
+        manager.poll = counted_poll
+        start = time.perf_counter()
+        board = None
+        while tournament.status != 'finished':
+            if tournament.round is not None:
+                board, round_ = tournament.scoreboard, tournament.round
+            played = len(tournament.history)
+            clock.now += args.step
+            await manager.tick()
+            if len(tournament.history) > played:
+                expected = icpc_standings(round_, list(board.rows), scripts[round_['number']])
+                actual = {entrant: (solved, penalty) for entrant, solved, penalty in board.standings()}
+                if actual != expected:
+                    mismatches.append(round_['number'])
+                ranked = [(-solved, penalty) for _, solved, penalty in board.standings()]
+                if ranked != sorted(ranked):
+                    mismatches.append(round_['number'])
+        elapsed = time.perf_counter() - start
+
+        # Incremental update against re-sorting every row, on the last round's scoreboard;
+        # each accepted submission is earlier than the last, so every one moves the entrant
+        rows = list(board.rows.items())
+        entrant = rows[0][0]
+        iterations = 20000
+        begin = time.perf_counter()
+        for i in range(iterations):
+            board.add(entrant, 0, -1 - i, board.start - i, 'OK')
+        incremental = (time.perf_counter() - begin) / iterations
+        begin = time.perf_counter()
+        for _ in range(iterations // 10):
+            sorted((-row[0], row[1], row[2], e) for e, row in rows)
+        full = (time.perf_counter() - begin) / (iterations // 10)
+        storage.close()
+
+    standings = tournament.standings()
+    print(f"format={args.format} entrants={args.entrants} team size={args.team_size} rounds={len(tournament.history)} "
+          f"simulated={clock.now - t0:.0f}s wall={elapsed:.2f}s")
+    print(f"polls={polls} api calls={client.calls} ({client.calls / max(1, polls):.1f} per poll for "
+          f"{args.entrants * args.team_size} handles)")
+    print(f"scoreboard mismatches={len(mismatches)} winner={tournament.entrants[standings[0]]['name']}")
+    print(f"standings update: {incremental * 1e6:.2f}us incremental vs {full * 1e6:.2f}us full re-sort ({len(rows)} entrants)")
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=('swiss', 'elimination'), default='swiss')
+    parser.add_argument('--entrants', type=int, default=48)
+    parser.add_argument('--team-size', type=int, default=1)
+    parser.add_argument('--problems', type=int, default=4)
+    parser.add_argument('--minutes', type=int, default=45)
+    parser.add_argument('--noise', type=int, default=3, help='max unrelated submissions per entrant and round')
+    parser.add_argument('--judging-delay', type=float, default=10.0, help='seconds a submission stays in TESTING')
+    parser.add_argument('--step', type=float, default=1.0, help='simulated seconds per tick')
+    parser.add_argument('--rate', type=float, default=20.0, help='API calls per second the poller may use')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
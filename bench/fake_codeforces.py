@@ -0,0 +1,178 @@
+# bench/fake_codeforces.py
+
+"""A local stand-in for the Codeforces API used by the benchmarks.
+
+Serves generated `problemset.problems`, `contest.list`, `user.status` and
+`user.info` payloads with configurable latency and a configurable share of
+`Call limit exceeded` answers, so no benchmark ever touches the network.
+Recorded API responses can be served instead; see `load_recording()`.
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import zlib
+from aiohttp import web
+
+TAGS = ['dp', 'greedy', 'math', 'graphs', 'strings', 'implementation', 'data structures', 'constructive algorithms']
+
+
+def make_problems(count=10000, seed=1):
+    """Generates a problemset shaped like the real `problemset.problems` result."""
+    rng = random.Random(seed)
+    problems = []
+    for i in range(count):
+        problem = {
+            'contestId': 1 + i // 6,
+            'index': 'ABCDEF'[i % 6],
+            'name': f"Problem {i}",
+            'type': 'PROGRAMMING',
+            'tags': rng.sample(TAGS, rng.randint(0, 3)),
+        }
+        if rng.random() < 0.9:
+            problem['rating'] = rng.randrange(800, 3600, 100)
+        problems.append(problem)
+    return problems
+
+
+def make_submissions(problems, count, seed, start_id=1, start_time=1_600_000_000, handle='user'):
+    """Generates a `user.status` history for one handle, newest first.
+
+    Submissions carry every field the real API sends, so response sizes and
+    parsing costs are realistic even though the bot reads only a few.
+    """
+    rng = random.Random(seed)
+    submissions = []
+    for i in range(count):
+        problem = rng.choice(problems)
+        verdict = 'OK' if rng.random() < 0.5 else 'WRONG_ANSWER'
+        submissions.append({
+            'id': start_id + i,
+            'contestId': problem['contestId'],
+            'creationTimeSeconds': start_time + i * 60,
+            'relativeTimeSeconds': 2147483647,
+            'problem': dict({key: problem[key] for key in ('contestId', 'index', 'name', 'rating', 'tags') if key in problem}, type='PROGRAMMING'),
+            'author': {
+                'contestId': problem['contestId'],
+                'members': [{'handle': handle}],
+                'participantType': 'PRACTICE',
+                'ghost': False,
+                'startTimeSeconds': start_time,
+            },
+            'programmingLanguage': 'GNU C++20 (64)',
+            'verdict': verdict,
+            'testset': 'TESTS',
+            'passedTestCount': 40 if verdict == 'OK' else i % 40,
+            'timeConsumedMillis': (i * 37) % 2000,
+            'memoryConsumedBytes': (i * 4099) % 268435456,
+        })
+    submissions.reverse()
+    return submissions
+
+
+def make_contests(problems, first_start=1_262_304_000, spacing=86_400 * 3):
+    """Generates a `contest.list` result for the contests in `problems`, later ids starting later."""
+    ids = sorted({problem['contestId'] for problem in problems}, reverse=True)
+    return [{'id': contest_id, 'name': f"Round {contest_id}", 'type': 'CF', 'phase': 'FINISHED', 'frozen': False,
+             'durationSeconds': 7200, 'startTimeSeconds': first_start + contest_id * spacing} for contest_id in ids]
+
+
+def load_recording(directory):
+    """Reads saved API responses: `problemset.problems.json` and `user.status/<handle>.json`.
+
+    Both are the full JSON bodies Codeforces returned (as saved by e.g.
+    `curl https://codeforces.com/api/user.status?handle=tourist`). Returns
+    `(problems, {handle: submissions})`; problems is None if not recorded.
+    """
+    problems = None
+    path = os.path.join(directory, 'problemset.problems.json')
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            problems = json.load(f)['result']['problems']
+    statuses = {}
+    for path in glob.glob(os.path.join(directory, 'user.status', '*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            statuses[os.path.splitext(os.path.basename(path))[0]] = json.load(f)['result']
+    return problems, statuses
+
+
+class FakeCodeforces:
+    """An aiohttp application answering the Codeforces API methods the bot uses.
+
+    Handles without a recorded history in `statuses` get a generated one.
+    """
+
+    def __init__(self, problems=None, history=2000, latency=0.05, limit_error_rate=0.0, seed=1, statuses=None):
+        self.problems = problems if problems is not None else make_problems(seed=seed)
+        self.history = history
+        self.latency = latency
+        self.limit_error_rate = limit_error_rate
+        self.rng = random.Random(seed)
+        self.statuses = dict(statuses or {})
+        self.first_names = {}
+        self.calls = 0
+        self._problems_body = json.dumps({'status': 'OK', 'result': {'problems': self.problems, 'problemStatistics': []}})
+        self._problems_etag = '"' + hashlib.md5(self._problems_body.encode()).hexdigest() + '"'
+        self._contests_body = json.dumps({'status': 'OK', 'result': make_contests(self.problems)})
+        self.app = web.Application()
+        self.app.router.add_get('/api/problemset.problems', self.problemset_problems)
+        self.app.router.add_get('/api/contest.list', self.contest_list)
+        self.app.router.add_get('/api/user.status', self.user_status)
+        self.app.router.add_get('/api/user.info', self.user_info)
+        self._runner = None
+        self.base_url = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/api/"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def submissions_for(self, handle):
+        if handle not in self.statuses:
+            self.statuses[handle] = make_submissions(self.problems, self.history, seed=zlib.crc32(handle.encode()), handle=handle)
+        return self.statuses[handle]
+
+    async def _answer(self, result=None, body=None, headers=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rng.random() < self.limit_error_rate:
+            return web.json_response({'status': 'FAILED', 'comment': 'Call limit exceeded'}, status=503)
+        if body is None:
+            body = json.dumps({'status': 'OK', 'result': result})
+        return web.Response(text=body, content_type='application/json', headers=headers)
+
+    async def problemset_problems(self, request):
+        if request.headers.get('If-None-Match') == self._problems_etag:
+            self.calls += 1
+            return web.Response(status=304)
+        return await self._answer(body=self._problems_body, headers={'ETag': self._problems_etag})
+
+    async def contest_list(self, request):
+        return await self._answer(body=self._contests_body)
+
+    async def user_status(self, request):
+        submissions = self.submissions_for(request.query['handle'])
+        start = int(request.query.get('from', 1)) - 1
+        count = int(request.query.get('count', len(submissions)))
+        return await self._answer(submissions[start:start + count])
+
+    async def user_info(self, request):
+        handles = request.query['handles'].split(';')
+        # Handles starting with "missing" do not exist, like unknown handles on Codeforces
+        for handle in handles:
+            if handle.startswith('missing'):
+                self.calls += 1
+                return web.json_response({'status': 'FAILED', 'comment': f"handles: User with handle {handle} not found"}, status=400)
+        return await self._answer([{'handle': h, 'firstName': self.first_names.get(h, '')} for h in handles])
@@ -0,0 +1,135 @@
+# bench/fake_discord.py
+
+"""Stand-ins for the discord.py objects the bot's commands touch, plus a
+simulated gateway that reacts to the bot's messages.
+
+Commands are called directly with a `FakeContext`. Everything they send is
+recorded, and `FakeGateway` answers the messages that wait for a reaction
+(verification DMs and challenges) by dispatching `reaction_add` events
+through the real `bot.wait_for` machinery, after `reaction_delay` seconds.
+"""
+
+import asyncio
+import itertools
+import re
+
+TOKEN = re.compile(r"\*\*`(\w+)`\*\*")
+MENTION = re.compile(r"<@(\d+)>")
+
+_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.reactions = []
+
+    async def add_reaction(self, emoji):
+        self.reactions.append(emoji)
+
+
+class FakeReaction:
+    def __init__(self, emoji, message):
+        self.emoji = emoji
+        self.message = message
+
+
+class FakeChannel:
+    """A text channel or DM channel that hands every sent message to the gateway."""
+
+    def __init__(self, gateway, channel_id=None):
+        self.id = channel_id or next(_ids)
+        self.gateway = gateway
+        self.sent = 0
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
+        message = FakeMessage(self, content, embed)
+        self.gateway.on_message(message)
+        return message
+
+
+class FakeMember:
+    def __init__(self, gateway, member_id, name, handle=None):
+        self.id = member_id
+        self.display_name = name
+        self.name = name
+        self.mention = f"<@{member_id}>"
+        self.bot = False
+        self.handle = handle  # Codeforces handle this member registers
+        self.dm = FakeChannel(gateway)
+        self.dm.owner = self
+
+    async def send(self, content=None, embed=None):
+        return await self.dm.send(content, embed)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name):
+        self.id = guild_id
+        self.name = name
+        self.members = {}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+class FakeContext:
+    """The parts of `commands.Context` the commands use."""
+
+    def __init__(self, guild, channel, author):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content=None, embed=None):
+        return await self.channel.send(content, embed)
+
+
+class FakeGateway:
+    """Plays the users: confirms verification DMs and accepts challenges.
+
+    `server` is the FakeCodeforces instance whose first names are set to the
+    verification tokens, as a user would on their Codeforces settings page.
+    """
+
+    def __init__(self, bot, server, reaction_delay=0.05):
+        self.bot = bot
+        self.server = server
+        self.reaction_delay = reaction_delay
+        self.members = {}  # member id -> FakeMember
+        self.reactions = 0
+        self._tasks = set()
+
+    def member(self, guild, name, handle=None):
+        member = FakeMember(self, next(_ids), name, handle)
+        guild.members[member.id] = member
+        self.members[member.id] = member
+        return member
+
+    def on_message(self, message):
+        content = message.content or ''
+        owner = getattr(message.channel, 'owner', None)
+        if owner is not None and 'First Name' in content:
+            # A verification DM: set the first name on "Codeforces", then click the reaction
+            match = TOKEN.search(content)
+            if match is not None and owner.handle is not None:
+                self.server.first_names[owner.handle] = match.group(1)
+            self._react(message, owner)
+        elif 'you have been challenged' in content:
+            opponent = self.members.get(int(MENTION.search(content).group(1)))
+            if opponent is not None:
+                self._react(message, opponent)
+
+    def _react(self, message, user):
+        async def react():
+            await asyncio.sleep(self.reaction_delay)
+            self.reactions += 1
+            self.bot.dispatch('reaction_add', FakeReaction('✅', message), user)
+
+        task = asyncio.create_task(react())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,70 @@
+# bench/fake_redis.py
+
+"""An in-process stand-in for the few Redis commands `RedisBackend` uses.
+
+The Lua scripts of backend.py are recognised by their text and run as the
+equivalent Python, so the backend can be exercised without a Redis server:
+
+    backend = RedisBackend(FakeRedis())
+"""
+
+import asyncio
+import math
+import time
+
+from backend import RELEASE_SCRIPT, TAKE_SCRIPT
+
+
+class FakeRedis:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.data = {}  # key -> (value, expires or None)
+        self.calls = 0
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= self.clock():
+            del self.data[key]
+            return None
+        return value
+
+    async def set(self, key, value, nx=False, px=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if nx and self._get(key) is not None:
+            return None
+        self.data[key] = (value, self.clock() + px / 1000 if px else None)
+        return True
+
+    async def get(self, key):
+        self.calls += 1
+        return self._get(key)
+
+    async def delete(self, *keys):
+        self.calls += 1
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def eval(self, script, numkeys, *args):
+        self.calls += 1
+        await asyncio.sleep(0)
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == RELEASE_SCRIPT:
+            if self._get(keys[0]) == argv[0]:
+                del self.data[keys[0]]
+                return 1
+            return 0
+        if script == TAKE_SCRIPT:
+            rate, capacity, now = (float(arg) for arg in argv)
+            tokens, updated = self._get(keys[0]) or (capacity, now)
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = math.ceil((1 - tokens) / rate * 1000)
+            self.data[keys[0]] = ((tokens, now), None)
+            return int(wait)
+        raise NotImplementedError("FakeRedis only knows the scripts in backend.py")
+
+    async def aclose(self):
+        pass
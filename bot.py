@@ -1,20 +1,58 @@
 # bot.py
 
+import time
+BOOT_STARTED = time.perf_counter()  # taken before the heavy imports, for the boot timings on_ready reports
+
 import discord
 from discord.ext import commands, tasks
-import requests
-import json
 import os
 import asyncio
 import random
 import string
-from datetime import datetime, timedelta, UTC
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from codeforces import CodeforcesClient, SharedRateLimiter
+from backend import open_backend, LockTimeout
+from problems import ProblemCatalog, SolvedCache, problem_id
+from storage import Storage, UserCache
+from duels import DuelEngine, Judge, DEADLINE_GRACE, JUDGE_MIN_INTERVAL
+from verification import HandleVerifier, VERIFY_GRACE
+from matchmaking import Matchmaker
+from tournaments import TournamentManager, FORMATS, ROUND_PROBLEMS, ROUND_MINUTES, ROUND_BREAK
+from metrics import Metrics, LoopLagMonitor, serve as serve_metrics
+import ratings
 # --- CONFIGURATION ---
 load_dotenv()
 BOT_TOKEN = os.getenv('DISCORD_TOKEN')
 # The command prefix
 COMMAND_PREFIX = '!'
+# Users shown per leaderboard page
+LEADERBOARD_PAGE_SIZE = 10
+# Most players in one tournament team
+TEAM_SIZE = 3
+# Entrants listed in tournament standings
+STANDINGS_SIZE = 20
+# Sharding: leave SHARD_COUNT unset to let Discord pick the shard count and run them all in
+# this process, or set SHARD_COUNT and this process's SHARD_IDS (e.g. "0,1") to split shards
+# across processes that share the database and SHARED_BACKEND.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+# Where shard processes share locks and the Codeforces rate limit: memory, sqlite, sqlite:<path> or redis://...
+SHARED_BACKEND = os.getenv('SHARED_BACKEND', 'memory')
+# Prometheus metrics are served at http://127.0.0.1:<METRICS_PORT>/metrics; 0 turns the endpoint off
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# --- BOOT TIMINGS ---
+# (phase, seconds) for every step between process start and the first on_ready
+boot_phases = [('imports', time.perf_counter() - BOOT_STARTED)]
+boot_reported = False
+
+@contextmanager
+def boot_phase(name):
+    started = time.perf_counter()
+    yield
+    boot_phases.append((name, time.perf_counter() - started))
 
 # --- BOT SETUP ---
 # Define the intents your bot needs to function
@@ -22,32 +60,132 @@ intents = discord.Intents.default()
 intents.members = True  # Required to see server members
 intents.message_content = True  # Required to read message content
 
+class DuelBot(commands.AutoShardedBot):
+    """Bot subclass that releases shared resources on shutdown."""
+
+    async def close(self):
+        refresh_catalog.cancel()
+        save_caches.cancel()
+        flush_users.cancel()
+        run_matchmaking.cancel()
+        lag_monitor.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        duels.stop_scheduler()
+        judge.stop()
+        tournaments.stop_loop()
+        solved_cache.save()
+        users.flush()
+        await cf.close()
+        storage.close()
+        await backend.close()
+        await super().close()
+
 # Create the bot instance
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, help_command=None)
+bot = DuelBot(command_prefix=COMMAND_PREFIX, intents=intents, help_command=None, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 
-# --- GLOBAL STATE MANAGEMENT ---
-# This dictionary will hold the duel state for each server separately.
-# The key will be the server_id.
-duel_state = {}
+# Command latencies, API timings and the state of every component, for !stats and the metrics endpoint.
+metrics = Metrics()
+lag_monitor = LoopLagMonitor(metrics)
+metrics_runner = None
+
+def owns_guild(guild_id):
+    """Whether a guild is served by one of this process's shards."""
+    if SHARD_COUNT is None or SHARD_IDS is None:
+        return True
+    return (int(guild_id) >> 22) % SHARD_COUNT in SHARD_IDS
 
 # --- DATA PERSISTENCE ---
-# Functions to load and save user data from the users.json file
+# Users and duels live in a SQLite database; users.json is only read once to migrate it.
 DATA_DIR = os.getenv('RAILWAY_VOLUME_MOUNT_PATH', './') 
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
-def load_users():
-    """Loads user data from users.json."""
-    if not os.path.exists(USERS_FILE):
-        return {}
-    try:
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+DATABASE_FILE = os.path.join(DATA_DIR, 'duelbot.db')
+# Binary snapshots of the problem catalog and solved-problem cache; the JSON files are what older versions wrote
+PROBLEMS_FILE = os.path.join(DATA_DIR, 'problems.bin')
+SOLVED_FILE = os.path.join(DATA_DIR, 'solved.bin')
+LEGACY_PROBLEMS_FILE = os.path.join(DATA_DIR, 'problems.json')
+LEGACY_SOLVED_FILE = os.path.join(DATA_DIR, 'solved.json')
+
+# Locks and rate limits shared with the other shard processes.
+with boot_phase('backend'):
+    backend = open_backend(SHARED_BACKEND, DATA_DIR)
+# A single Codeforces client shared by every command and guild, and by all shard processes through the backend.
+cf = CodeforcesClient(limiter=SharedRateLimiter(backend))
+# Handle lookups and verification checks from all servers are batched into shared user.info calls.
+verifier = HandleVerifier(cf)
+
+# The problemset is cached on disk and indexed by rating for fast duel setup.
+catalog = ProblemCatalog(cf, PROBLEMS_FILE)
+with boot_phase('catalog'):
+    catalog.load(LEGACY_PROBLEMS_FILE)
+# Solved problems per handle, refreshed incrementally from user.status.
+solved_cache = SolvedCache(cf, SOLVED_FILE)
+with boot_phase('solved cache'):
+    solved_cache.load(LEGACY_SOLVED_FILE)
+with boot_phase('database'):
+    storage = Storage(DATABASE_FILE)
+    migrated = storage.migrate_json(USERS_FILE)
+if migrated:
+    print(f"Migrated {migrated} users from {USERS_FILE}")
+# Commands read and change users in memory; flush_users writes the changes behind them.
+# A guild is only served by one shard, so each process caches the users of its own guilds.
+users = UserCache(storage)
 
-def save_users(users_data):
-    """Saves user data to users.json."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users_data, f, indent=4)
+# --- GLOBAL STATE MANAGEMENT ---
+# Every challenge and duel across all servers, indexed by duel id and by participant.
+# Duels still running when the bot stopped are restored from the database, for this process's guilds only.
+duels = DuelEngine(storage, backend=backend)
+with boot_phase('duels'):
+    duels.restore(owns_guild)
+
+@metrics.collector
+def collect_metrics():
+    """Reads the counters the components keep themselves; only runs when metrics are rendered."""
+    yield 'duels_active', 'gauge', (), len(duels.duels)
+    yield 'challenges_pending', 'gauge', (), sum(1 for duel in duels.by_player.values() if duel['duel_id'] is None) // 2
+    yield 'matchmaking_queued', 'gauge', (), len(matchmaker)
+    yield 'tournaments_active', 'gauge', (), len(tournaments.tournaments)
+    yield 'verifications_pending', 'gauge', (), verifier.pending
+    user_stats = users.stats()
+    yield 'users_cached_guilds', 'gauge', (), user_stats['cached_guilds']
+    yield 'users_dirty', 'gauge', (), user_stats['dirty_entries']
+    yield 'users_flushes_total', 'counter', (), user_stats['flushes']
+    yield 'users_rows_flushed_total', 'counter', (), user_stats['rows_flushed']
+    yield 'users_flush_last_ms', 'gauge', (), user_stats['last_flush_ms']
+    yield 'users_flush_max_ms', 'gauge', (), user_stats['max_flush_ms']
+    yield 'catalog_problems', 'gauge', (), len(catalog)
+    yield 'solved_cache_handles', 'gauge', (), len(solved_cache)
+    for phase, seconds in boot_phases:
+        yield 'boot_phase_seconds', 'gauge', (('phase', phase),), seconds
+    for cache, hits, misses in cache_counts():
+        yield 'cache_requests_total', 'counter', (('cache', cache), ('result', 'hit')), hits
+        yield 'cache_requests_total', 'counter', (('cache', cache), ('result', 'miss')), misses
+    for (method, outcome), count in cf.requests.items():
+        yield 'codeforces_requests_total', 'counter', (('method', method), ('outcome', outcome)), count
+    for method, count in cf.retried.items():
+        yield 'codeforces_retries_total', 'counter', (('method', method),), count
+    for method, histogram in cf.latency.items():
+        yield 'codeforces_request_seconds', 'histogram', (('method', method),), histogram
+
+def cache_counts():
+    """Returns `(cache, hits, misses)` for every cache."""
+    return [
+        ('users', users.hits, users.misses),
+        ('solved', solved_cache.hits, solved_cache.misses),
+        ('names', name_cache_hits, name_cache_misses),
+    ]
+
+def handle_of(server_id, discord_id):
+    return users.get_user(server_id, discord_id)['codeforces_handle']
+
+# Polls the submissions of every active duel and declares winners without !solved.
+judge = Judge(duels, cf, handle_of)
+# Players waiting in !queue, paired by Elo and shared unsolved problems.
+matchmaker = Matchmaker(catalog)
+# Server tournaments; one poller fetches the submissions of every running round together.
+tournaments = TournamentManager(storage, cf, handle_of)
+with boot_phase('tournaments'):
+    tournaments.restore(owns_guild)
 
 def calculate_points(rating):
     """Calculates points awarded based on problem rating.
@@ -59,6 +197,52 @@ def calculate_points(rating):
     bonus_points = (rating - 800) // 100
     return base_points + bonus_points
 
+def parse_rating_range(text):
+    """Parses "1400-1700" or "1500" into `(low, high)`, or returns None if it is not a valid range."""
+    low, _, high = text.partition('-')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        return None
+    if not (800 <= low <= high <= 3500 and low % 100 == 0 and high % 100 == 0):
+        return None
+    return low, high
+
+def parse_problem_filters(filters):
+    """Parses `tags:dp,graphs` and `after:2020` into `(tags, after_year)`; raises ValueError on anything else.
+
+    Tags with spaces are written with underscores, e.g. `tags:data_structures`.
+    """
+    tags, after_year = [], None
+    for text in filters:
+        key, _, value = text.partition(':')
+        key = key.lower()
+        if key == 'tags' and value:
+            tags.extend(tag.replace('_', ' ').strip().lower() for tag in value.split(',') if tag.strip())
+        elif key == 'after' and value.isdigit():
+            after_year = int(value)
+        else:
+            raise ValueError(text)
+    return tags, after_year
+
+def update_elo(duel, winner_id):
+    """Updates both duelists' Elo ratings after a duel and returns `{discord_id: change}`."""
+    server_id = duel['guild_id']
+    challenger_id, opponent_id = duel['challenger_id'], duel['opponent_id']
+    old_challenger = users.get_user(server_id, challenger_id)['elo']
+    old_opponent = users.get_user(server_id, opponent_id)['elo']
+    new_challenger, new_opponent = ratings.update(old_challenger, old_opponent, ratings.duel_score(winner_id, challenger_id))
+    users.set_elo(server_id, challenger_id, new_challenger)
+    users.set_elo(server_id, opponent_id, new_opponent)
+    return {challenger_id: new_challenger - old_challenger, opponent_id: new_opponent - old_opponent}
+
+def flush_duelists(duel):
+    """Writes both duelists' rows right away, so they are saved together with the settled duel."""
+    try:
+        users.flush([(duel['guild_id'], duel['challenger_id']), (duel['guild_id'], duel['opponent_id'])])
+    except Exception as e:
+        print(f"Flushing duel {duel['duel_id']} results failed, left for the next flush: {e}")
+
 # --- BOT EVENTS ---
 @bot.event
 async def on_ready():
@@ -66,7 +250,73 @@ async def on_ready():
     print(f'Logged in as {bot.user.name}')
     print(f'Bot ID: {bot.user.id}')
     print('Bot is ready and online.')
+    global boot_reported
+    if not boot_reported:
+        boot_reported = True
+        # Whatever the listed phases do not cover is mostly connecting to Discord
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in boot_phases)
+        print(f"Boot: {phases}; ready {time.perf_counter() - BOOT_STARTED:.2f}s after start")
     print('------')
+    if not refresh_catalog.is_running():
+        refresh_catalog.start()
+    if not save_caches.is_running():
+        save_caches.start()
+    if not flush_users.is_running():
+        flush_users.start()
+    if not run_matchmaking.is_running():
+        run_matchmaking.start()
+    duels.start_scheduler()
+    judge.start()
+    tournaments.start_loop()
+    lag_monitor.start()
+    global metrics_runner
+    if METRICS_PORT and metrics_runner is None:
+        try:
+            metrics_runner = await serve_metrics(metrics, METRICS_HOST, METRICS_PORT)
+            print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"Could not serve metrics on port {METRICS_PORT}: {e}")
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    """Adds every command's run time to a per-command latency histogram."""
+    outcome = 'error' if ctx.command_failed else 'ok'
+    metrics.histogram('command_latency_seconds', (('command', ctx.command.qualified_name), ('outcome', outcome))).observe(time.perf_counter() - ctx.started_at)
+
+# --- BACKGROUND TASKS ---
+@tasks.loop(hours=1)
+async def refresh_catalog():
+    """Keeps the cached problemset fresh without making duels wait for it."""
+    try:
+        await catalog.refresh()
+    except Exception as e:
+        print(f"Problemset refresh failed: {e}")
+
+@tasks.loop(seconds=10)
+async def flush_users():
+    """Writes user changes made since the last flush in one transaction."""
+    try:
+        users.flush()
+    except Exception as e:
+        print(f"User flush failed ({users.dirty_count} dirty entries): {e}")
+
+@tasks.loop(seconds=5)
+async def run_matchmaking():
+    """Pairs queued players and starts their duels."""
+    pairs = matchmaker.match()
+    results = await asyncio.gather(*(start_matched_duel(*pair) for pair in pairs), return_exceptions=True)
+    for (guild_id, a, b, _), result in zip(pairs, results):
+        if isinstance(result, Exception):
+            print(f"Starting the matched duel of {a['discord_id']} and {b['discord_id']} in guild {guild_id} failed: {result!r}")
+
+@tasks.loop(minutes=5)
+async def save_caches():
+    """Persists the solved-problem cache if it changed."""
+    await solved_cache.flush()
 
 # --- HELP, USER REGISTRATION & PROFILE ---
 @bot.command(name='help', help='Shows this help message.')
@@ -89,13 +339,33 @@ async def help(ctx):
         inline=False
     )
     embed.add_field(
-        name="`!challenge @user <rating>`",
-        value="Challenge another user to a duel. Higher ratings award more points.",
+        name="`!challenge @user <rating or range> [tags:dp,graphs] [after:<year>]`",
+        value="Challenge another user to a duel, e.g. `!challenge @user 1400-1700 tags:dp after:2020`. Write tags with spaces using underscores (`tags:data_structures`). Problems either of you solved or met in an earlier duel against each other are skipped. Higher ratings award more points.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!queue <rating or range>`",
+        value="Wait for an opponent near your Elo, e.g. `!queue 1400-1700`. The duel starts automatically when you are matched.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!leavequeue`",
+        value="Stop waiting for a matchmaking opponent.",
         inline=False
     )
     embed.add_field(
         name="`!solved`",
-        value="Use this during a duel to claim victory and earn points based on the problem's rating.",
+        value="Winners are detected automatically; use this during a duel to check your submissions right away.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!tournament`",
+        value=f"Live standings of the server tournament. Join with `!tournament join`, or as a team of up to {TEAM_SIZE} with `!tournament team <name> @teammates`; `!tournament leave` before it starts. Rounds are scored ICPC-style: most problems solved, then least penalty.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!tournament create <swiss|elimination> <rating or range> [problems] [minutes] [rounds]`",
+        value="Admins only: open a Swiss or single-elimination tournament in this channel, then `!tournament start` it or `!tournament cancel` it. A two-team elimination tournament is a team duel.",
         inline=False
     )
     embed.add_field(
@@ -104,8 +374,23 @@ async def help(ctx):
         inline=False
     )
     embed.add_field(
-        name="`!leaderboard`",
-        value="See this server's top-ranked duelists.",
+        name="`!leaderboard [page]`",
+        value="See this server's top-ranked duelists, 10 per page.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!rank [@user]`",
+        value="See your own or another user's position on the leaderboard.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!recomputeratings`",
+        value="Admins only: rebuild this server's Elo ratings from its full duel history.",
+        inline=False
+    )
+    embed.add_field(
+        name="`!stats`",
+        value="Admins only: command latencies, Codeforces API health, cache hit ratios and other bot metrics.",
         inline=False
     )
     embed.add_field(
@@ -121,22 +406,16 @@ async def help(ctx):
 async def register(ctx, codeforces_handle: str):
     """Registers a user by verifying their Codeforces account for the current server."""
     codeforces_handle = codeforces_handle.replace('\\_', '_')
-    all_data = load_users()
     server_id = str(ctx.guild.id)
     discord_id = str(ctx.author.id)
 
-    # Get or create the dictionary for this specific server
-    server_users = all_data.get(server_id, {})
-
-    if discord_id in server_users:
+    if users.get_user(server_id, discord_id) is not None:
         await ctx.send("You are already registered on this server!")
         return
 
     # Check if the Codeforces handle is valid by calling the API
     try:
-        response = requests.get(f"https://codeforces.com/api/user.info?handles={codeforces_handle}")
-        data = response.json()
-        if data['status'] != 'OK':
+        if await verifier.lookup(codeforces_handle) is None:
             await ctx.send(f"Could not find a Codeforces user with the handle `{codeforces_handle}`.")
             return
     except Exception as e:
@@ -170,17 +449,14 @@ async def register(ctx, codeforces_handle: str):
         await bot.wait_for('reaction_add', timeout=300.0, check=check)
 
         # Acknowledge reaction and wait for API to update
-        await ctx.author.send("✅ Got it! Checking for the update on Codeforces in 30 seconds...")
-        await asyncio.sleep(30)
-
-        # After the delay, verify the change on Codeforces
-        response = requests.get(f"https://codeforces.com/api/user.info?handles={codeforces_handle}")
-        data = response.json()
-        if data['status'] == 'OK' and data['result'][0].get('firstName') == token:
-            # Add user to the server-specific dictionary
-            server_users[discord_id] = {"codeforces_handle": codeforces_handle, "points": 0}
-            all_data[server_id] = server_users
-            save_users(all_data)
+        await ctx.author.send(f"✅ Got it! I'll keep checking Codeforces for the update for up to {VERIFY_GRACE // 60} minutes...")
+
+        # Checks are batched with other pending verifications and retried until the grace window ends
+        if await verifier.verify(codeforces_handle, token):
+            # Only the new row is written, so nothing changed meanwhile is lost
+            if not users.add_user(server_id, discord_id, codeforces_handle):
+                await ctx.author.send("You are already registered on this server!")
+                return
             await ctx.author.send(
                 f"✅ Verification successful! You are now registered as `{codeforces_handle}` on **{ctx.guild.name}**.\n"
                 f"You can now change your name back on Codeforces."
@@ -195,34 +471,30 @@ async def register(ctx, codeforces_handle: str):
 async def updatehandle(ctx, new_codeforces_handle: str):
     """Updates an existing user's Codeforces handle after re-verification for the current server."""
     new_codeforces_handle = new_codeforces_handle.replace('\\_', '_')
-    all_data = load_users()
     server_id = str(ctx.guild.id)
     discord_id = str(ctx.author.id)
-    server_users = all_data.get(server_id, {})
+    user_data = users.get_user(server_id, discord_id)
 
-    if discord_id not in server_users:
+    if user_data is None:
         await ctx.send("You are not registered on this server. Please use `!register` to create an account.")
         return
 
-    # MODIFIED: Check the duel state for this specific server
-    if duel_state.get(server_id, {}).get("active", False):
-        await ctx.send("You cannot change your handle while a duel or challenge is in progress on this server.")
+    if duels.player_duel(server_id, discord_id) is not None:
+        await ctx.send("You cannot change your handle while you are in a duel or challenge on this server.")
         return
 
-    for user_id, data in server_users.items():
-        if data['codeforces_handle'].lower() == new_codeforces_handle.lower() and user_id != discord_id:
-            await ctx.send(f"The handle `{new_codeforces_handle}` is already registered by another user on this server.")
-            return
+    owner_id = users.handle_owner(server_id, new_codeforces_handle)
+    if owner_id is not None and owner_id != discord_id:
+        await ctx.send(f"The handle `{new_codeforces_handle}` is already registered by another user on this server.")
+        return
 
-    if server_users[discord_id]['codeforces_handle'].lower() == new_codeforces_handle.lower():
+    if user_data['codeforces_handle'].lower() == new_codeforces_handle.lower():
         await ctx.send("This is already your registered handle.")
         return
 
     # --- Re-verification Process (same as before) ---
     try:
-        response = requests.get(f"https://codeforces.com/api/user.info?handles={new_codeforces_handle}")
-        data = response.json()
-        if data['status'] != 'OK':
+        if await verifier.lookup(new_codeforces_handle) is None:
             await ctx.send(f"Could not find a Codeforces user with the handle `{new_codeforces_handle}`.")
             return
     except Exception as e:
@@ -253,16 +525,10 @@ async def updatehandle(ctx, new_codeforces_handle: str):
         await bot.wait_for('reaction_add', timeout=300.0, check=check)
 
         # Acknowledge reaction and wait for API to update
-        await ctx.author.send("✅ Got it! Checking for the update on Codeforces in 30 seconds to allow for API caching...")
-        await asyncio.sleep(30)
-
-        response = requests.get(f"https://codeforces.com/api/user.info?handles={new_codeforces_handle}")
-        data = response.json()
+        await ctx.author.send(f"✅ Got it! I'll keep checking Codeforces for the update for up to {VERIFY_GRACE // 60} minutes...")
 
-        if data['status'] == 'OK' and data['result'][0].get('firstName') == token:
-            server_users[discord_id]['codeforces_handle'] = new_codeforces_handle
-            all_data[server_id] = server_users
-            save_users(all_data)
+        if await verifier.verify(new_codeforces_handle, token):
+            users.set_handle(server_id, discord_id, new_codeforces_handle)
             await ctx.author.send(
                 f"✅ Verification successful! Your Codeforces handle has been updated to `{new_codeforces_handle}` on **{ctx.guild.name}**.\n"
                 f"You can now change your name back on Codeforces."
@@ -277,63 +543,146 @@ async def updatehandle(ctx, new_codeforces_handle: str):
 async def profile(ctx, member: discord.Member = None):
     """Displays the profile of the mentioned user or the command author for the current server."""
     target_user = member or ctx.author
-    all_data = load_users()
     server_id = str(ctx.guild.id)
     discord_id = str(target_user.id)
-    server_users = all_data.get(server_id, {})
+    user_data = users.get_user(server_id, discord_id)
 
-    if discord_id not in server_users:
+    if user_data is None:
         await ctx.send(f"{target_user.display_name} is not registered on this server.")
         return
 
-    user_data = server_users[discord_id]
     embed = discord.Embed(
         title=f"{target_user.display_name}'s Profile on {ctx.guild.name}",
         color=discord.Color.blue()
     )
     embed.add_field(name="Codeforces Handle", value=f"[{user_data['codeforces_handle']}](https://codeforces.com/profile/{user_data['codeforces_handle']})", inline=False)
-    embed.add_field(name="Points", value=user_data['points'], inline=False)
+    embed.add_field(name="Points", value=user_data['points'], inline=True)
+    embed.add_field(name="Elo", value=f"{user_data['elo']:.0f}", inline=True)
+
+    stats = storage.get_stats(server_id, discord_id)
+    embed.add_field(name="Record (W/L/D)", value=f"{stats['wins']} / {stats['losses']} / {stats['draws']}", inline=True)
+    if stats['average_solve_seconds'] is not None:
+        minutes, seconds = divmod(int(stats['average_solve_seconds']), 60)
+        embed.add_field(name="Average Solve Time", value=f"{minutes}m {seconds:02d}s", inline=True)
+    if stats['by_rating']:
+        by_rating = "\n".join(f"**{rating}**: {w}W {l}L {d}D" for rating, (w, l, d) in stats['by_rating'].items())
+        embed.add_field(name="By Rating", value=by_rating, inline=False)
+    recent = storage.recent_duels(server_id, discord_id, limit=3)
+    if recent:
+        lines = []
+        for duel in recent:
+            other_id = duel['opponent_id'] if duel['challenger_id'] == discord_id else duel['challenger_id']
+            result = 'D' if duel['winner_id'] is None else ('W' if duel['winner_id'] == discord_id else 'L')
+            lines.append(f"**{result}** vs <@{other_id}> ({duel['rating']}, <t:{int(duel['end_time'])}:R>)")
+        embed.add_field(name="Recent Duels", value="\n".join(lines), inline=False)
+    if target_user != ctx.author:
+        w, l, d = storage.head_to_head(server_id, str(ctx.author.id), discord_id)
+        embed.add_field(name=f"Your Record vs {target_user.display_name}", value=f"{w}W {l}L {d}D", inline=False)
     await ctx.send(embed=embed)
 
-@bot.command(name='leaderboard', help='Shows the server leaderboard.')
-async def leaderboard(ctx):
-    """Displays the top 10 users by points for the current server."""
-    all_data = load_users()
+# Display names of users who are not in the member cache, as {discord_id: (name, expires_at)}
+NAME_CACHE_TTL = 3600
+name_cache = {}
+name_cache_hits = 0
+name_cache_misses = 0
+
+async def resolve_names(guild, discord_ids):
+    """Returns display names for `discord_ids`, using the member cache first.
+
+    Users missing from both the member cache and the name cache are fetched
+    concurrently instead of one REST call after another.
+    """
+    global name_cache_hits, name_cache_misses
+    names = {}
+    missing = []
+    now = time.monotonic()
+    for discord_id in discord_ids:
+        member = guild.get_member(int(discord_id))
+        cached = name_cache.get(discord_id)
+        if member is not None:
+            names[discord_id] = member.display_name
+        elif cached is not None and cached[1] > now:
+            names[discord_id] = cached[0]
+            name_cache_hits += 1
+        else:
+            missing.append(discord_id)
+    name_cache_misses += len(missing)
+
+    results = await asyncio.gather(*(bot.fetch_user(int(discord_id)) for discord_id in missing), return_exceptions=True)
+    if missing:
+        for discord_id in [discord_id for discord_id, (_, expires_at) in name_cache.items() if expires_at <= now]:
+            del name_cache[discord_id]
+    for discord_id, user in zip(missing, results):
+        if isinstance(user, discord.NotFound):
+            name = "Unknown User"
+        elif isinstance(user, Exception):
+            # Rate limits and server errors are only shown, not cached, so the name is fetched again next time
+            names[discord_id] = "Unknown User"
+            continue
+        else:
+            name = user.display_name
+        name_cache[discord_id] = (name, now + NAME_CACHE_TTL)
+        names[discord_id] = name
+    return names
+
+@bot.command(name='leaderboard', help='Shows the server leaderboard. Usage: !leaderboard [page]')
+async def leaderboard(ctx, page: int = 1):
+    """Displays a page of 10 users by points for the current server."""
     server_id = str(ctx.guild.id)
-    server_users = all_data.get(server_id, {})
+    server_users = users.get_guild_users(server_id)
 
     if not server_users:
         await ctx.send("No users are registered on this server yet.")
         return
 
-    sorted_users = sorted(server_users.items(), key=lambda item: item[1]['points'], reverse=True)
+    ranks = users.ranking(server_id)
+    page_count = (len(ranks) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+    if not 1 <= page <= page_count:
+        await ctx.send(f"Please choose a page between 1 and {page_count}.")
+        return
+
+    start = (page - 1) * LEADERBOARD_PAGE_SIZE
+    entries = ranks.page(start, LEADERBOARD_PAGE_SIZE)
+    names = await resolve_names(ctx.guild, [discord_id for discord_id, _ in entries])
     embed = discord.Embed(title=f"Leaderboard for {ctx.guild.name}", color=discord.Color.gold())
     description = ""
-    for i, (discord_id, data) in enumerate(sorted_users[:10]):
-        try:
-            user = await bot.fetch_user(int(discord_id))
-            description += f"**{i+1}. {user.display_name}** - {data['points']} points ({data['codeforces_handle']})\n"
-        except discord.NotFound:
-            description += f"**{i+1}. Unknown User** - {data['points']} points ({data['codeforces_handle']})\n"
+    for i, (discord_id, points) in enumerate(entries, start=start):
+        description += f"**{i+1}. {names[discord_id]}** - {points} points ({server_users[discord_id]['codeforces_handle']})\n"
     embed.description = description
+    embed.set_footer(text=f"Page {page}/{page_count}")
     await ctx.send(embed=embed)
 
+@bot.command(name='rank', help='Shows your or another user\'s rank on the server leaderboard.')
+async def rank(ctx, member: discord.Member = None):
+    """Displays the leaderboard position of the mentioned user or the command author."""
+    target_user = member or ctx.author
+    server_id = str(ctx.guild.id)
+    discord_id = str(target_user.id)
+    user_data = users.get_user(server_id, discord_id)
+
+    if user_data is None:
+        await ctx.send(f"{target_user.display_name} is not registered on this server.")
+        return
+
+    ranks = users.ranking(server_id)
+    position = ranks.rank(discord_id, user_data['points'])
+    await ctx.send(f"**{target_user.display_name}** is ranked **#{position}** of {len(ranks)} on **{ctx.guild.name}** with **{user_data['points']}** points.")
+
 # --- DUELING SYSTEM COMMANDS ---
-@bot.command(name='challenge', help='Challenge another user to a duel. Usage: !challenge @<User> <Rating>')
-async def challenge(ctx, opponent: discord.Member, rating: int):
-    """Initiates a duel challenge against another user on the same server."""
-    global duel_state
-    all_data = load_users()
+@bot.command(name='challenge', help='Challenge another user to a duel. Usage: !challenge @<User> <Rating or Low-High> [tags:dp,graphs] [after:<Year>]')
+async def challenge(ctx, opponent: discord.Member, rating_range: str, *filters: str):
+    """Initiates a duel challenge against another user on the same server.
+
+    The problem is picked from the rating range, optionally limited to
+    problems with all of the given tags or from contests after a year.
+    """
     server_id = str(ctx.guild.id)
     challenger_id = str(ctx.author.id)
     opponent_id = str(opponent.id)
-    server_users = all_data.get(server_id, {})
-
-    if duel_state.get(server_id, {}).get("active", False):
-        await ctx.send("A challenge or duel is already in progress on this server. Please wait.")
-        return
+    challenger_data = users.get_user(server_id, challenger_id)
+    opponent_data = users.get_user(server_id, opponent_id)
 
-    if challenger_id not in server_users or opponent_id not in server_users:
+    if challenger_data is None or opponent_data is None:
         await ctx.send("Both you and your opponent must be registered on this server to duel.")
         return
     if ctx.author == opponent:
@@ -342,155 +691,558 @@ async def challenge(ctx, opponent: discord.Member, rating: int):
     if opponent.bot:
         await ctx.send("You cannot challenge a bot.")
         return
-    if not (800 <= rating <= 3500 and rating % 100 == 0):
-        await ctx.send("Please choose a valid rating (800-3500, in increments of 100).")
+    bounds = parse_rating_range(rating_range)
+    if bounds is None:
+        await ctx.send("Please choose a valid rating or range (800-3500, in increments of 100), e.g. `1500` or `1400-1700`.")
+        return
+    low, high = bounds
+    try:
+        tags, after_year = parse_problem_filters(filters)
+    except ValueError as e:
+        await ctx.send(f"Unknown filter `{e}`. Use `tags:dp,graphs` (underscores for spaces) and/or `after:<Year>`.")
+        return
+    unknown = [tag for tag in tags if catalog.ids and tag not in catalog.tag_bits]
+    if unknown:
+        await ctx.send(f"Unknown tag(s): {', '.join(unknown)}.")
         return
 
-    # MODIFIED: Store the rating in the server's duel state
-    duel_state[server_id] = {
-        "active": True,
-        "challenger": ctx.author,
-        "opponent": opponent,
-        "rating": rating,  # Store the rating for later
-        "problem": None,
-        "problem_url": None,
-        "start_time": None
-    }
+    description = f"rating **{low}**" if low == high else f"rating **{low}-{high}**"
+    if tags:
+        description += f", tags **{', '.join(tags)}**"
+    if after_year is not None:
+        description += f", contests after **{after_year}**"
 
-    challenge_message = await ctx.send(
-        f"⚔️ {opponent.mention}, you have been challenged by {ctx.author.mention} to a duel at rating **{rating}**!\n"
-        f"React with ✅ to accept or ❌ to decline within 5 minutes."
-    )
-    await challenge_message.add_reaction('✅')
-    await challenge_message.add_reaction('❌')
+    # Each player can only be part of one challenge or duel at a time; the rating is set once a problem is picked
+    duel = duels.reserve(server_id, str(ctx.channel.id), challenger_id, opponent_id, low)
+    if duel is None:
+        await ctx.send("You or your opponent already have a challenge or duel in progress. Please wait.")
+        return
+    matchmaker.leave(server_id, challenger_id)
+    matchmaker.leave(server_id, opponent_id)
 
     def check(reaction, user):
         return user == opponent and str(reaction.emoji) in ['✅', '❌'] and reaction.message.id == challenge_message.id
 
     try:
+        challenge_message = await ctx.send(
+            f"⚔️ {opponent.mention}, you have been challenged by {ctx.author.mention} to a duel at {description}!\n"
+            f"React with ✅ to accept or ❌ to decline within 5 minutes."
+        )
+        await challenge_message.add_reaction('✅')
+        await challenge_message.add_reaction('❌')
+
         reaction, user = await bot.wait_for('reaction_add', timeout=300.0, check=check)
         if str(reaction.emoji) == '❌':
             await ctx.send(f"{opponent.mention} has declined the challenge.")
-            del duel_state[server_id]
+            duels.release(duel)
             return
 
         await ctx.send(f"{opponent.mention} has accepted! Finding a suitable problem...")
-        challenger_handle = server_users[challenger_id]['codeforces_handle']
-        opponent_handle = server_users[opponent_id]['codeforces_handle']
 
         try:
-            async def get_cf_api(url):
-                response = requests.get(url)
-                response.raise_for_status()
-                data = response.json()
-                if data.get('status') != 'OK':
-                    raise Exception(f"Codeforces API Error: {data.get('comment', 'No comment provided')}")
-                return data
-
-            ch_data = await get_cf_api(f"https://codeforces.com/api/user.status?handle={challenger_handle}")
-            op_data = await get_cf_api(f"https://codeforces.com/api/user.status?handle={opponent_handle}")
-            problems_data = await get_cf_api("https://codeforces.com/api/problemset.problems")
-
-            ch_solved = {f"{p['problem']['contestId']}{p['problem']['index']}" for p in ch_data['result'] if p.get('verdict') == 'OK' and 'contestId' in p.get('problem', {})}
-            op_solved = {f"{p['problem']['contestId']}{p['problem']['index']}" for p in op_data['result'] if p.get('verdict') == 'OK' and 'contestId' in p.get('problem', {})}
-            potential_problems = [p for p in problems_data['result']['problems'] if p.get('rating') == rating and 'contestId' in p and 'index' in p and f"{p.get('contestId')}{p.get('index')}" not in ch_solved and f"{p.get('contestId')}{p.get('index')}" not in op_solved]
-
+            problem = await pick_problem(duel, challenger_data, opponent_data, low, high, tags, after_year)
         except Exception as e:
             await ctx.send(f"An error occurred while fetching data from Codeforces. The duel is cancelled. Please try again later.\n`Error: {e}`")
-            del duel_state[server_id]
+            duels.release(duel)
             return
 
-        if not potential_problems:
-            await ctx.send(f"Could not find a suitable unsolved problem at rating {rating}. The challenge has been cancelled.")
-            del duel_state[server_id]
+        if problem is None:
+            await ctx.send(f"Could not find a problem at {description} that neither of you has solved or met in an earlier duel. The challenge has been cancelled.")
+            duels.release(duel)
             return
 
-        problem = random.choice(potential_problems)
-        problem_url = f"https://codeforces.com/problemset/problem/{problem['contestId']}/{problem['index']}"
-        
-        duel_state[server_id].update({"problem": problem, "problem_url": problem_url, "start_time": datetime.now(UTC)})
-        
-        await ctx.send(
-            f"**Duel Start!**\n"
-            f"**Problem:** {problem['name']} (Rating: {rating})\n"
-            f"**Link:** {problem_url}\n\n"
-            f"{duel_state[server_id]['challenger'].mention} vs {duel_state[server_id]['opponent'].mention}: The first to solve it in **15 minutes** wins points based on rating! Type `!solved` when you have an accepted solution."
-        )
-        bot.loop.create_task(duel_timeout_task(ctx, duel_state[server_id]['start_time'], server_id))
+        duel['rating'] = problem['rating']
+        try:
+            async with duels.guild_lock(server_id):
+                started = duels.start(duel, problem)
+        except LockTimeout:
+            duels.release(duel)
+            started = None
+        if started is None:
+            await ctx.send("The duel could not be started because another one is being set up for you or your opponent. Please try again.")
+            return
+        await ctx.send(duel_start_message(duel, problem))
     except asyncio.TimeoutError:
         await ctx.send(f"The duel challenge for {opponent.mention} expired.")
-        del duel_state[server_id]
+        duels.release(duel)
+    except Exception:
+        # e.g. Forbidden from Discord; a challenge that never started must not keep both players busy
+        if duel['duel_id'] is None:
+            duels.release(duel)
+        raise
+
+async def pick_problem(duel, first, second, low, high, tags=(), after_year=None, prefer=None):
+    """Picks a problem rated `low` to `high` that matches the filters, neither user has solved
+    and the pair has not met in an earlier duel, trying the `prefer` rating first. Returns None if none is left.
+    """
+    await catalog.ensure_loaded()
+    await asyncio.gather(solved_cache.solved(first['codeforces_handle']), solved_cache.solved(second['codeforces_handle']))
+    played = storage.pair_problems(duel['guild_id'], duel['challenger_id'], duel['opponent_id'])
+    exclude = (solved_cache.bits(first['codeforces_handle'], catalog) | solved_cache.bits(second['codeforces_handle'], catalog)
+               | catalog.mask(problem_id(contest_id, index) for contest_id, index in played if contest_id is not None))
+    if prefer is not None:
+        problem = catalog.pick_matching(prefer, prefer, tags, after_year, exclude)
+        if problem is not None:
+            return problem
+    return catalog.pick_matching(low, high, tags, after_year, exclude)
+
+def duel_start_message(duel, problem):
+    return (
+        f"**Duel Start!**\n"
+        f"**Problem:** {problem['name']} (Rating: {duel['rating']})\n"
+        f"**Link:** {duel['problem_url']}\n\n"
+        f"<@{duel['challenger_id']}> vs <@{duel['opponent_id']}>: The first to solve it in **15 minutes** wins points based on rating! Accepted solutions are detected automatically, or type `!solved` to check right away."
+    )
 
-@bot.command(name='solved', help='Claim victory in the current duel.')
-async def solved(ctx):
-    """Allows a duel participant to claim victory after solving the problem."""
-    global duel_state
-    all_data = load_users()
+@bot.command(name='queue', help='Wait for a matchmaking opponent. Usage: !queue <Rating> or !queue <Low>-<High>')
+async def queue(ctx, rating_range: str):
+    """Adds the author to this server's matchmaking pool for problems in the given rating range."""
     server_id = str(ctx.guild.id)
-    winner_id = str(ctx.author.id)
-    server_users = all_data.get(server_id, {})
+    discord_id = str(ctx.author.id)
+    user_data = users.get_user(server_id, discord_id)
 
-    current_server_duel = duel_state.get(server_id, {})
-    if not current_server_duel.get("active") or current_server_duel.get("problem") is None:
-        await ctx.send("There is no duel in progress on this server.")
+    if user_data is None:
+        await ctx.send("You must be registered on this server to join the queue.")
+        return
+    bounds = parse_rating_range(rating_range)
+    if bounds is None:
+        await ctx.send("Please choose a valid rating or range (800-3500, in increments of 100), e.g. `!queue 1400-1700`.")
         return
-    if ctx.author != current_server_duel['challenger'] and ctx.author != current_server_duel['opponent']:
-        await ctx.send("You are not a participant in the current duel.")
+    if duels.player_duel(server_id, discord_id) is not None:
+        await ctx.send("You already have a challenge or duel in progress.")
+        return
+    if matchmaker.is_queued(server_id, discord_id):
+        await ctx.send("You are already in the queue. Use `!leavequeue` to leave it.")
         return
 
-    if winner_id not in server_users:
-        await ctx.send("Error: Could not find your user data for this server.")
+    # Solved problems steer matching towards pairs with many fresh problems in common
+    try:
+        solved_ids = await solved_cache.solved(user_data['codeforces_handle'])
+    except Exception as e:
+        print(f"Could not refresh solved problems for {user_data['codeforces_handle']}: {e}")
+        solved_ids = set()
+    low, high = bounds
+    if not matchmaker.join(server_id, discord_id, user_data['elo'], low, high, str(ctx.channel.id), solved_ids):
+        await ctx.send("You are already in the queue. Use `!leavequeue` to leave it.")
+        return
+    shown = f"{low}" if low == high else f"{low}-{high}"
+    await ctx.send(f"{ctx.author.mention} joined the queue for a **{shown}** duel. You will be pinged here when an opponent is found.")
+
+@bot.command(name='leavequeue', help='Leave the matchmaking queue.')
+async def leavequeue(ctx):
+    """Removes the author from this server's matchmaking pool."""
+    if matchmaker.leave(str(ctx.guild.id), str(ctx.author.id)):
+        await ctx.send(f"{ctx.author.mention} left the queue.")
+    else:
+        await ctx.send("You are not in the queue.")
+
+async def start_matched_duel(guild_id, a, b, rating):
+    """Starts the duel between two players paired by the matchmaker."""
+    channel = bot.get_channel(int(a['channel_id']))
+    # Either player may have started a challenge since the pairing was made
+    duel = duels.reserve(guild_id, a['channel_id'], a['discord_id'], b['discord_id'], rating)
+    if duel is None:
+        # The matcher already took both out of the queue; whoever is still free waits for another opponent
+        for entry in (a, b):
+            if duels.player_duel(guild_id, entry['discord_id']) is None:
+                matchmaker.requeue(guild_id, entry)
         return
+    try:
+        await start_reserved_duel(duel, guild_id, a, b, rating, channel)
+    except Exception:
+        if duel['duel_id'] is None:
+            duels.release(duel)
+        raise
+
+async def start_reserved_duel(duel, guild_id, a, b, rating, channel):
+    """Picks the problem for a reserved matched duel and starts it."""
+    first = users.get_user(guild_id, a['discord_id'])
+    second = users.get_user(guild_id, b['discord_id'])
+    low, high = max(a['low'], b['low']), min(a['high'], b['high'])
+    # The best-scoring rating first, then the rest of the shared range
+    try:
+        problem = await pick_problem(duel, first, second, low, high, prefer=rating)
+    except Exception as e:
+        duels.release(duel)
+        if channel is not None:
+            await channel.send(f"<@{a['discord_id']}> and <@{b['discord_id']}> were matched, but fetching data from Codeforces failed. Please queue again later.\n`Error: {e}`")
+        return
+    if problem is None:
+        duels.release(duel)
+        if channel is not None:
+            await channel.send(f"<@{a['discord_id']}> and <@{b['discord_id']}> were matched, but no problem in {low}-{high} is unsolved by both. Please queue again with another range.")
+        return
+
+    duel['rating'] = problem['rating']
+    try:
+        async with duels.guild_lock(guild_id):
+            started = duels.start(duel, problem)
+    except LockTimeout:
+        duels.release(duel)
+        started = None
+    if channel is None:
+        return
+    if started is None:
+        await channel.send(f"<@{a['discord_id']}> and <@{b['discord_id']}> were matched, but the duel could not be started. Please queue again.")
+    else:
+        await channel.send(f"🔔 Match found! <@{a['discord_id']}> (Elo {a['elo']:.0f}) vs <@{b['discord_id']}> (Elo {b['elo']:.0f})\n" + duel_start_message(duel, problem))
 
-    winner_handle = server_users[winner_id]['codeforces_handle']
-    problem_info = current_server_duel['problem']
-    duel_rating = current_server_duel['rating'] # MODIFIED: Get the rating
+@bot.command(name='solved', help='Check right away whether you have won your current duel.')
+async def solved(ctx):
+    """Checks the submissions of both duel participants immediately instead of waiting for the judge loop."""
+    server_id = str(ctx.guild.id)
+    discord_id = str(ctx.author.id)
+
+    duel = duels.player_duel(server_id, discord_id)
+    if duel is None or duel['problem'] is None:
+        await ctx.send("You are not in a duel on this server.")
+        return
 
     await ctx.send(f"Checking {ctx.author.mention}'s recent submissions for a correct solution...")
+    if not await judge.check(duel):
+        await ctx.send("I couldn't find a correct submission for the duel problem yet. Keep trying!")
+
+async def duel_won(duel, winner_id, submission):
+    """Called by the judge when it finds the first accepted submission of a duel."""
+    # The duel may have timed out or been settled while we were waiting on Codeforces
+    solve_seconds = submission['creationTimeSeconds'] - duel['start_time'].timestamp()
+    async with duels.guild_lock(duel['guild_id']):
+        if not duels.finish(duel, winner_id, solve_seconds):
+            return
+        duel_rating = duel['rating']
+        points_awarded = calculate_points(duel_rating)
+        total_points = users.add_points(duel['guild_id'], winner_id, points_awarded)
+        elo_changes = update_elo(duel, winner_id)
+        # The settled duel is already committed; don't leave its points waiting for the next flush
+        flush_duelists(duel)
+    channel = bot.get_channel(int(duel['channel_id']))
+    if channel is not None:
+        await channel.send(
+            f"🎉 **Winner!** <@{winner_id}> has solved the problem and won the duel!\n"
+            f"**{points_awarded} points** awarded for a {duel_rating}-rated problem. Their total is now **{total_points}**.\n"
+            f"Elo: " + ", ".join(f"<@{discord_id}> {change:+.0f}" for discord_id, change in elo_changes.items())
+        )
+
+async def duel_timeout(duel):
+    """Called by the duel scheduler when a duel reaches its deadline; ends it in a draw."""
+    # Give a solution submitted just before the deadline one last chance
+    if await judge.check(duel):
+        return
+    # It may still be in the judging queue; keep the duel open for it, up to DEADLINE_GRACE
+    now = time.time()
+    if judge.judging(duel) and now < duel['deadline'] + DEADLINE_GRACE:
+        duels.reschedule(duel, now + JUDGE_MIN_INTERVAL)
+        return
+    async with duels.guild_lock(duel['guild_id']):
+        if not duels.finish(duel):
+            return
+        elo_changes = update_elo(duel, None)
+        flush_duelists(duel)
+    channel = bot.get_channel(int(duel['channel_id']))
+    if channel is not None:
+        await channel.send(
+            f"**Time's up!** The duel between <@{duel['challenger_id']}> and "
+            f"<@{duel['opponent_id']}> has ended in a **draw**. No points awarded.\n"
+            f"Elo: " + ", ".join(f"<@{discord_id}> {change:+.0f}" for discord_id, change in elo_changes.items())
+        )
+
+# --- TOURNAMENTS ---
+async def pick_round_problems(tournament, discord_ids):
+    """Picks a round's problems, spread over the tournament's rating range, that no participant
+    has solved and no earlier round used. Returns them easiest first, or None if the range ran out.
+    """
+    await catalog.ensure_loaded()
+    handles = [handle_of(tournament.guild_id, discord_id) for discord_id in discord_ids]
+    await asyncio.gather(*(solved_cache.solved(handle) for handle in handles))
+    exclude = catalog.mask(problem_id(contest_id, index) for contest_id, index in tournament.used)
+    for handle in handles:
+        exclude |= solved_cache.bits(handle, catalog)
+    problems = []
+    count = tournament.problem_count
+    for i in range(count):
+        target = tournament.low + round((tournament.high - tournament.low) * i / max(1, count - 1) / 100) * 100
+        problem = (catalog.pick_matching(target, target, exclude=exclude)
+                   or catalog.pick_matching(tournament.low, tournament.high, exclude=exclude))
+        if problem is None:
+            return None
+        problems.append(problem)
+        exclude |= catalog.mask([problem_id(problem['contestId'], problem['index'])])
+    problems.sort(key=lambda problem: problem['rating'])
+    return problems
+
+def entrant_label(tournament, entrant_id):
+    entrant = tournament.entrants[entrant_id]
+    if len(entrant['members']) == 1 and entrant_id == entrant['members'][0]:
+        return f"<@{entrant_id}>"
+    return f"**{entrant['name']}** (" + ", ".join(f"<@{discord_id}>" for discord_id in entrant['members']) + ")"
+
+def problem_link(problem):
+    return f"https://codeforces.com/problemset/problem/{problem['contestId']}/{problem['index']}"
+
+async def send_lines(channel, lines):
+    """Sends `lines` in as few messages as Discord's 2000-character limit allows."""
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > 2000:
+            await channel.send(chunk)
+            chunk = ""
+        chunk += line + "\n"
+    if chunk:
+        await channel.send(chunk)
+
+async def announce_round_start(tournament):
+    channel = bot.get_channel(int(tournament.channel_id))
+    if channel is None:
+        return
+    round_ = tournament.round
+    lines = [f"🏁 **Round {round_['number']} of {tournament.rounds}** has started and ends <t:{int(round_['deadline'])}:R>. ICPC scoring: most solved, then least penalty."]
+    lines += [f"**{chr(ord('A') + number)}.** {problem['name']} ({problem['rating']}): {problem_link(problem)}" for number, problem in enumerate(round_['problems'])]
+    lines += [f"{entrant_label(tournament, a)} vs {entrant_label(tournament, b)}" for a, b in round_['matches']]
+    lines += [f"{entrant_label(tournament, e)} has a bye." for e in round_['bye']]
+    await send_lines(channel, lines)
+
+async def announce_round_end(tournament, record):
+    channel = bot.get_channel(int(tournament.channel_id))
+    if channel is None:
+        return
+    lines = [f"**Round {record['number']} is over!**"]
+    for a, b, winner in record['matches']:
+        if winner is None:
+            lines.append(f"{entrant_label(tournament, a)} drew with {entrant_label(tournament, b)}")
+        else:
+            lines.append(f"{entrant_label(tournament, winner)} beat {entrant_label(tournament, b if winner == a else a)}")
+    if tournament.status != 'finished':
+        lines.append(f"The next round starts in {ROUND_BREAK // 60} minutes. Type `!tournament` for the standings.")
+    await send_lines(channel, lines)
+
+async def announce_tournament_end(tournament):
+    channel = bot.get_channel(int(tournament.channel_id))
+    if channel is None:
+        return
+    standings = tournament.standings()
+    lines = [f"🏆 **The tournament is over!** The winner is {entrant_label(tournament, standings[0])}!"]
+    lines += [f"{place}. {entrant_label(tournament, e)}" for place, e in enumerate(standings[1:3], start=2)]
+    await send_lines(channel, lines)
+
+@bot.group(name='tournament', invoke_without_command=True, help='Show the tournament standings. Subcommands: create, join, team, leave, start, cancel.')
+async def tournament(ctx):
+    """Shows the live standings of the running round and the overall tournament standings."""
+    current = tournaments.get(str(ctx.guild.id))
+    if current is None:
+        await ctx.send("There is no tournament on this server. An admin can open one with `!tournament create`.")
+        return
+    names = {e: entrant['name'] for e, entrant in current.entrants.items()}
+    embed = discord.Embed(title=f"🏆 {current.format.title()} Tournament", color=discord.Color.gold())
+    if current.status == 'open':
+        embed.description = f"Open for sign-ups: {len(current.entrants)} entrants. Join with `!tournament join` or `!tournament team <name> @teammates`."
+    elif current.status == 'starting':
+        embed.description = f"Starting with {len(current.entrants)} entrants: picking problems nobody has solved..."
+    elif current.round is not None:
+        round_ = current.round
+        board = current.scoreboard
+        embed.description = f"Round {round_['number']} of {current.rounds}, ends <t:{int(round_['deadline'])}:R>"
+        embed.add_field(
+            name="Problems",
+            value="\n".join(f"[{chr(ord('A') + number)}. {problem['name']}]({problem_link(problem)}) ({problem['rating']})" for number, problem in enumerate(round_['problems'])),
+            inline=False
+        )
+        lines = []
+        for place, (e, solved_count, penalty) in enumerate(board.standings()[:STANDINGS_SIZE], start=1):
+            marks = []
+            for number in range(len(round_['problems'])):
+                accepted, rejected = board.cell(e, number)
+                marks.append(("+" if accepted is not None else "-") + (str(rejected) if rejected else "") if accepted is not None or rejected else ".")
+            lines.append(f"{place}. {names[e]}: {solved_count} solved, {penalty} penalty `{' '.join(marks)}`")
+        embed.add_field(name="Round Standings", value="\n".join(lines) or "No matches this round.", inline=False)
+    else:
+        embed.description = f"Round {len(current.history) + 1} of {current.rounds} starts <t:{int(current.next_round_at)}:R>"
+    if current.history:
+        if current.format == 'swiss':
+            overall = [f"{place}. {names[e]}: {current.entrants[e]['points']:g} pts" for place, e in enumerate(current.standings()[:STANDINGS_SIZE], start=1)]
+        else:
+            overall = [f"Still in: {', '.join(names[e] for e in current.bracket)}"]
+        embed.add_field(name="Tournament Standings", value="\n".join(overall), inline=False)
+    await ctx.send(embed=embed)
+
+@tournament.command(name='create', help='Open a tournament (admins only). Usage: !tournament create <swiss|elimination> <Rating or Low-High> [Problems] [Minutes] [Rounds]')
+@commands.has_permissions(administrator=True)
+async def tournament_create(ctx, fmt: str, rating_range: str, problem_count: int = ROUND_PROBLEMS, minutes: int = ROUND_MINUTES, rounds: int = None):
+    """Opens a tournament in this channel for sign-ups."""
+    fmt = fmt.lower()
+    if fmt not in FORMATS:
+        await ctx.send(f"The format must be one of: {', '.join(FORMATS)}.")
+        return
+    bounds = parse_rating_range(rating_range)
+    if bounds is None:
+        await ctx.send("Please choose a valid rating or range (800-3500, in increments of 100), e.g. `1200-1800`.")
+        return
+    if not (1 <= problem_count <= 10 and 5 <= minutes <= 300 and (rounds is None or 1 <= rounds <= 20)):
+        await ctx.send("Rounds have 1-10 problems and last 5-300 minutes, and a tournament has at most 20 rounds.")
+        return
+    created = tournaments.create(str(ctx.guild.id), str(ctx.channel.id), fmt, *bounds, problem_count, minutes, rounds)
+    if created is None:
+        await ctx.send("This server already has a tournament. Finish or cancel it first.")
+        return
+    await ctx.send(
+        f"🏆 A **{fmt}** tournament is open for sign-ups: rounds of {problem_count} problems rated {bounds[0]}-{bounds[1]}, {minutes} minutes each.\n"
+        f"Join alone with `!tournament join` or as a team of up to {TEAM_SIZE} with `!tournament team <name> @teammates`. An admin starts it with `!tournament start`."
+    )
 
+async def add_tournament_entrant(ctx, entrant_id, name, members):
+    """Signs up one player or team, after checking every member can take part."""
+    server_id = str(ctx.guild.id)
+    current = tournaments.get(server_id)
+    if current is None or current.status != 'open':
+        await ctx.send("There is no tournament open for sign-ups on this server.")
+        return
+    member_ids = [str(member.id) for member in members]
+    if any(member.bot for member in members) or len(set(member_ids)) != len(member_ids):
+        await ctx.send("Teams are made of distinct, non-bot members.")
+        return
+    if any(users.get_user(server_id, discord_id) is None for discord_id in member_ids):
+        await ctx.send("Everyone on the team must be registered on this server.")
+        return
+    if any(current.entrant_of(discord_id) is not None for discord_id in member_ids):
+        await ctx.send("Someone on the team has already joined the tournament.")
+        return
+    if entrant_id in current.entrants:
+        await ctx.send(f"There is already a team called **{name}**.")
+        return
+    seed = sum(users.get_user(server_id, discord_id)['elo'] for discord_id in member_ids) / len(member_ids)
+    current.add_entrant(entrant_id, name, member_ids, seed)
+    tournaments.save(current)
+    await ctx.send(f"{entrant_label(current, entrant_id)} joined the tournament. Entrants so far: {len(current.entrants)}.")
+
+@tournament.command(name='join', help='Join the open tournament on your own.')
+async def tournament_join(ctx):
+    await add_tournament_entrant(ctx, str(ctx.author.id), ctx.author.display_name, [ctx.author])
+
+@tournament.command(name='team', help=f'Join the open tournament as a team. Usage: !tournament team <Name> @<Teammate> ... (up to {TEAM_SIZE} players)')
+async def tournament_team(ctx, name: str, *teammates: discord.Member):
+    if not 1 <= len(teammates) < TEAM_SIZE:
+        await ctx.send(f"Mention between 1 and {TEAM_SIZE - 1} teammates, e.g. `!tournament team Ducks @friend`.")
+        return
+    await add_tournament_entrant(ctx, f"team:{name.lower()}", name, [ctx.author, *teammates])
+
+@tournament.command(name='leave', help='Leave the tournament before it starts (your whole team leaves with you).')
+async def tournament_leave(ctx):
+    current = tournaments.get(str(ctx.guild.id))
+    entrant_id = current.entrant_of(str(ctx.author.id)) if current is not None else None
+    if entrant_id is None or current.status != 'open':
+        await ctx.send("You are not signed up for a tournament that has yet to start.")
+        return
+    del current.entrants[entrant_id]
+    tournaments.save(current)
+    await ctx.send(f"{ctx.author.mention} left the tournament.")
+
+@tournament.command(name='start', help='Close sign-ups and start the first round (admins only).')
+@commands.has_permissions(administrator=True)
+async def tournament_start(ctx):
+    current = tournaments.get(str(ctx.guild.id))
+    if current is None or current.status != 'open':
+        await ctx.send("There is no tournament waiting to start on this server.")
+        return
+    if len(current.entrants) < 2:
+        await ctx.send("A tournament needs at least two entrants.")
+        return
+    await ctx.send(f"Starting the tournament with {len(current.entrants)} entrants. Finding problems nobody has solved...")
     try:
-        response = requests.get(f"https://codeforces.com/api/user.status?handle={winner_handle}&from=1&count=10")
-        response.raise_for_status()
-        data = response.json()
-        if data.get('status') != 'OK':
-            raise Exception(f"Codeforces API Error: {data.get('comment', 'Failed to fetch status')}")
-
-        submissions = data['result']
-        for sub in submissions:
-            if (sub['problem']['contestId'] == problem_info['contestId'] and sub['problem']['index'] == problem_info['index'] and sub['verdict'] == 'OK'):
-                if datetime.fromtimestamp(sub['creationTimeSeconds'], UTC) > current_server_duel['start_time']:
-                    # MODIFIED: Calculate weighted points and update user score
-                    points_awarded = calculate_points(duel_rating)
-                    server_users[winner_id]['points'] += points_awarded
-                    all_data[server_id] = server_users
-                    save_users(all_data)
-                    
-                    # MODIFIED: Update win message
-                    await ctx.send(
-                        f"🎉 **Winner!** {ctx.author.mention} has solved the problem and won the duel!\n"
-                        f"**{points_awarded} points** awarded for a {duel_rating}-rated problem. Their total is now **{server_users[winner_id]['points']}**."
-                    )
-                    del duel_state[server_id]
-                    return
-
-        await ctx.send("I couldn't find a recent, correct submission from you for the duel problem. Keep trying!")
+        started = await tournaments.start(current)
     except Exception as e:
-        await ctx.send("An error occurred while checking submissions.")
-        print(f"Error during !solved: {e}")
-
-async def duel_timeout_task(ctx, original_start_time, server_id):
-    """A background task that waits 15 minutes and ends the duel if it's still active."""
-    await asyncio.sleep(900)  # Wait for 15 minutes
-
-    # MODIFIED: Check the duel state for the specific server
-    current_server_duel = duel_state.get(server_id, {})
-    if current_server_duel.get("active") and current_server_duel.get("start_time") == original_start_time:
-        await ctx.send(
-            f"**Time's up!** The duel between {current_server_duel['challenger'].mention} and "
-            f"{current_server_duel['opponent'].mention} has ended in a **draw**. No points awarded."
+        await ctx.send(f"An error occurred while fetching data from Codeforces. Please try again later.\n`Error: {e}`")
+        return
+    if not started and current.status == 'open':
+        await ctx.send(f"Could not find {current.problem_count} problems in {current.low}-{current.high} that no entrant has solved. Try again after widening the range with a new tournament.")
+
+@tournament.command(name='cancel', help='Cancel the tournament (admins only).')
+@commands.has_permissions(administrator=True)
+async def tournament_cancel(ctx):
+    current = tournaments.get(str(ctx.guild.id))
+    if current is None:
+        await ctx.send("There is no tournament on this server.")
+        return
+    tournaments.cancel(current)
+    await ctx.send("The tournament has been cancelled.")
+
+@bot.command(name='recomputeratings', help='Recompute every Elo rating on this server from the duel history (admins only).')
+@commands.has_permissions(administrator=True)
+async def recomputeratings(ctx):
+    """Replays the server's full duel history to rebuild Elo ratings, e.g. after a formula change."""
+    server_id = str(ctx.guild.id)
+    results = [
+        (row['challenger_id'], row['opponent_id'], ratings.duel_score(row['winner_id'], row['challenger_id']))
+        for row in storage.duel_results(server_id)
+    ]
+    start = time.perf_counter()
+    new_ratings = await asyncio.to_thread(ratings.replay, results)
+    elapsed = time.perf_counter() - start
+    for discord_id in users.get_guild_users(server_id):
+        users.set_elo(server_id, discord_id, new_ratings.get(discord_id, ratings.ELO_DEFAULT))
+    await ctx.send(f"Recomputed Elo ratings for **{len(new_ratings)}** players from **{len(results)}** duels in {elapsed:.2f}s.")
+
+@bot.command(name='stats', help='Shows bot performance metrics (admins only).')
+@commands.has_permissions(administrator=True)
+async def stats(ctx):
+    """Summarizes the metrics that are also served on the metrics endpoint."""
+    def ms(seconds):
+        return "-" if seconds is None else ("∞" if seconds == float('inf') else f"{seconds * 1000:.0f}ms")
+
+    embed = discord.Embed(title="📊 Bot Stats", color=discord.Color.dark_teal())
+    embed.add_field(
+        name="Duels",
+        value=f"{len(duels.duels)} active, {len(matchmaker)} queued, {verifier.pending} verifications pending",
+        inline=False
+    )
+
+    # Merge the ok/error histograms of each command for the summary
+    commands_seen = {}
+    for (name, labels), histogram in metrics.histograms.items():
+        if name == 'command_latency_seconds':
+            command = labels[0][1]
+            count, errors, worst = commands_seen.get(command, (0, 0, None))
+            p99 = histogram.quantile(0.99)
+            commands_seen[command] = (count + histogram.count, errors + (histogram.count if labels[1][1] == 'error' else 0), p99 if worst is None else max(worst, p99))
+    if commands_seen:
+        busiest = sorted(commands_seen.items(), key=lambda item: -item[1][0])[:8]
+        embed.add_field(
+            name="Commands (count, errors, p99)",
+            value="\n".join(f"`!{command}`: {count}, {errors}, {ms(p99)}" for command, (count, errors, p99) in busiest),
+            inline=False
         )
-        # MODIFIED: Clear the server's duel state
-        del duel_state[server_id]
+
+    api_lines = []
+    for method, histogram in sorted(cf.latency.items()):
+        failed = sum(count for (m, outcome), count in cf.requests.items() if m == method and outcome not in ('ok', 'not_modified'))
+        api_lines.append(f"`{method}`: {histogram.count} calls, {failed} failed, {cf.retried.get(method, 0)} retries, p50 {ms(histogram.quantile(0.5))}, p99 {ms(histogram.quantile(0.99))}")
+    if api_lines:
+        embed.add_field(name="Codeforces API", value="\n".join(api_lines), inline=False)
+
+    embed.add_field(
+        name="Cache Hit Ratios",
+        value="\n".join(f"{cache}: {hits / (hits + misses):.0%} of {hits + misses}" if hits + misses else f"{cache}: unused" for cache, hits, misses in cache_counts()),
+        inline=True
+    )
+    lag = metrics.histogram('event_loop_lag_seconds')
+    embed.add_field(
+        name="Event Loop Lag",
+        value=f"p99 {ms(lag.quantile(0.99))}, max {ms(lag_monitor.max_lag)}, blocked {metrics.counters.get(('event_loop_blocked_total', ()), 0)}x",
+        inline=True
+    )
+    user_stats = users.stats()
+    embed.add_field(
+        name="User Flushes",
+        value=f"{user_stats['flushes']} flushes ({user_stats['rows_flushed']} rows), last {user_stats['last_flush_ms']:.1f}ms, "
+              f"max {user_stats['max_flush_ms']:.1f}ms, {user_stats['dirty_entries']} dirty",
+        inline=True
+    )
+    await ctx.send(embed=embed)
+
+duels.on_timeout = duel_timeout
+judge.on_win = duel_won
+tournaments.pick_problems = pick_round_problems
+tournaments.on_round_start = announce_round_start
+tournaments.on_round_end = announce_round_end
+tournaments.on_finish = announce_tournament_end
 
 # --- RUN THE BOT ---
 if __name__ == "__main__":
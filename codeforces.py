@@ -0,0 +1,320 @@
+# codeforces.py
+
+import asyncio
+import codecs
+import json
+import re
+import time
+import aiohttp
+
+from metrics import Histogram
+
+# --- CONFIGURATION ---
+API_BASE = 'https://codeforces.com/api/'
+# Codeforces asks for at most one call every two seconds per client.
+API_RATE = 0.5
+# The duel judge and the tournament poller split this share of API_RATE; the rest is left for commands.
+POLLER_RATE = API_RATE * 0.8
+API_TIMEOUT = 15
+API_RETRIES = 3
+API_BACKOFF = 2.0
+STREAM_CHUNK = 64 * 1024  # Bytes read at a time from a streamed response
+PENDING_VERDICTS = (None, 'TESTING')  # Verdicts of submissions that are still being judged
+
+
+class CodeforcesError(Exception):
+    """Raised when the Codeforces API answers with a non-OK status."""
+
+
+class ProblemRecord:
+    """The fields of a Codeforces `Problem` the bot uses."""
+
+    __slots__ = ('contest_id', 'index', 'name', 'rating', 'tags')
+
+    def __init__(self, contest_id, index, name, rating, tags):
+        self.contest_id = contest_id
+        self.index = index
+        self.name = name
+        self.rating = rating
+        self.tags = tags
+
+    @classmethod
+    def from_json(cls, problem):
+        """Returns a record for a `Problem` object, or None if it has no contest id or index."""
+        if 'contestId' not in problem or 'index' not in problem:
+            return None
+        return cls(problem['contestId'], problem['index'], problem.get('name', ''), problem.get('rating'), problem.get('tags', []))
+
+
+class SubmissionRecord:
+    """The fields of a Codeforces `Submission` the bot uses."""
+
+    __slots__ = ('id', 'contest_id', 'index', 'verdict', 'creation_time')
+
+    def __init__(self, id, contest_id, index, verdict, creation_time):
+        self.id = id
+        self.contest_id = contest_id
+        self.index = index
+        self.verdict = verdict
+        self.creation_time = creation_time
+
+    @classmethod
+    def from_json(cls, submission):
+        problem = submission.get('problem', {})
+        return cls(submission['id'], problem.get('contestId'), problem.get('index'),
+                   submission.get('verdict'), submission.get('creationTimeSeconds'))
+
+
+class ArrayStream:
+    """Decodes the elements of the array stored under `key` while the response arrives.
+
+    Feed it the body chunk by chunk; each call returns the elements it
+    completed, so only one element is ever held as parsed JSON. `found` is
+    set once the array has started and `done` once it has ended. A body in
+    which the array never starts (an error answer) stays buffered in `rest`.
+    """
+
+    def __init__(self, key):
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._status = re.compile(r'"status"\s*:\s*"OK"')
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self.rest = ''
+        self.found = False
+        self.done = False
+
+    def feed(self, chunk):
+        buffer = self.rest + self._text.decode(chunk)
+        pos = 0
+        if not self.found:
+            match = self._start.search(buffer)
+            # Codeforces sends the status before the result, so an OK answer shows it first
+            if match is None or not self._status.search(buffer, 0, match.start()):
+                self.rest = buffer
+                return []
+            self.found = True
+            pos = match.end()
+        items = []
+        end = len(buffer)
+        while not self.done:
+            while pos < end and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= end:
+                break
+            if buffer[pos] == ']':
+                self.done = True
+                break
+            try:
+                item, pos_after = self._decoder.raw_decode(buffer, pos)
+            except ValueError:
+                break  # the element continues in the next chunk
+            items.append(item)
+            pos = pos_after
+        self.rest = buffer[pos:]
+        return items
+
+
+class RateLimiter:
+    """A token bucket shared by every request made through one client.
+
+    `rate` tokens are added per second up to `capacity`. Each call takes one
+    token and waits asynchronously when the bucket is empty, so waiting
+    commands never block the event loop.
+    """
+
+    def __init__(self, rate=API_RATE, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SharedRateLimiter:
+    """A token bucket kept in a shared backend (see backend.py).
+
+    Every shard process takes its tokens from the same bucket, so together
+    they stay within the Codeforces limit.
+    """
+
+    def __init__(self, backend, name='codeforces', rate=API_RATE, capacity=1):
+        self.backend = backend
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    async def acquire(self):
+        while True:
+            wait = await self.backend.take(self.name, self.rate, self.capacity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class CodeforcesClient:
+    """Async Codeforces API client with one pooled keep-alive session.
+
+    Calls go through a global token bucket (or `limiter`, e.g. a
+    SharedRateLimiter), time out after `timeout` seconds
+    and are retried with exponential backoff on `Call limit exceeded`, 5xx
+    responses and network errors. Every attempt is timed per API method and
+    counted by outcome in `latency`, `requests` and `retried`.
+    """
+
+    def __init__(self, base_url=API_BASE, rate=API_RATE, timeout=API_TIMEOUT, retries=API_RETRIES, backoff=API_BACKOFF,
+                 limiter=None):
+        self.base_url = base_url
+        self.limiter = limiter or RateLimiter(rate)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.latency = {}   # method -> Histogram of attempt durations
+        self.requests = {}  # (method, outcome) -> attempts
+        self.retried = {}   # method -> attempts after the first
+        self._session = None
+
+    def _get_session(self):
+        # The session has to be created inside the running event loop.
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        """Closes the pooled session. Safe to call more than once."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def call(self, method, **params):
+        """Calls an API method and returns its `result` field."""
+        result, _ = await self.call_conditional(method, **params)
+        return result
+
+    def _record(self, method, outcome, started):
+        histogram = self.latency.get(method)
+        if histogram is None:
+            histogram = self.latency[method] = Histogram()
+        histogram.observe(time.perf_counter() - started)
+        key = (method, outcome)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    async def call_conditional(self, method, etag=None, **params):
+        """Calls an API method, sending `etag` as `If-None-Match`.
+
+        Returns `(result, etag)`, where `result` is None when the server
+        answered 304 Not Modified.
+        """
+        return await self._request(method, etag, params)
+
+    async def call_stream(self, method, key, convert, etag=None, **params):
+        """Like `call_conditional`, for methods whose result holds a large array.
+
+        The array named `key` is decoded one element at a time as the body
+        arrives and every element is passed through `convert` (elements it
+        returns None for are dropped), so the full response never exists as
+        Python objects. Returns `(records, etag)`.
+        """
+        return await self._request(method, etag, params, (key, convert))
+
+    async def _read_stream(self, response, key, convert):
+        """Reads a response through an ArrayStream and returns it shaped like a parsed answer."""
+        stream = ArrayStream(key)
+        records = []
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK):
+            for item in stream.feed(chunk):
+                record = convert(item)
+                if record is not None:
+                    records.append(record)
+            if stream.done:
+                # Anything after the array (such as problemStatistics) is not needed
+                return {'status': 'OK', 'result': records}
+        if stream.found:
+            raise ValueError(f"Response ended inside the {key} array")
+        return json.loads(stream.rest)
+
+    async def _request(self, method, etag, params, stream=None):
+        url = self.base_url + method
+        params = {key: str(value) for key, value in params.items() if value is not None}
+        headers = {'If-None-Match': etag} if etag else None
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried[method] = self.retried.get(method, 0) + 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            await self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                async with self._get_session().get(url, params=params, headers=headers) as response:
+                    if response.status == 304:
+                        self._record(method, 'not_modified', started)
+                        return None, etag
+                    if response.status >= 500:
+                        self._record(method, 'server_error', started)
+                        error = CodeforcesError(f"HTTP {response.status} from Codeforces")
+                        continue
+                    if stream is None:
+                        data = await response.json(content_type=None)
+                    else:
+                        data = await self._read_stream(response, *stream)
+                    new_etag = response.headers.get('ETag')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self._record(method, 'network_error', started)
+                error = CodeforcesError(f"Request to {method} failed: {e!r}")
+                continue
+
+            if data.get('status') == 'OK':
+                self._record(method, 'ok', started)
+                return data['result'], new_etag
+            comment = data.get('comment', 'No comment provided')
+            error = CodeforcesError(f"Codeforces API Error: {comment}")
+            if 'Call limit exceeded' not in comment:
+                self._record(method, 'api_error', started)
+                raise error
+            self._record(method, 'call_limit', started)
+        raise error
+
+    async def user_info(self, handles):
+        """Returns the `User` objects for one handle or a list of handles."""
+        if isinstance(handles, str):
+            handles = [handles]
+        return await self.call('user.info', handles=';'.join(handles))
+
+    async def user_status(self, handle, start=None, count=None):
+        """Returns submissions of a user, newest first."""
+        return await self.call('user.status', handle=handle, **{'from': start, 'count': count})
+
+    async def user_submissions(self, handle, start=None, count=None):
+        """Returns submissions of a user as SubmissionRecords, newest first, parsing the response as it streams in."""
+        records, _ = await self.call_stream('user.status', 'result', SubmissionRecord.from_json,
+                                            handle=handle, **{'from': start, 'count': count})
+        return records
+
+    async def problemset_problems(self, etag=None):
+        """Returns `(payload, etag)` for `problemset.problems`; payload is None if unchanged."""
+        return await self.call_conditional('problemset.problems', etag=etag)
+
+    async def problemset_records(self, etag=None):
+        """Returns `(ProblemRecords, etag)` for `problemset.problems`, streamed; the records are None if unchanged."""
+        return await self.call_stream('problemset.problems', 'problems', ProblemRecord.from_json, etag=etag)
+
+    async def contest_years(self):
+        """Returns `{contest id: year it started}` for every contest that has a start time, from `contest.list`."""
+        def year(contest):
+            if 'startTimeSeconds' not in contest:
+                return None
+            return contest['id'], time.gmtime(contest['startTimeSeconds']).tm_year
+
+        records, _ = await self.call_stream('contest.list', 'result', year)
+        return dict(records)
@@ -0,0 +1,412 @@
+# duels.py
+
+import asyncio
+import heapq
+import time
+from contextlib import nullcontext
+from datetime import datetime, UTC
+
+from codeforces import POLLER_RATE, PENDING_VERDICTS
+
+# --- CONFIGURATION ---
+DUEL_DURATION = 15 * 60  # A duel ends in a draw after 15 minutes
+TIMEOUT_RETRY = 30  # Seconds before a timeout that raised is tried again
+DEADLINE_GRACE = 300  # Seconds a duel may stay open past its deadline while a solution is still being judged
+JUDGE_MIN_INTERVAL = 15  # Seconds between polls of a duel with recent activity
+JUDGE_MAX_INTERVAL = 90  # Polls of a quiet duel back off up to this interval
+JUDGE_BACKOFF = 1.5
+JUDGE_PAGE_SIZE = 20  # Submissions fetched per user.status page
+JUDGE_RATE = POLLER_RATE / 2  # API calls per second the judge may use
+
+
+class DuelEngine:
+    """Tracks every challenge and duel across all guilds.
+
+    A duel is a dict with the guild, channel, both participants, the rating
+    and, once accepted, the problem and start time. Started duels are keyed
+    by their database id and every duel is indexed by participant, so each
+    player can take part in only one duel at a time while a guild can run
+    any number of them. All deadlines live in one heap that a single
+    scheduler task sleeps on.
+
+    When several shard processes share the database, `backend` provides the
+    per-guild locks that serialize starting and settling duels between them.
+    """
+
+    def __init__(self, storage, duration=DUEL_DURATION, backend=None):
+        self.storage = storage
+        self.duration = duration
+        self.backend = backend
+        self.duels = {}      # duel_id -> started duel
+        self.by_player = {}  # (guild_id, discord_id) -> pending or started duel
+        self.on_timeout = None
+        self._timers = []    # heap of (deadline, duel_id)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._pending = set()
+
+    # --- LOOKUPS ---
+    def player_duel(self, guild_id, discord_id):
+        """Returns the challenge or duel a player is part of, or None."""
+        return self.by_player.get((guild_id, discord_id))
+
+    def guild_lock(self, guild_id):
+        """Async context manager held while a duel of `guild_id` is started or settled."""
+        if self.backend is None:
+            return nullcontext()
+        return self.backend.lock(f"duels:{guild_id}")
+
+    # --- LIFECYCLE ---
+    def reserve(self, guild_id, channel_id, challenger_id, opponent_id, rating):
+        """Creates a pending challenge, or returns None if either player is busy."""
+        if (guild_id, challenger_id) in self.by_player or (guild_id, opponent_id) in self.by_player:
+            return None
+        duel = {
+            'duel_id': None,
+            'guild_id': guild_id,
+            'channel_id': channel_id,
+            'challenger_id': challenger_id,
+            'opponent_id': opponent_id,
+            'rating': rating,
+            'problem': None,
+            'problem_url': None,
+            'start_time': None,
+            'deadline': None,
+        }
+        self.by_player[(guild_id, challenger_id)] = duel
+        self.by_player[(guild_id, opponent_id)] = duel
+        return duel
+
+    def release(self, duel):
+        """Forgets a challenge or duel without recording a result."""
+        for discord_id in (duel['challenger_id'], duel['opponent_id']):
+            if self.by_player.get((duel['guild_id'], discord_id)) is duel:
+                del self.by_player[(duel['guild_id'], discord_id)]
+        if duel['duel_id'] is not None:
+            self.duels.pop(duel['duel_id'], None)
+
+    def start(self, duel, problem):
+        """Starts an accepted challenge on `problem` and schedules its timeout.
+
+        Returns None (and releases the challenge) if the database already has
+        an active duel for either player, e.g. one started by another process.
+        """
+        start_time = datetime.now(UTC)
+        duel_id = self.storage.start_duel(
+            duel['guild_id'], duel['challenger_id'], duel['opponent_id'], problem, duel['rating'],
+            start_time.timestamp(), duel['channel_id']
+        )
+        if duel_id is None:
+            self.release(duel)
+            return None
+        duel['duel_id'] = duel_id
+        duel['problem'] = problem
+        duel['problem_url'] = f"https://codeforces.com/problemset/problem/{problem['contestId']}/{problem['index']}"
+        duel['start_time'] = start_time
+        duel['deadline'] = start_time.timestamp() + self.duration
+        self._track(duel)
+        return duel
+
+    def finish(self, duel, winner_id=None, solve_seconds=None):
+        """Records the result of a duel. Returns False if it was already settled."""
+        if self.duels.get(duel['duel_id']) is not duel:
+            return False
+        self.release(duel)
+        # Another process sharing the database may have settled it already
+        return self.storage.finish_duel(duel['duel_id'], winner_id, solve_seconds=solve_seconds)
+
+    def _track(self, duel):
+        self.duels[duel['duel_id']] = duel
+        for discord_id in (duel['challenger_id'], duel['opponent_id']):
+            self.by_player[(duel['guild_id'], discord_id)] = duel
+        heapq.heappush(self._timers, (duel['deadline'], duel['duel_id']))
+        self._wakeup.set()
+
+    def reschedule(self, duel, when):
+        """Runs the timeout of `duel` again at `when` (a timestamp), if it is still running."""
+        if self.duels.get(duel['duel_id']) is duel:
+            heapq.heappush(self._timers, (when, duel['duel_id']))
+            self._wakeup.set()
+
+    # --- PERSISTENCE ---
+    def restore(self, owns_guild=None):
+        """Reloads the duels that were still running when the bot last stopped.
+
+        With `owns_guild`, only duels of the guilds it accepts are loaded, so
+        each shard process tracks just its own guilds.
+        """
+        for row in self.storage.active_duels():
+            if owns_guild is not None and not owns_guild(row['guild_id']):
+                continue
+            problem = {'contestId': row['contest_id'], 'index': row['problem_index'], 'name': row['problem_name'], 'rating': row['rating']}
+            duel = {
+                'duel_id': row['duel_id'],
+                'guild_id': row['guild_id'],
+                'channel_id': row['channel_id'],
+                'challenger_id': row['challenger_id'],
+                'opponent_id': row['opponent_id'],
+                'rating': row['rating'],
+                'problem': problem,
+                'problem_url': f"https://codeforces.com/problemset/problem/{problem['contestId']}/{problem['index']}",
+                'start_time': datetime.fromtimestamp(row['start_time'], UTC),
+                'deadline': row['start_time'] + self.duration,
+            }
+            self._track(duel)
+        return len(self.duels)
+
+    # --- SCHEDULER ---
+    def start_scheduler(self):
+        """Starts the timeout scheduler task if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop_scheduler(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._timers:
+                await self._wakeup.wait()
+                continue
+            delay = self._timers[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, duel_id = heapq.heappop(self._timers)
+            duel = self.duels.get(duel_id)
+            # Duels that were already settled are simply skipped
+            if duel is None or self.on_timeout is None:
+                continue
+            # Timeouts may wait on Codeforces, so they must not hold up the next deadline
+            task = asyncio.create_task(self._timeout(duel))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _timeout(self, duel):
+        try:
+            await self.on_timeout(duel)
+        except Exception as e:
+            # e.g. LockTimeout or a busy backend; without a new timer the duel would never end
+            print(f"Error while timing out duel {duel['duel_id']}, retrying in {TIMEOUT_RETRY}s: {e}")
+            self.reschedule(duel, time.time() + TIMEOUT_RETRY)
+
+
+class SubmissionFeed:
+    """Fetches the submissions of many handles, each only as far back as needed.
+
+    Only submissions newer than the last final verdict seen for a handle are
+    returned, so a poller sees each judged submission once; ones still being
+    judged are returned again until their verdict is final.
+    """
+
+    def __init__(self, client, page_size=JUDGE_PAGE_SIZE):
+        self.client = client
+        self.page_size = page_size
+        self._newest = {}  # handle -> id of the newest submission with a final verdict
+
+    async def fetch(self, handle, since):
+        """Returns the submissions of `handle` that are new since the last fetch and not older than `since`."""
+        newest = self._newest.get(handle, 0)
+        fresh = []
+        start = 1
+        while True:
+            page = await self.client.user_status(handle, start=start, count=self.page_size)
+            for sub in page:
+                if sub['id'] <= newest or sub['creationTimeSeconds'] < since:
+                    break
+                fresh.append(sub)
+            else:
+                if len(page) == self.page_size:
+                    start += self.page_size
+                    continue
+            break
+        if fresh:
+            # Submissions still being judged have to be looked at again next time
+            pending = [sub['id'] for sub in fresh if sub.get('verdict') in PENDING_VERDICTS]
+            self._newest[handle] = min(pending) - 1 if pending else max(newest, fresh[0]['id'])
+        return fresh
+
+    async def fetch_all(self, wanted):
+        """Fetches every handle in `{handle: since}` and returns `{handle: submissions}`."""
+        handles = list(wanted)
+        results = await asyncio.gather(*(self.fetch(h, wanted[h]) for h in handles), return_exceptions=True)
+        fetched = {}
+        for handle, result in zip(handles, results):
+            if isinstance(result, Exception):
+                print(f"Could not fetch submissions of {handle}: {result}")
+            else:
+                fetched[handle] = result
+        return fetched
+
+
+class Judge:
+    """Polls Codeforces for accepted submissions in every active duel.
+
+    Due duels are polled together each tick: every handle is fetched once,
+    however many duels it is in, and only submissions newer than the last
+    final verdict seen for it are scanned. A duel is polled again after
+    JUDGE_MIN_INTERVAL when its players are submitting and backs off towards
+    JUDGE_MAX_INTERVAL while they are quiet; both bounds are stretched when
+    there are more handles than `rate` allows polling. The earliest accepted
+    submission made after the start and before the deadline wins, with ties
+    broken by submission id. Duels with a submission on their problem still
+    being judged, or a player whose submissions could not be fetched, are
+    reported by `judging()` so they are not ended in a draw too early.
+    """
+
+    def __init__(self, engine, client, handle_of, clock=time.time, min_interval=JUDGE_MIN_INTERVAL,
+                 max_interval=JUDGE_MAX_INTERVAL, page_size=JUDGE_PAGE_SIZE, rate=JUDGE_RATE):
+        self.engine = engine
+        self.client = client
+        self.handle_of = handle_of  # (guild_id, discord_id) -> Codeforces handle
+        self.clock = clock
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rate = rate
+        self.on_win = None
+        self.feed = SubmissionFeed(client, page_size)
+        self._next_poll = {}  # duel_id -> (next poll time, current interval)
+        self._accepted = {}   # duel_id -> {discord_id: first accepted submission}
+        self._judging = {}    # duel_id -> handles with an unknown result on the duel problem in the last poll
+        self._task = None
+
+    def _handles(self, duel):
+        return {
+            discord_id: self.handle_of(duel['guild_id'], discord_id)
+            for discord_id in (duel['challenger_id'], duel['opponent_id'])
+        }
+
+    @staticmethod
+    def _on_problem(duel, sub):
+        """Whether `sub` is on the duel problem and was made while the duel ran."""
+        problem = duel['problem']
+        return (sub['problem'].get('contestId') == problem['contestId']
+                and sub['problem'].get('index') == problem['index']
+                and duel['start_time'].timestamp() <= sub['creationTimeSeconds'] <= duel['deadline'])
+
+    @classmethod
+    def _first_accepted(cls, duel, submissions):
+        best = None
+        for sub in submissions:
+            if sub.get('verdict') == 'OK' and cls._on_problem(duel, sub):
+                key = (sub['creationTimeSeconds'], sub['id'])
+                if best is None or key < (best['creationTimeSeconds'], best['id']):
+                    best = sub
+        return best
+
+    def _collect(self, duel, handles, fetched, accepted):
+        """Adds the first accepted submission of each player found in `fetched` to `accepted`."""
+        for discord_id, handle in handles.items():
+            sub = self._first_accepted(duel, fetched.get(handle, ()))
+            if sub is None:
+                continue
+            best = accepted.get(discord_id)
+            if best is None or (sub['creationTimeSeconds'], sub['id']) < (best['creationTimeSeconds'], best['id']):
+                accepted[discord_id] = sub
+
+    async def _poll(self, due):
+        """Polls the players of `due` duels and settles every duel with an accepted submission.
+
+        Returns the duels that were won.
+        """
+        # Scan back to the oldest running duel of each handle, since its other duels are settled too
+        since = {}
+        for duel in self.engine.duels.values():
+            for handle in self._handles(duel).values():
+                since[handle] = min(since.get(handle, float('inf')), duel['start_time'].timestamp())
+        wanted = {handle: since[handle] for duel in due for handle in self._handles(duel).values()}
+        fetched = await self.feed.fetch_all(wanted)
+
+        # Any duel of a fetched handle may have been decided, not only the due ones
+        won = []
+        for duel in list(self.engine.duels.values()):
+            handles = self._handles(duel)
+            if not any(handle in fetched for handle in handles.values()):
+                continue
+            accepted = self._accepted.setdefault(duel['duel_id'], {})
+            self._collect(duel, handles, fetched, accepted)
+            self._note_judging(duel, handles, fetched)
+            if not accepted:
+                continue
+            missing = {h: since[h] for h in handles.values() if h not in fetched}
+            if missing:
+                # Make sure the other player did not solve it first
+                fetched.update(await self.feed.fetch_all(missing))
+                if any(h not in fetched for h in missing):
+                    continue
+                self._collect(duel, handles, fetched, accepted)
+                self._note_judging(duel, handles, fetched)
+            winner_id = min(accepted, key=lambda d: (accepted[d]['creationTimeSeconds'], accepted[d]['id']))
+            if duel['duel_id'] in self.engine.duels and self.on_win is not None:
+                await self.on_win(duel, winner_id, accepted[winner_id])
+                won.append(duel)
+
+        now = self.clock()
+        # Polling every handle once per interval must fit into the judge's share of the rate limit
+        floor = len(since) / self.rate
+        min_interval = max(self.min_interval, floor)
+        max_interval = max(self.max_interval, floor)
+        for duel in due:
+            for handle in self._handles(duel).values():
+                if handle not in fetched:
+                    self._judging.setdefault(duel['duel_id'], set()).add(handle)
+            _, interval = self._next_poll.get(duel['duel_id'], (0, min_interval))
+            active = any(fetched.get(handle) for handle in self._handles(duel).values())
+            interval = min_interval if active else min(max(interval * JUDGE_BACKOFF, min_interval), max_interval)
+            self._next_poll[duel['duel_id']] = (now + interval, interval)
+        return won
+
+    def _note_judging(self, duel, handles, fetched):
+        # Pending submissions are fetched again every poll until judged, so their absence means a final verdict
+        judging = self._judging.setdefault(duel['duel_id'], set())
+        for handle in handles.values():
+            if handle not in fetched:
+                continue
+            if any(sub.get('verdict') in PENDING_VERDICTS and self._on_problem(duel, sub) for sub in fetched[handle]):
+                judging.add(handle)
+            else:
+                judging.discard(handle)
+
+    def judging(self, duel):
+        """True if the last poll of `duel` found a solution still being judged or could not fetch a player."""
+        return bool(self._judging.get(duel['duel_id']))
+
+    async def check(self, duel):
+        """Polls one duel right away. Returns True if it was won."""
+        if self.engine.duels.get(duel['duel_id']) is not duel:
+            return False
+        return any(won is duel for won in await self._poll([duel]))
+
+    async def tick(self):
+        """Polls every duel whose next poll is due."""
+        now = self.clock()
+        for duel_id in [d for d in self._next_poll.keys() | self._accepted.keys() | self._judging.keys() if d not in self.engine.duels]:
+            self._next_poll.pop(duel_id, None)
+            self._accepted.pop(duel_id, None)
+            self._judging.pop(duel_id, None)
+        due = [duel for duel_id, duel in self.engine.duels.items() if self._next_poll.get(duel_id, (0,))[0] <= now]
+        if due:
+            await self._poll(due)
+
+    # --- BACKGROUND LOOP ---
+    def start(self, interval=1.0):
+        """Starts ticking every `interval` seconds if the judge is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self, interval):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Error in judge loop: {e}")
+            await asyncio.sleep(interval)
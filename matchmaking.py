@@ -0,0 +1,168 @@
+# matchmaking.py
+
+import time
+from bisect import bisect_left, bisect_right, insort
+
+# --- CONFIGURATION ---
+MATCH_BASE_WINDOW = 100  # Elo difference accepted as soon as a player joins
+MATCH_WIDEN_RATE = 50  # ...widened by this much for every 30 seconds of waiting
+MATCH_MAX_WINDOW = 800
+MATCH_CANDIDATES = 4  # Nearest compatible players scored per queued player
+# Sorts after every discord id, for binary searches by Elo alone
+LAST_ID = chr(0x10ffff)
+
+
+def solved_counts(catalog, solved):
+    """Counts the problems in `solved` per catalog rating."""
+    counts = {}
+    for pid in solved:
+        pos = catalog.position.get(pid)
+        if pos is not None and catalog.ratings[pos]:
+            counts[catalog.ratings[pos]] = counts.get(catalog.ratings[pos], 0) + 1
+    return counts
+
+
+class Matchmaker:
+    """Per-guild waiting pools that pair queued players automatically.
+
+    Each pool keeps its players in a list sorted by Elo, so the players
+    within a player's Elo window are found by binary search. The window
+    widens the longer someone waits. Among the nearest compatible players
+    (overlapping problem rating ranges), the pair with the most problems
+    that neither has solved, discounted by their Elo gap, is matched. Pair
+    scores are cached until one of the two leaves the pool.
+    """
+
+    def __init__(self, catalog, clock=time.time, base_window=MATCH_BASE_WINDOW, widen_rate=MATCH_WIDEN_RATE,
+                 max_window=MATCH_MAX_WINDOW, candidates=MATCH_CANDIDATES):
+        self.catalog = catalog
+        self.clock = clock
+        self.base_window = base_window
+        self.widen_rate = widen_rate
+        self.max_window = max_window
+        self.candidates = candidates
+        self._pools = {}  # guild_id -> {'entries': {discord_id: entry}, 'by_elo': [(elo, discord_id)], 'scores': {}}
+
+    def __len__(self):
+        return sum(len(pool['entries']) for pool in self._pools.values())
+
+    def _pool(self, guild_id):
+        return self._pools.setdefault(guild_id, {'entries': {}, 'by_elo': [], 'scores': {}})
+
+    def is_queued(self, guild_id, discord_id):
+        return discord_id in self._pools.get(guild_id, {}).get('entries', {})
+
+    def join(self, guild_id, discord_id, elo, low, high, channel_id, solved=()):
+        """Adds a player looking for a duel between ratings `low` and `high`. Returns False if already queued."""
+        pool = self._pool(guild_id)
+        if discord_id in pool['entries']:
+            return False
+        pool['entries'][discord_id] = {
+            'discord_id': discord_id,
+            'elo': elo,
+            'low': low,
+            'high': high,
+            'channel_id': channel_id,
+            'joined_at': self.clock(),
+            'solved': solved,
+            'counts': solved_counts(self.catalog, solved),
+        }
+        insort(pool['by_elo'], (elo, discord_id))
+        return True
+
+    def requeue(self, guild_id, entry):
+        """Puts back a player taken out of the queue by `match()`, keeping their waiting time."""
+        pool = self._pool(guild_id)
+        if entry['discord_id'] in pool['entries']:
+            return False
+        pool['entries'][entry['discord_id']] = entry
+        insort(pool['by_elo'], (entry['elo'], entry['discord_id']))
+        return True
+
+    def leave(self, guild_id, discord_id):
+        """Removes a player from the queue. Returns False if they were not queued."""
+        pool = self._pools.get(guild_id)
+        if pool is None or discord_id not in pool['entries']:
+            return False
+        entry = pool['entries'].pop(discord_id)
+        del pool['by_elo'][bisect_left(pool['by_elo'], (entry['elo'], discord_id))]
+        for key in [key for key in pool['scores'] if discord_id in key]:
+            del pool['scores'][key]
+        if not pool['entries']:
+            del self._pools[guild_id]
+        return True
+
+    def _window(self, entry, now):
+        waited = now - entry['joined_at']
+        return min(self.base_window + self.widen_rate * (waited // 30), self.max_window)
+
+    def _shared_unsolved(self, a, b):
+        """Returns `(best rating, problems neither player solved at it)` for two compatible entries."""
+        low, high = max(a['low'], b['low']), min(a['high'], b['high'])
+        both = a['solved'] & b['solved'] if len(a['solved']) < len(b['solved']) else b['solved'] & a['solved']
+        both_counts = solved_counts(self.catalog, both)
+        best = (low, 0)
+        for rating in range(low, high + 1, 100):
+            total = len(self.catalog.by_rating.get(rating, ()))
+            unsolved = total - a['counts'].get(rating, 0) - b['counts'].get(rating, 0) + both_counts.get(rating, 0)
+            if unsolved > best[1]:
+                best = (rating, unsolved)
+        return best
+
+    def _score(self, pool, a, b):
+        key = (a['discord_id'], b['discord_id']) if a['discord_id'] < b['discord_id'] else (b['discord_id'], a['discord_id'])
+        if key not in pool['scores']:
+            rating, unsolved = self._shared_unsolved(a, b)
+            pool['scores'][key] = (unsolved / (1 + abs(a['elo'] - b['elo']) / 100), rating, unsolved)
+        return pool['scores'][key]
+
+    def _best_partner(self, pool, entry, now):
+        window = self._window(entry, now)
+        by_elo = pool['by_elo']
+        lo = bisect_left(by_elo, (entry['elo'] - window, ''))
+        hi = bisect_right(by_elo, (entry['elo'] + window, LAST_ID))
+        center = bisect_left(by_elo, (entry['elo'], entry['discord_id']))
+        # Walk outwards from the player's own position, nearest Elo first
+        left, right = center - 1, center + 1
+        best = None
+        checked = 0
+        while checked < self.candidates and (left >= lo or right < hi):
+            if right >= hi or (left >= lo and entry['elo'] - by_elo[left][0] <= by_elo[right][0] - entry['elo']):
+                other_id = by_elo[left][1]
+                left -= 1
+            else:
+                other_id = by_elo[right][1]
+                right += 1
+            other = pool['entries'][other_id]
+            if max(entry['low'], other['low']) > min(entry['high'], other['high']):
+                continue
+            checked += 1
+            score, rating, unsolved = self._score(pool, entry, other)
+            if unsolved and (best is None or score > best[0]):
+                best = (score, other, rating)
+        return best
+
+    def match(self):
+        """Pairs as many queued players as possible.
+
+        Returns `(guild_id, entry_a, entry_b, rating)` for each new pair;
+        paired players are removed from the queue.
+        """
+        now = self.clock()
+        pairs = []
+        for guild_id in list(self._pools):
+            pool = self._pools[guild_id]
+            # Entries are kept in joining order, so players who have waited longest pick first
+            for entry in list(pool['entries'].values()):
+                if entry['discord_id'] not in pool['entries']:
+                    continue
+                best = self._best_partner(pool, entry, now)
+                if best is None:
+                    continue
+                _, other, rating = best
+                self.leave(guild_id, entry['discord_id'])
+                self.leave(guild_id, other['discord_id'])
+                pairs.append((guild_id, entry, other, rating))
+                if guild_id not in self._pools:
+                    break
+        return pairs
@@ -0,0 +1,155 @@
+# metrics.py
+
+import asyncio
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+# --- CONFIGURATION ---
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_INTERVAL = 0.5  # Seconds between event-loop lag samples
+LAG_WARNING = 0.1  # A sample this late means something blocked the loop
+
+
+class Histogram:
+    """Counts observations per bucket; cheap enough to call on every command."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates the `q` quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    """A registry of labelled counters and histograms, rendered in the Prometheus text format.
+
+    Labels are tuples of `(name, value)` pairs. Components that already keep
+    their own counters are exported through collectors, functions called at
+    render time that return `(name, type, labels, value)` samples, so they
+    cost nothing until someone scrapes.
+    """
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self._collectors = []
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name, labels=()):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def collector(self, func):
+        """Registers `func`; usable as a decorator."""
+        self._collectors.append(func)
+        return func
+
+    def samples(self):
+        """Yields `(name, type, labels, value)` for everything registered; histogram values are Histograms."""
+        for (name, labels), value in self.counters.items():
+            yield name, 'counter', labels, value
+        for (name, labels), histogram in self.histograms.items():
+            yield name, 'histogram', labels, histogram
+        for collect in self._collectors:
+            yield from collect()
+
+    def render(self):
+        lines = []
+        declared = set()
+        for name, kind, labels, value in sorted(self.samples(), key=lambda sample: sample[0]):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            if kind != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up a sleeping task.
+
+    A late wake-up means some callback ran for that long without yielding;
+    samples over `warning` seconds are counted and printed so blocking calls
+    can be tracked down.
+    """
+
+    def __init__(self, metrics, interval=LAG_INTERVAL, warning=LAG_WARNING):
+        self.metrics = metrics
+        self.interval = interval
+        self.warning = warning
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        histogram = self.metrics.histogram('event_loop_lag_seconds')
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            histogram.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warning:
+                self.metrics.inc('event_loop_blocked_total')
+                print(f"Event loop was blocked for {lag * 1000:.0f}ms")
+
+
+async def serve(metrics, host, port):
+    """Serves `metrics.render()` at http://host:port/metrics. Returns the runner to clean up."""
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,430 @@
+# problems.py
+
+import asyncio
+import itertools
+import json
+import os
+import pickle
+import random
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from codeforces import PENDING_VERDICTS
+
+# --- CONFIGURATION ---
+CATALOG_TTL = 6 * 60 * 60  # Refresh the problemset every 6 hours
+CACHE_MAX_HANDLES = 5000  # Solved-sets kept before the least recently used is evicted
+CACHE_PAGE_SIZE = 100  # Submissions fetched per user.status page
+SNAPSHOT_VERSION = 1  # Bumped whenever the layout of the binary snapshots changes
+# Catalog attributes stored in its snapshot; `position` and `generation` are derived on load
+INDEX_FIELDS = ('ids', 'contest_ids', 'ratings', 'indices', 'names', 'tags', 'by_rating', 'contest_years',
+                'tag_bits', 'rating_steps', 'at_most', 'year_steps', 'since')
+
+
+def problem_id(contest_id, index):
+    """Packs a problem's contest id and index (e.g. 1520, 'B2') into one integer.
+
+    Returns None for indices that do not look like `<letter>[<number>]`.
+    """
+    if not index or not 'A' <= index[0] <= 'Z':
+        return None
+    suffix = index[1:]
+    if suffix and not (suffix.isdigit() and int(suffix) < 100):
+        return None
+    return contest_id * 10000 + (ord(index[0]) - ord('A')) * 100 + (int(suffix) if suffix else 0)
+
+
+def bits_from_positions(positions, size):
+    """Builds an int with bit `pos` set for every position, in one pass over a byte buffer."""
+    buffer = bytearray((size + 7) // 8)
+    for pos in positions:
+        buffer[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def nth_set_bit(bits, n):
+    """Returns the position of the `n`-th (0-based) set bit of `bits`.
+
+    Halves the int on every step, keeping the half the bit is in, so the
+    whole search touches about twice the int's size.
+    """
+    pos = 0
+    width = bits.bit_length()
+    while width > 1:
+        half = width // 2
+        low = bits & ((1 << half) - 1)
+        count = low.bit_count()
+        if n < count:
+            bits, width = low, half
+        else:
+            n -= count
+            bits >>= half
+            pos += half
+            width -= half
+    return pos
+
+
+_generations = itertools.count(1)
+
+
+class ProblemCatalog:
+    """A disk-backed, pre-indexed copy of `problemset.problems`.
+
+    Problems are stored as parallel arrays and indexed by rating, tag and
+    contest year as bitsets (Python ints with bit `pos` set for every
+    matching problem), so a filtered pick by rating range, tags, contest
+    year and excluded problems is a few AND/ANDNOT operations.
+    The catalog refreshes in the background once its TTL has passed and uses
+    the ETag of the last download to skip unchanged payloads.
+    """
+
+    def __init__(self, client, path, ttl=CATALOG_TTL):
+        self.client = client
+        self.path = path
+        self.ttl = ttl
+        self.etag = None
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self.__dict__.update(self._index([], {}))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _index(problems, contest_years):
+        """Builds the arrays and indexes from compact `[contestId, index, name, rating, tags]` rows.
+
+        `contest_years` maps contest ids to the year they started in. Returns
+        the attributes as a dict so a refresh can swap them in at once.
+        """
+        ids, contest_ids, ratings = array('q'), array('i'), array('h')
+        indices, names, tags_list = [], [], []
+        by_rating, by_tag, position = {}, {}, {}  # by_tag only feeds tag_bits
+        for contest_id, index, name, rating, tags in problems:
+            pid = problem_id(contest_id, index)
+            if pid is None or pid in position:
+                continue
+            pos = len(ids)
+            position[pid] = pos
+            ids.append(pid)
+            contest_ids.append(contest_id)
+            ratings.append(rating or 0)
+            indices.append(index)
+            names.append(name)
+            tags_list.append(tuple(tags))
+            if rating:
+                by_rating.setdefault(rating, array('i')).append(pos)
+            for tag in tags:
+                by_tag.setdefault(tag, array('i')).append(pos)
+
+        size = len(ids)
+        tag_bits = {tag: bits_from_positions(positions, size) for tag, positions in by_tag.items()}
+        # Cumulative bitsets: at_most[i] holds every problem rated up to rating_steps[i],
+        # since[i] every problem from a contest held in year_steps[i] or later
+        rating_steps = sorted(by_rating)
+        at_most, bits = [], 0
+        for rating in rating_steps:
+            bits |= bits_from_positions(by_rating[rating], size)
+            at_most.append(bits)
+        by_year = {}
+        for pos, contest_id in enumerate(contest_ids):
+            year = contest_years.get(contest_id)
+            if year is not None:
+                by_year.setdefault(year, []).append(pos)
+        year_steps = sorted(by_year)
+        since, bits = [], 0
+        for year in reversed(year_steps):
+            bits |= bits_from_positions(by_year[year], size)
+            since.append(bits)
+        since.reverse()
+        return {
+            'ids': ids, 'contest_ids': contest_ids, 'ratings': ratings,
+            'indices': indices, 'names': names, 'tags': tags_list,
+            'by_rating': by_rating, 'position': position,
+            'contest_years': contest_years, 'tag_bits': tag_bits,
+            'rating_steps': rating_steps, 'at_most': at_most, 'year_steps': year_steps, 'since': since,
+            'generation': next(_generations),
+        }
+
+    def _rows(self):
+        return [[self.contest_ids[i], self.indices[i], self.names[i], self.ratings[i] or None, list(self.tags[i])] for i in range(len(self.ids))]
+
+    # --- PERSISTENCE ---
+    def load(self, legacy_path=None):
+        """Loads the catalog saved by a previous run, if there is one.
+
+        The binary snapshot holds the finished indexes, so nothing has to be
+        rebuilt. A JSON catalog at `legacy_path`, written by older versions,
+        is indexed instead and saved as a snapshot for the next start.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return self._load_json(legacy_path)
+        if data.get('version') != SNAPSHOT_VERSION:
+            return False
+        self.etag = data['etag']
+        self.fetched_at = data['fetched_at']
+        # Snapshots may carry fields older versions kept; only the current ones are used
+        index = {field: data['index'][field] for field in INDEX_FIELDS}
+        index['position'] = {pid: pos for pos, pid in enumerate(index['ids'])}
+        index['generation'] = next(_generations)
+        self.__dict__.update(index)
+        return True
+
+    def _load_json(self, path):
+        if path is None:
+            return False
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        self.etag = data.get('etag')
+        self.fetched_at = data.get('fetched_at', 0.0)
+        contest_years = {int(contest_id): year for contest_id, year in data.get('contest_years', {}).items()}
+        self.__dict__.update(self._index(data.get('problems', []), contest_years))
+        self.save()
+        return True
+
+    def save(self):
+        """Writes the catalog snapshot to disk atomically."""
+        data = {
+            'version': SNAPSHOT_VERSION, 'etag': self.etag, 'fetched_at': self.fetched_at,
+            'index': {field: getattr(self, field) for field in INDEX_FIELDS},
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    # --- REFRESHING ---
+    def is_stale(self):
+        # Catalogs saved before year filters existed have no contest years yet
+        return not self.ids or not self.contest_years or time.time() - self.fetched_at > self.ttl
+
+    async def refresh(self, force=False):
+        """Downloads the problemset if the catalog is stale (or `force` is set).
+
+        Concurrent callers share a single download.
+        """
+        async with self._lock:
+            if not force and not self.is_stale():
+                return
+            # Streamed straight into compact records instead of one large parsed payload
+            records, etag = await self.client.problemset_records(etag=self.etag if self.ids else None)
+            self.fetched_at = time.time()
+            if records is not None:
+                rows = [[p.contest_id, p.index, p.name, p.rating, p.tags] for p in records]
+                del records
+                # New problems usually come with new contests, whose start years are needed too
+                contest_years = await self.client.contest_years()
+                self.etag = etag
+                self.__dict__.update(await asyncio.to_thread(self._index, rows, contest_years))
+            elif not self.contest_years:
+                contest_years = await self.client.contest_years()
+                self.__dict__.update(await asyncio.to_thread(self._index, self._rows(), contest_years))
+            await asyncio.to_thread(self.save)
+
+    async def ensure_loaded(self):
+        """Downloads the problemset only if the catalog is still empty.
+
+        Stale data is left to the background refresh, so duels never wait on it.
+        """
+        if not self.ids:
+            await self.refresh()
+
+    # --- SELECTION ---
+    def problem(self, pos):
+        """Returns the problem at `pos` in the shape of a Codeforces `Problem` object."""
+        return {
+            'contestId': self.contest_ids[pos],
+            'index': self.indices[pos],
+            'name': self.names[pos],
+            'rating': self.ratings[pos] or None,
+            'tags': list(self.tags[pos]),
+        }
+
+    def mask(self, pids):
+        """Returns the bitset of the catalog problems among the problem ids `pids`."""
+        position = self.position
+        return bits_from_positions((position[pid] for pid in pids if pid in position), len(self.ids))
+
+    def _at_most(self, rating):
+        i = bisect_right(self.rating_steps, rating)
+        return self.at_most[i - 1] if i else 0
+
+    def matching(self, low, high, tags=(), after_year=None, exclude=0):
+        """Returns the bitset of problems rated `low` to `high` that have every tag in `tags`,
+        come from a contest held after `after_year` (if given) and are not in the `exclude` bitset.
+        """
+        bits = self._at_most(high) & ~self._at_most(low - 1)
+        for tag in tags:
+            bits &= self.tag_bits.get(tag, 0)
+        if after_year is not None:
+            i = bisect_right(self.year_steps, after_year)
+            bits &= self.since[i] if i < len(self.since) else 0
+        return bits & ~exclude
+
+    def pick_matching(self, low, high, tags=(), after_year=None, exclude=0):
+        """Returns a uniformly random problem from `matching()`, or None if nothing matches."""
+        bits = self.matching(low, high, tags, after_year, exclude)
+        count = bits.bit_count()
+        if not count:
+            return None
+        return self.problem(nth_set_bit(bits, random.randrange(count)))
+
+
+class SolvedCache:
+    """Per-handle sets of solved problem ids, kept up to date incrementally.
+
+    Each entry remembers the newest submission id it has seen, so a refresh
+    only pages through `user.status` until it reaches known submissions.
+    Entries are evicted least-recently-used first and persisted to disk as
+    a binary snapshot of packed id arrays. A handle's set is only unpacked
+    the first time it is used after a restart, and only entries that
+    changed are packed again when saving.
+    """
+
+    def __init__(self, client, path, max_handles=CACHE_MAX_HANDLES, page_size=CACHE_PAGE_SIZE):
+        self.client = client
+        self.path = path
+        self.max_handles = max_handles
+        self.page_size = page_size
+        self.dirty = False
+        self.hits = 0    # refreshes that only fetched new submissions
+        self.misses = 0  # handles fetched from scratch
+        # handle -> [newest submission id, set of problem ids or None, packed ids or None]
+        self._entries = OrderedDict()
+        self._bits = {}  # handle -> (catalog generation, solved count, bitset)
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _ids(entry):
+        """Returns the entry's set of problem ids, unpacking it on first use."""
+        if entry[1] is None:
+            packed = array('i')
+            packed.frombytes(entry[2])
+            entry[1] = set(packed)
+        return entry[1]
+
+    # --- PERSISTENCE ---
+    def load(self, legacy_path=None):
+        """Loads the cache saved by a previous run, if there is one.
+
+        Falls back to the JSON file at `legacy_path` written by older versions.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return self._load_json(legacy_path)
+        if data.get('version') != SNAPSHOT_VERSION:
+            return False
+        self._entries = OrderedDict((handle, [last_id, None, packed]) for handle, last_id, packed in data['entries'])
+        return True
+
+    def _load_json(self, path):
+        if path is None:
+            return False
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        self._entries = OrderedDict((handle, [last_id, set(ids), None]) for handle, (last_id, ids) in data.items())
+        self.dirty = True
+        return True
+
+    def _snapshot(self):
+        self.dirty = False
+        for entry in self._entries.values():
+            if entry[2] is None:
+                entry[2] = array('i', sorted(entry[1])).tobytes()
+        return {'version': SNAPSHOT_VERSION, 'entries': [(handle, entry[0], entry[2]) for handle, entry in self._entries.items()]}
+
+    def _write(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def save(self):
+        """Writes the cache to disk atomically."""
+        self._write(self._snapshot())
+
+    async def flush(self):
+        """Saves the cache from a worker thread if it changed since the last save."""
+        if self.dirty:
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    # --- REFRESHING ---
+    async def _fetch_new(self, handle, last_id):
+        """Returns the submissions newer than `last_id`, paging from the newest one."""
+        if not last_id:
+            return await self.client.user_submissions(handle)
+        new = []
+        start = 1
+        while True:
+            page = await self.client.user_submissions(handle, start=start, count=self.page_size)
+            fresh = [sub for sub in page if sub.id > last_id]
+            new.extend(fresh)
+            if len(fresh) < len(page) or len(page) < self.page_size:
+                return new
+            start += self.page_size
+
+    async def solved(self, handle):
+        """Returns the set of problem ids `handle` has solved, refreshing it first."""
+        key = handle.lower()
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = [0, set(), None]
+            else:
+                self.hits += 1
+            new = await self._fetch_new(handle, entry[0])
+            ids = self._ids(entry)
+            for sub in new:
+                if sub.verdict == 'OK' and sub.contest_id is not None:
+                    pid = problem_id(sub.contest_id, sub.index)
+                    if pid is not None:
+                        ids.add(pid)
+            if new:
+                # Stop just before the oldest submission still being judged, so it is fetched again next time
+                pending = [sub.id for sub in new if sub.verdict in PENDING_VERDICTS]
+                entry[0] = max(entry[0], min(pending) - 1 if pending else max(sub.id for sub in new))
+                entry[2] = None
+                self.dirty = True
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_handles:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bits.pop(evicted, None)
+                evicted_lock = self._locks.get(evicted)
+                if evicted_lock is not None and not evicted_lock.locked():
+                    del self._locks[evicted]
+                self.dirty = True
+        return ids
+
+    def bits(self, handle, catalog):
+        """Returns the bitset over `catalog` of the problems `handle` has solved, as of the last `solved()`.
+
+        Rebuilt only when the catalog was re-indexed or new solves came in.
+        """
+        key = handle.lower()
+        entry = self._entries.get(key)
+        solved = self._ids(entry) if entry is not None else ()
+        cached = self._bits.get(key)
+        if cached is not None and cached[0] == catalog.generation and cached[1] == len(solved):
+            return cached[2]
+        bits = catalog.mask(solved)
+        self._bits[key] = (catalog.generation, len(solved), bits)
+        return bits
@@ -0,0 +1,41 @@
+# ratings.py
+
+# --- CONFIGURATION ---
+ELO_DEFAULT = 1500
+ELO_K = 32
+
+
+def expected_score(rating_a, rating_b):
+    """Probability that a player rated `rating_a` beats one rated `rating_b`."""
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def update(rating_a, rating_b, score_a, k=ELO_K):
+    """Returns both players' new ratings after a duel; `score_a` is 1, 0.5 or 0."""
+    delta = k * (score_a - expected_score(rating_a, rating_b))
+    return rating_a + delta, rating_b - delta
+
+
+def duel_score(winner_id, discord_id):
+    """Score of `discord_id` in a duel won by `winner_id` (None for a draw)."""
+    if winner_id is None:
+        return 0.5
+    return 1.0 if winner_id == discord_id else 0.0
+
+
+def replay(results, k=ELO_K, initial=ELO_DEFAULT):
+    """Recomputes ratings from scratch over `(player_a, player_b, score_a)` results in chronological order.
+
+    Same arithmetic as calling `update()` once per duel, inlined into one
+    loop; Elo is sequential, so every duel depends on the ones before it.
+    Returns `{player: rating}`.
+    """
+    ratings = {}
+    rating_of = ratings.get
+    initial = float(initial)
+    for a, b, score_a in results:
+        rating_a, rating_b = rating_of(a, initial), rating_of(b, initial)
+        delta = k * (score_a - 1 / (1 + 10 ** ((rating_b - rating_a) / 400)))
+        ratings[a] = rating_a + delta
+        ratings[b] = rating_b - delta
+    return ratings
@@ -0,0 +1,451 @@
+# storage.py
+
+import json
+import os
+import sqlite3
+import time
+from bisect import bisect_left, insort
+
+from ratings import ELO_DEFAULT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS users (
+    guild_id TEXT NOT NULL REFERENCES guilds(guild_id),
+    discord_id TEXT NOT NULL,
+    codeforces_handle TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    elo REAL NOT NULL DEFAULT 1500,
+    PRIMARY KEY (guild_id, discord_id)
+);
+CREATE INDEX IF NOT EXISTS users_handle ON users (guild_id, codeforces_handle COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS duels (
+    duel_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id TEXT NOT NULL,
+    challenger_id TEXT NOT NULL,
+    opponent_id TEXT NOT NULL,
+    channel_id TEXT,
+    contest_id INTEGER,
+    problem_index TEXT,
+    problem_name TEXT,
+    rating INTEGER NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    solve_seconds REAL,
+    winner_id TEXT,
+    status TEXT NOT NULL DEFAULT 'active'
+);
+CREATE INDEX IF NOT EXISTS duels_guild ON duels (guild_id, status);
+CREATE INDEX IF NOT EXISTS duels_time ON duels (guild_id, end_time);
+CREATE INDEX IF NOT EXISTS duels_challenger ON duels (guild_id, challenger_id, end_time);
+CREATE INDEX IF NOT EXISTS duels_opponent ON duels (guild_id, opponent_id, end_time);
+CREATE TABLE IF NOT EXISTS user_stats (
+    guild_id TEXT NOT NULL,
+    discord_id TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    draws INTEGER NOT NULL DEFAULT 0,
+    solve_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, discord_id, rating)
+);
+CREATE TABLE IF NOT EXISTS head_to_head (
+    guild_id TEXT NOT NULL,
+    discord_id TEXT NOT NULL,
+    opponent_id TEXT NOT NULL,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    draws INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, discord_id, opponent_id)
+);
+CREATE TABLE IF NOT EXISTS tournaments (
+    tournament_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id TEXT NOT NULL,
+    channel_id TEXT,
+    status TEXT NOT NULL DEFAULT 'open',
+    state TEXT NOT NULL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tournaments_guild ON tournaments (guild_id, status);
+"""
+
+
+class Storage:
+    """SQLite-backed store for guilds, registered users and duels.
+
+    The database runs in WAL mode, so reads never wait for writers and each
+    command only touches the rows it needs. Users are read a guild at a time
+    and written back in batches by UserCache, the only way the bot changes them.
+
+    The duels table doubles as the duel history. Per-rating and head-to-head
+    records are kept up to date in the same transaction that settles a duel,
+    so statistics never have to be recomputed from the history.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def close(self):
+        self.conn.close()
+
+    def _migrate(self):
+        """Adds columns introduced after a database was first created."""
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(duels)')}
+        for column, kind in (('channel_id', 'TEXT'), ('problem_name', 'TEXT'), ('solve_seconds', 'REAL')):
+            if column not in columns:
+                self._write(f'ALTER TABLE duels ADD COLUMN {column} {kind}')
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(users)')}
+        if 'elo' not in columns:
+            self._write(f'ALTER TABLE users ADD COLUMN elo REAL NOT NULL DEFAULT {ELO_DEFAULT}')
+        # Duels settled before statistics existed are counted once
+        if self.conn.execute('SELECT 1 FROM user_stats LIMIT 1').fetchone() is None:
+            with self.conn:
+                for row in self.conn.execute("SELECT * FROM duels WHERE status != 'active' ORDER BY duel_id").fetchall():
+                    self._record_result(row, row['winner_id'], row['solve_seconds'])
+
+    def _write(self, sql, params=()):
+        with self.conn:
+            return self.conn.execute(sql, params)
+
+    # --- USERS ---
+    def get_guild_users(self, guild_id):
+        """Returns every registered user of a guild as `{discord_id: user}`."""
+        rows = self.conn.execute(
+            'SELECT discord_id, codeforces_handle, points, elo FROM users WHERE guild_id = ?', (guild_id,)
+        ).fetchall()
+        return {row['discord_id']: {'codeforces_handle': row['codeforces_handle'], 'points': row['points'], 'elo': row['elo']} for row in rows}
+
+    def upsert_users(self, rows):
+        """Writes `(guild_id, discord_id, codeforces_handle, points, elo)` rows in one transaction."""
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)', {(row[0],) for row in rows})
+            self.conn.executemany(
+                'INSERT INTO users (guild_id, discord_id, codeforces_handle, points, elo) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (guild_id, discord_id) DO UPDATE SET '
+                'codeforces_handle = excluded.codeforces_handle, points = excluded.points, elo = excluded.elo',
+                rows
+            )
+
+    # --- DUELS ---
+    def start_duel(self, guild_id, challenger_id, opponent_id, problem, rating, start_time=None, channel_id=None):
+        """Records a started duel and returns its id.
+
+        Returns None instead if either player already has an active duel in
+        the guild; the check and insert are one statement, so two processes
+        sharing the database cannot both start one.
+        """
+        cursor = self._write(
+            'INSERT INTO duels (guild_id, channel_id, challenger_id, opponent_id, contest_id, problem_index, problem_name, rating, start_time) '
+            'SELECT ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ('
+            "SELECT 1 FROM duels WHERE guild_id = ? AND status = 'active' AND ("
+            'challenger_id IN (?, ?) OR opponent_id IN (?, ?)))',
+            (guild_id, channel_id, challenger_id, opponent_id, problem['contestId'], problem['index'], problem.get('name'), rating, start_time or time.time(),
+             guild_id, challenger_id, opponent_id, challenger_id, opponent_id)
+        )
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def active_duels(self):
+        """Returns the rows of every duel that has not been settled yet."""
+        return self.conn.execute("SELECT * FROM duels WHERE status = 'active'").fetchall()
+
+    def finish_duel(self, duel_id, winner_id=None, end_time=None, solve_seconds=None):
+        """Marks a duel as won by `winner_id`, or drawn when there is no winner, and updates statistics.
+
+        Returns False if the duel was not active.
+        """
+        with self.conn:
+            # Only one writer can flip the status, even across processes sharing the database
+            row = self.conn.execute(
+                "UPDATE duels SET status = ?, winner_id = ?, end_time = ?, solve_seconds = ? WHERE duel_id = ? AND status = 'active' RETURNING *",
+                ('won' if winner_id else 'draw', winner_id, end_time or time.time(), solve_seconds, duel_id)
+            ).fetchone()
+            if row is None:
+                return False
+            self._record_result(row, winner_id, solve_seconds)
+        return True
+
+    def _record_result(self, row, winner_id, solve_seconds):
+        """Adds one settled duel to both players' statistics. Must run inside a transaction."""
+        players = (row['challenger_id'], row['opponent_id'])
+        for discord_id, opponent_id in (players, players[::-1]):
+            win = int(winner_id == discord_id)
+            loss = int(winner_id == opponent_id)
+            draw = int(winner_id is None)
+            self.conn.execute(
+                'INSERT INTO user_stats (guild_id, discord_id, rating, wins, losses, draws, solve_seconds) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (guild_id, discord_id, rating) DO UPDATE SET '
+                'wins = wins + excluded.wins, losses = losses + excluded.losses, draws = draws + excluded.draws, '
+                'solve_seconds = solve_seconds + excluded.solve_seconds',
+                (row['guild_id'], discord_id, row['rating'], win, loss, draw, (solve_seconds or 0) if win else 0)
+            )
+            self.conn.execute(
+                'INSERT INTO head_to_head (guild_id, discord_id, opponent_id, wins, losses, draws) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (guild_id, discord_id, opponent_id) DO UPDATE SET '
+                'wins = wins + excluded.wins, losses = losses + excluded.losses, draws = draws + excluded.draws',
+                (row['guild_id'], discord_id, opponent_id, win, loss, draw)
+            )
+
+    # --- STATISTICS ---
+    def get_stats(self, guild_id, discord_id):
+        """Returns a user's win/loss/draw totals, average solve time and per-rating records."""
+        rows = self.conn.execute(
+            'SELECT rating, wins, losses, draws, solve_seconds FROM user_stats '
+            'WHERE guild_id = ? AND discord_id = ? ORDER BY rating',
+            (guild_id, discord_id)
+        ).fetchall()
+        wins = sum(row['wins'] for row in rows)
+        solve_seconds = sum(row['solve_seconds'] for row in rows)
+        return {
+            'wins': wins,
+            'losses': sum(row['losses'] for row in rows),
+            'draws': sum(row['draws'] for row in rows),
+            'average_solve_seconds': solve_seconds / wins if wins else None,
+            'by_rating': {row['rating']: (row['wins'], row['losses'], row['draws']) for row in rows},
+        }
+
+    def head_to_head(self, guild_id, discord_id, opponent_id):
+        """Returns `(wins, losses, draws)` of `discord_id` against `opponent_id`."""
+        row = self.conn.execute(
+            'SELECT wins, losses, draws FROM head_to_head WHERE guild_id = ? AND discord_id = ? AND opponent_id = ?',
+            (guild_id, discord_id, opponent_id)
+        ).fetchone()
+        return tuple(row) if row else (0, 0, 0)
+
+    def duel_results(self, guild_id):
+        """Returns `(challenger_id, opponent_id, winner_id)` for every settled duel of a guild, oldest first."""
+        return self.conn.execute(
+            "SELECT challenger_id, opponent_id, winner_id FROM duels WHERE guild_id = ? AND status != 'active' "
+            "ORDER BY end_time, duel_id",
+            (guild_id,)
+        ).fetchall()
+
+    def pair_problems(self, guild_id, first_id, second_id):
+        """Returns `(contest_id, problem_index)` of every duel between two users, whoever challenged."""
+        return self.conn.execute(
+            "SELECT contest_id, problem_index FROM duels WHERE guild_id = ? AND challenger_id = ? AND opponent_id = ? "
+            "UNION SELECT contest_id, problem_index FROM duels WHERE guild_id = ? AND challenger_id = ? AND opponent_id = ?",
+            (guild_id, first_id, second_id, guild_id, second_id, first_id)
+        ).fetchall()
+
+    def recent_duels(self, guild_id, discord_id, limit=5):
+        """Returns a user's most recently settled duels, newest first."""
+        return self.conn.execute(
+            "SELECT * FROM (SELECT * FROM duels WHERE guild_id = ? AND challenger_id = ? AND status != 'active' "
+            "ORDER BY end_time DESC LIMIT ?) UNION ALL "
+            "SELECT * FROM (SELECT * FROM duels WHERE guild_id = ? AND opponent_id = ? AND status != 'active' "
+            "ORDER BY end_time DESC LIMIT ?) ORDER BY end_time DESC LIMIT ?",
+            (guild_id, discord_id, limit, guild_id, discord_id, limit, limit)
+        ).fetchall()
+
+    # --- TOURNAMENTS ---
+    def create_tournament(self, guild_id, channel_id, state):
+        """Stores a new tournament's JSON state and returns its id."""
+        return self._write(
+            'INSERT INTO tournaments (guild_id, channel_id, state, updated_at) VALUES (?, ?, ?, ?)',
+            (guild_id, channel_id, state, time.time())
+        ).lastrowid
+
+    def save_tournament(self, tournament_id, status, state):
+        self._write(
+            'UPDATE tournaments SET status = ?, state = ?, updated_at = ? WHERE tournament_id = ?',
+            (status, state, time.time(), tournament_id)
+        )
+
+    def active_tournaments(self):
+        """Returns the tournaments that are open for sign-ups or running."""
+        return self.conn.execute("SELECT * FROM tournaments WHERE status IN ('open', 'running')").fetchall()
+
+    # --- MIGRATION ---
+    def migrate_json(self, users_file):
+        """Imports a legacy users.json once, then renames it so it is never imported again."""
+        if not os.path.exists(users_file):
+            return 0
+        try:
+            with open(users_file, 'r') as f:
+                all_data = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+        count = 0
+        with self.conn:
+            for guild_id, server_users in all_data.items():
+                self.conn.execute('INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)', (guild_id,))
+                for discord_id, data in server_users.items():
+                    cursor = self.conn.execute(
+                        'INSERT OR IGNORE INTO users (guild_id, discord_id, codeforces_handle, points) VALUES (?, ?, ?, ?)',
+                        (guild_id, discord_id, data['codeforces_handle'], data.get('points', 0))
+                    )
+                    count += cursor.rowcount
+        os.replace(users_file, users_file + '.migrated')
+        return count
+
+
+class RankIndex:
+    """The users of one guild kept sorted by points, highest first.
+
+    Entries are `(-points, discord_id)` tuples in a sorted list, so a user's
+    rank is a binary search and a leaderboard page is a slice.
+    """
+
+    def __init__(self, server_users):
+        self._entries = sorted((-data['points'], discord_id) for discord_id, data in server_users.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, discord_id, points):
+        insort(self._entries, (-points, discord_id))
+
+    def update(self, discord_id, old_points, new_points):
+        del self._entries[bisect_left(self._entries, (-old_points, discord_id))]
+        insort(self._entries, (-new_points, discord_id))
+
+    def rank(self, discord_id, points):
+        """Returns the 1-based rank of a user with `points`."""
+        return bisect_left(self._entries, (-points, discord_id)) + 1
+
+    def page(self, start, count):
+        """Returns `(discord_id, points)` pairs for ranks `start + 1` to `start + count`."""
+        return [(discord_id, -points) for points, discord_id in self._entries[start:start + count]]
+
+
+class UserCache:
+    """In-memory, authoritative copy of the users table with write-behind flushes.
+
+    A guild's users are loaded on first access. Changes are applied in memory
+    immediately and the affected rows are marked dirty; `flush()` writes all
+    dirty rows in a single transaction, so a crash can never leave a
+    half-written update behind.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._guilds = {}
+        self._ranks = {}
+        self._dirty = set()
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.hits = 0    # guild lookups answered from memory
+        self.misses = 0  # guilds loaded from the database
+
+    @property
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def stats(self):
+        """Returns the flush counters as a dict."""
+        return {
+            'cached_guilds': len(self._guilds),
+            'dirty_entries': self.dirty_count,
+            'flushes': self.flushes,
+            'rows_flushed': self.rows_flushed,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _guild(self, guild_id):
+        server_users = self._guilds.get(guild_id)
+        if server_users is None:
+            self.misses += 1
+            server_users = self._guilds[guild_id] = self.storage.get_guild_users(guild_id)
+        else:
+            self.hits += 1
+        return server_users
+
+    # --- READS ---
+    def get_user(self, guild_id, discord_id):
+        """Returns `{'codeforces_handle', 'points', 'elo'}` for a registered user, or None."""
+        return self._guild(guild_id).get(discord_id)
+
+    def get_guild_users(self, guild_id):
+        """Returns every registered user of a guild as `{discord_id: user}`."""
+        return self._guild(guild_id)
+
+    def ranking(self, guild_id):
+        """Returns the guild's RankIndex, building it on first use."""
+        ranks = self._ranks.get(guild_id)
+        if ranks is None:
+            ranks = self._ranks[guild_id] = RankIndex(self._guild(guild_id))
+        return ranks
+
+    def handle_owner(self, guild_id, handle):
+        """Returns the discord id registered with `handle` in a guild (case-insensitive), or None."""
+        handle = handle.lower()
+        for discord_id, data in self._guild(guild_id).items():
+            if data['codeforces_handle'].lower() == handle:
+                return discord_id
+        return None
+
+    # --- WRITES ---
+    def add_user(self, guild_id, discord_id, handle):
+        """Registers a user. Returns False if they were already registered."""
+        server_users = self._guild(guild_id)
+        if discord_id in server_users:
+            return False
+        server_users[discord_id] = {'codeforces_handle': handle, 'points': 0, 'elo': ELO_DEFAULT}
+        if guild_id in self._ranks:
+            self._ranks[guild_id].add(discord_id, 0)
+        self._dirty.add((guild_id, discord_id))
+        return True
+
+    def set_handle(self, guild_id, discord_id, handle):
+        self._guild(guild_id)[discord_id]['codeforces_handle'] = handle
+        self._dirty.add((guild_id, discord_id))
+
+    def add_points(self, guild_id, discord_id, points):
+        """Adds `points` to a user and returns their new total."""
+        user = self._guild(guild_id).get(discord_id)
+        if user is None:
+            return None
+        old_points = user['points']
+        user['points'] += points
+        if guild_id in self._ranks:
+            self._ranks[guild_id].update(discord_id, old_points, user['points'])
+        self._dirty.add((guild_id, discord_id))
+        return user['points']
+
+    def set_elo(self, guild_id, discord_id, elo):
+        user = self._guild(guild_id).get(discord_id)
+        if user is not None:
+            user['elo'] = elo
+            self._dirty.add((guild_id, discord_id))
+
+    def flush(self, keys=None):
+        """Writes every dirty row to the database in one transaction.
+
+        With `keys`, a list of `(guild_id, discord_id)`, only those rows are
+        written, for changes that must not wait for the next flush.
+        """
+        if keys is None:
+            dirty, self._dirty = self._dirty, set()
+        else:
+            dirty = self._dirty.intersection(keys)
+            self._dirty -= dirty
+        if not dirty:
+            return 0
+        rows = []
+        for guild_id, discord_id in dirty:
+            user = self._guilds[guild_id][discord_id]
+            rows.append((guild_id, discord_id, user['codeforces_handle'], user['points'], user['elo']))
+        start = time.perf_counter()
+        try:
+            self.storage.upsert_users(rows)
+        except Exception:
+            self._dirty |= dirty
+            raise
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        self.flushes += 1
+        self.rows_flushed += len(rows)
+        return len(rows)
@@ -0,0 +1,505 @@
+# tournaments.py
+
+import asyncio
+import json
+import math
+import time
+from bisect import bisect_left, insort
+
+from codeforces import POLLER_RATE, PENDING_VERDICTS
+from duels import SubmissionFeed
+
+# --- CONFIGURATION ---
+FORMATS = ('swiss', 'elimination')
+ROUND_PROBLEMS = 3  # Problems per round
+ROUND_MINUTES = 45  # Length of a round
+ROUND_BREAK = 120  # Seconds between the end of a round and the start of the next
+PENALTY_MINUTES = 20  # ICPC penalty per rejected attempt on a problem that is solved later
+POLL_INTERVAL = 20  # Seconds between submission polls of a running round
+FINAL_GRACE = 300  # Seconds a round may stay open past its deadline while verdicts are pending or fetches fail
+TOURNAMENT_RATE = POLLER_RATE / 2  # API calls per second the tournament poller may use
+# Rejected attempts that do not count towards the penalty, as in ICPC
+FREE_VERDICTS = ('COMPILATION_ERROR', 'SKIPPED')
+
+
+class Scoreboard:
+    """ICPC standings of one round, kept sorted as submissions come in.
+
+    Every entrant has a cell per problem holding the time of its first
+    accepted submission and the times of its rejected ones. Entrants are
+    ranked by problems solved, then penalty (minutes from the round start to
+    each accepted submission plus PENALTY_MINUTES per earlier rejection),
+    then the time of the last accepted submission. A submission only
+    recomputes its entrant's row and moves it in the sorted list, so the
+    standings are never rebuilt from scratch.
+    """
+
+    def __init__(self, entrants, problem_count, start):
+        self.problem_count = problem_count
+        self.start = start
+        self.cells = {}  # (entrant, problem number) -> [first accepted time or None, sorted rejected times]
+        self.rows = {entrant: (0, 0, 0) for entrant in entrants}  # entrant -> (solved, penalty, last accepted)
+        self._order = sorted(self._key(entrant, row) for entrant, row in self.rows.items())
+        self._seen = set()  # ids of the submissions already counted
+
+    @staticmethod
+    def _key(entrant, row):
+        solved, penalty, last = row
+        return (-solved, penalty, last, entrant)
+
+    def add(self, entrant, number, sub_id, when, verdict):
+        """Counts one judged submission of `entrant` on problem `number`. Returns True if the standings changed."""
+        if sub_id in self._seen or verdict in FREE_VERDICTS:
+            return False
+        self._seen.add(sub_id)
+        cell = self.cells.setdefault((entrant, number), [None, []])
+        if verdict == 'OK':
+            if cell[0] is not None and cell[0] <= when:
+                return False
+            cell[0] = when
+        else:
+            insort(cell[1], when)
+            if cell[0] is None or when > cell[0]:
+                return False
+        self._update(entrant)
+        return True
+
+    def _update(self, entrant):
+        solved = penalty = last = 0
+        for number in range(self.problem_count):
+            cell = self.cells.get((entrant, number))
+            if cell is None or cell[0] is None:
+                continue
+            accepted, rejected = cell
+            solved += 1
+            penalty += int(accepted - self.start) // 60 + PENALTY_MINUTES * bisect_left(rejected, accepted)
+            last = max(last, accepted)
+        old = self.rows[entrant]
+        new = (solved, penalty, last)
+        if new == old:
+            return
+        del self._order[bisect_left(self._order, self._key(entrant, old))]
+        insort(self._order, self._key(entrant, new))
+        self.rows[entrant] = new
+
+    def cell(self, entrant, number):
+        """Returns `(accepted time or None, rejected attempts before it)` for one problem."""
+        accepted, rejected = self.cells.get((entrant, number), (None, ()))
+        return accepted, (len(rejected) if accepted is None else bisect_left(rejected, accepted))
+
+    def standings(self):
+        """Returns `(entrant, solved, penalty)` for every entrant, best first."""
+        return [(entrant, -solved, penalty) for solved, penalty, _, entrant in self._order]
+
+    def key(self, entrant):
+        """A key that sorts better results first; equal keys mean equal results."""
+        return self._key('', self.rows[entrant])
+
+    def all_solved(self):
+        return all(row[0] == self.problem_count for row in self.rows.values())
+
+    def to_dict(self):
+        return {
+            'start': self.start,
+            'problem_count': self.problem_count,
+            'entrants': list(self.rows),
+            'cells': [[entrant, number, accepted, rejected] for (entrant, number), (accepted, rejected) in self.cells.items()],
+            'seen': list(self._seen),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        board = cls(data['entrants'], data['problem_count'], data['start'])
+        board._seen = set(data['seen'])
+        for entrant, number, accepted, rejected in data['cells']:
+            board.cells[(entrant, number)] = [accepted, rejected]
+        for entrant in board.rows:
+            board._update(entrant)
+        return board
+
+
+def bracket_order(size):
+    """Seed numbers (0-based) in bracket order for a bracket of `size`, a power of two.
+
+    Adjacent seeds meet in the first round, and the top two seeds can only
+    meet in the final: 4 -> [0, 3, 1, 2].
+    """
+    order = [0]
+    while len(order) < size:
+        total = len(order) * 2
+        order = [seed for top in order for seed in (top, total - 1 - top)]
+    return order
+
+
+class Tournament:
+    """A Swiss or single-elimination tournament of one guild.
+
+    Entrants are single players or teams; a team counts a problem as solved
+    as soon as any member solves it. Every round has its own problem set and
+    ICPC scoreboard, shared by all matches of the round, and each match is
+    won by the entrant ranked higher on that scoreboard. A Swiss win is worth
+    one point, a draw (equal solves and penalty) half a point, and a bye one
+    point; in the elimination bracket a tie goes to the higher seed.
+    """
+
+    def __init__(self, guild_id, channel_id, fmt, low, high, problem_count=ROUND_PROBLEMS,
+                 round_minutes=ROUND_MINUTES, rounds=None):
+        self.tournament_id = None
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.format = fmt
+        self.low = low
+        self.high = high
+        self.problem_count = problem_count
+        self.round_minutes = round_minutes
+        self.rounds = rounds  # fixed when the tournament starts, unless given
+        self.status = 'open'  # open -> running -> finished
+        self.entrants = {}  # entrant id -> {'name', 'members', 'seed', 'points', 'opponents', 'bye', 'out'}
+        self.bracket = []  # elimination: entrant ids (None for byes) in bracket order
+        self.history = []  # finished rounds: {'number', 'matches': [[a, b, winner or None]], 'bye'}
+        self.used = []  # [contestId, index] of every problem set so far
+        self.round = None  # {'number', 'problems', 'start', 'deadline', 'matches', 'bye'}
+        self.scoreboard = None
+        self.next_round_at = None
+
+    # --- ENTRANTS ---
+    def add_entrant(self, entrant_id, name, members, seed):
+        self.entrants[entrant_id] = {
+            'name': name, 'members': list(members), 'seed': seed,
+            'points': 0.0, 'opponents': [], 'bye': False, 'out': False,
+        }
+
+    def entrant_of(self, discord_id):
+        for entrant_id, entrant in self.entrants.items():
+            if discord_id in entrant['members']:
+                return entrant_id
+        return None
+
+    def members(self):
+        return [discord_id for entrant in self.entrants.values() for discord_id in entrant['members']]
+
+    def seeded(self):
+        """Entrant ids by seed (average Elo of the members), best first."""
+        return sorted(self.entrants, key=lambda e: (-self.entrants[e]['seed'], e))
+
+    def standings(self):
+        """Entrant ids in tournament order: Swiss points with Buchholz (opponents' points) as the tie-break,
+        or how far each got in the bracket.
+        """
+        if self.format == 'swiss':
+            def key(e):
+                entrant = self.entrants[e]
+                buchholz = sum(self.entrants[o]['points'] for o in entrant['opponents'])
+                return (-entrant['points'], -buchholz, -entrant['seed'], e)
+        else:
+            def key(e):
+                entrant = self.entrants[e]
+                # Still in first, then by the round they went out in, latest first
+                return (-(math.inf if entrant['out'] is False else entrant['out']), -entrant['seed'], e)
+        return sorted(self.entrants, key=key)
+
+    # --- ROUNDS ---
+    def total_rounds(self):
+        return max(1, math.ceil(math.log2(max(2, len(self.entrants)))))
+
+    def pairings(self):
+        """Returns `(matches, bye)` for the next round."""
+        if self.format == 'elimination':
+            if not self.bracket:
+                seeded = self.seeded()
+                size = 1 << (len(seeded) - 1).bit_length()
+                self.bracket = [seeded[seed] if seed < len(seeded) else None for seed in bracket_order(size)]
+            matches, bye = [], None
+            for a, b in zip(self.bracket[::2], self.bracket[1::2]):
+                if a is None or b is None:
+                    bye = bye or []
+                    bye.append(a or b)
+                else:
+                    matches.append((a, b))
+            return matches, bye
+        order = self.standings()
+        bye = None
+        if len(order) % 2:
+            # The lowest-ranked entrant that has not had a bye sits out
+            bye = next((e for e in reversed(order) if not self.entrants[e]['bye']), order[-1])
+            order.remove(bye)
+            bye = [bye]
+        matches = []
+        while order:
+            a = order.pop(0)
+            # Avoid rematches where the standings allow it
+            i = next((i for i, b in enumerate(order) if b not in self.entrants[a]['opponents']), 0)
+            matches.append((a, order.pop(i)))
+        return matches, bye
+
+    def begin_round(self, problems, now):
+        matches, bye = self.pairings()
+        number = len(self.history) + 1
+        self.round = {
+            'number': number,
+            'problems': problems,
+            'start': now,
+            'deadline': now + self.round_minutes * 60,
+            'matches': [list(match) for match in matches],
+            'bye': bye or [],
+        }
+        self.used.extend([p['contestId'], p['index']] for p in problems)
+        self.scoreboard = Scoreboard([e for match in matches for e in match], len(problems), now)
+        self.status = 'running'
+        self.next_round_at = None
+        return self.round
+
+    def end_round(self, now):
+        """Scores the matches of the current round and returns the finished round's record."""
+        board = self.scoreboard
+        results = []
+        for a, b in self.round['matches']:
+            key_a, key_b = board.key(a), board.key(b)
+            if key_a < key_b:
+                winner = a
+            elif key_b < key_a:
+                winner = b
+            elif self.format == 'elimination':
+                winner = min((a, b), key=lambda e: (-self.entrants[e]['seed'], e))
+            else:
+                winner = None
+            self.entrants[a]['opponents'].append(b)
+            self.entrants[b]['opponents'].append(a)
+            if winner is None:
+                self.entrants[a]['points'] += 0.5
+                self.entrants[b]['points'] += 0.5
+            else:
+                self.entrants[winner]['points'] += 1
+                loser = b if winner == a else a
+                if self.format == 'elimination':
+                    self.entrants[loser]['out'] = self.round['number']
+            results.append([a, b, winner])
+        for e in self.round['bye']:
+            self.entrants[e]['points'] += 1
+            self.entrants[e]['bye'] = True
+        if self.format == 'elimination':
+            self.bracket = [e for e in self.bracket if e is not None and self.entrants[e]['out'] is False]
+        record = {'number': self.round['number'], 'matches': results, 'bye': self.round['bye']}
+        self.history.append(record)
+        self.round = None
+        self.scoreboard = None
+        if len(self.history) >= self.rounds or (self.format == 'elimination' and len(self.bracket) <= 1):
+            self.status = 'finished'
+        else:
+            self.next_round_at = now + ROUND_BREAK
+        return record
+
+    def to_dict(self):
+        return {
+            'guild_id': self.guild_id, 'channel_id': self.channel_id, 'format': self.format,
+            'low': self.low, 'high': self.high, 'problem_count': self.problem_count,
+            'round_minutes': self.round_minutes, 'rounds': self.rounds, 'status': self.status,
+            'entrants': self.entrants, 'bracket': self.bracket, 'history': self.history, 'used': self.used,
+            'round': self.round, 'scoreboard': self.scoreboard.to_dict() if self.scoreboard else None,
+            'next_round_at': self.next_round_at,
+        }
+
+    @classmethod
+    def from_dict(cls, tournament_id, data):
+        tournament = cls(data['guild_id'], data['channel_id'], data['format'], data['low'], data['high'],
+                         data['problem_count'], data['round_minutes'], data['rounds'])
+        tournament.tournament_id = tournament_id
+        for key in ('status', 'entrants', 'bracket', 'history', 'used', 'round', 'next_round_at'):
+            setattr(tournament, key, data[key])
+        if data['scoreboard'] is not None:
+            tournament.scoreboard = Scoreboard.from_dict(data['scoreboard'])
+        return tournament
+
+
+class TournamentManager:
+    """Runs the tournaments of every guild, at most one per guild.
+
+    One background loop drives all of them: it starts rounds when their
+    break is over, ends them at the deadline (or once every entrant solved
+    everything), and polls submissions. Each poll fetches every participant
+    of every running round once through a shared SubmissionFeed, and feeds
+    the new submissions into the round scoreboards. Tournaments are saved to
+    the database whenever they change, so they survive restarts.
+
+    `pick_problems(tournament, discord_ids)` must be set to a coroutine that
+    returns the problem set of a new round, or None. `on_round_start`,
+    `on_round_end` and `on_finish` are called with the tournament (and the
+    finished round's record) to announce progress.
+    """
+
+    def __init__(self, storage, client, handle_of, clock=time.time, poll_interval=POLL_INTERVAL, rate=TOURNAMENT_RATE):
+        self.storage = storage
+        self.handle_of = handle_of  # (guild_id, discord_id) -> Codeforces handle
+        self.pick_problems = None
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.rate = rate
+        self.feed = SubmissionFeed(client)
+        self.tournaments = {}  # guild_id -> open or running tournament
+        self.on_round_start = None
+        self.on_round_end = None
+        self.on_finish = None
+        self._next_poll = 0.0
+        self._unsettled = set()  # tournaments with pending verdicts or failed fetches in the last poll
+        self._task = None
+
+    # --- LIFECYCLE ---
+    def get(self, guild_id):
+        return self.tournaments.get(guild_id)
+
+    def create(self, guild_id, channel_id, fmt, low, high, problem_count=ROUND_PROBLEMS,
+               round_minutes=ROUND_MINUTES, rounds=None):
+        """Opens a tournament for sign-ups, or returns None if the guild already has one."""
+        if guild_id in self.tournaments:
+            return None
+        tournament = Tournament(guild_id, channel_id, fmt, low, high, problem_count, round_minutes, rounds)
+        tournament.tournament_id = self.storage.create_tournament(guild_id, channel_id, json.dumps(tournament.to_dict()))
+        self.tournaments[guild_id] = tournament
+        return tournament
+
+    def save(self, tournament):
+        self.storage.save_tournament(tournament.tournament_id, tournament.status, json.dumps(tournament.to_dict()))
+        if tournament.status in ('finished', 'cancelled'):
+            self.tournaments.pop(tournament.guild_id, None)
+
+    def cancel(self, tournament):
+        tournament.status = 'cancelled'
+        self.save(tournament)
+
+    async def start(self, tournament):
+        """Closes sign-ups and starts the first round.
+
+        Returns False if the tournament was already started, was cancelled
+        while problems were picked, or no problem set could be picked; in the
+        last case sign-ups stay open.
+        """
+        if tournament.status != 'open':
+            return False
+        tournament.status = 'starting'
+        rounds = tournament.rounds
+        if rounds is None or tournament.format == 'elimination':
+            tournament.rounds = tournament.total_rounds()
+        try:
+            started = await self._begin_round(tournament)
+        finally:
+            if tournament.status == 'starting':
+                tournament.status = 'open'
+                tournament.rounds = rounds
+        return started
+
+    async def _begin_round(self, tournament):
+        problems = await self.pick_problems(tournament, tournament.members())
+        # Picking can take minutes of rate-limited calls; the tournament may have been cancelled meanwhile
+        if not problems or tournament.status == 'cancelled':
+            return False
+        tournament.begin_round(problems, self.clock())
+        self.save(tournament)
+        self._next_poll = min(self._next_poll, self.clock() + self.poll_interval)
+        if self.on_round_start is not None:
+            await self.on_round_start(tournament)
+        return True
+
+    async def _end_round(self, tournament):
+        record = tournament.end_round(self.clock())
+        self.save(tournament)
+        if self.on_round_end is not None:
+            await self.on_round_end(tournament, record)
+        if tournament.status == 'finished' and self.on_finish is not None:
+            await self.on_finish(tournament)
+
+    # --- POLLING ---
+    def _running(self):
+        return [t for t in self.tournaments.values() if t.round is not None]
+
+    async def poll(self, tournaments=None):
+        """Fetches the new submissions of every participant of the running rounds in one batch.
+
+        Returns the tournaments whose standings changed. Tournaments with a
+        submission still being judged, or a player whose submissions could
+        not be fetched, are remembered so their round is not ended too early.
+        """
+        tournaments = self._running() if tournaments is None else tournaments
+        wanted = {}
+        players = []  # (tournament, entrant id, handle)
+        for tournament in tournaments:
+            for entrant_id in tournament.scoreboard.rows:
+                for discord_id in tournament.entrants[entrant_id]['members']:
+                    handle = self.handle_of(tournament.guild_id, discord_id)
+                    wanted[handle] = min(wanted.get(handle, float('inf')), tournament.round['start'])
+                    players.append((tournament, entrant_id, handle))
+        fetched = await self.feed.fetch_all(wanted)
+
+        changed = set()
+        self._unsettled.difference_update(tournaments)
+        for tournament, entrant_id, handle in players:
+            if handle not in fetched:
+                self._unsettled.add(tournament)
+                continue
+            round_ = tournament.round
+            numbers = {(p['contestId'], p['index']): number for number, p in enumerate(round_['problems'])}
+            for sub in fetched[handle]:
+                number = numbers.get((sub['problem'].get('contestId'), sub['problem'].get('index')))
+                if number is None or not round_['start'] <= sub['creationTimeSeconds'] <= round_['deadline']:
+                    continue
+                if sub.get('verdict') in PENDING_VERDICTS:
+                    self._unsettled.add(tournament)
+                    continue
+                if tournament.scoreboard.add(entrant_id, number, sub['id'], sub['creationTimeSeconds'], sub['verdict']):
+                    changed.add(tournament)
+        for tournament in changed:
+            self.save(tournament)
+        return changed
+
+    async def tick(self):
+        """Starts and ends the rounds that are due and polls the running ones when a poll is due."""
+        now = self.clock()
+        for tournament in list(self.tournaments.values()):
+            if tournament.round is None and tournament.status == 'running' and tournament.next_round_at <= now:
+                if not await self._begin_round(tournament) and tournament.status != 'cancelled':
+                    # Nothing left to pick in the range: the tournament ends with the rounds played
+                    tournament.status = 'finished'
+                    self.save(tournament)
+                    if self.on_finish is not None:
+                        await self.on_finish(tournament)
+
+        running = self._running()
+        ending = [t for t in running if t.round['deadline'] <= now or t.scoreboard.all_solved()]
+        if ending or (running and now >= self._next_poll):
+            # Polling every handle once per interval must fit into the poller's share of the rate limit
+            handles = sum(len(t.entrants[e]['members']) for t in running for e in t.scoreboard.rows)
+            self._next_poll = now + max(self.poll_interval, handles / self.rate)
+            await self.poll(running)
+        for tournament in ending:
+            if tournament.status == 'cancelled':
+                continue
+            if tournament in self._unsettled and now < tournament.round['deadline'] + FINAL_GRACE:
+                continue
+            self._unsettled.discard(tournament)
+            await self._end_round(tournament)
+
+    # --- PERSISTENCE ---
+    def restore(self, owns_guild=None):
+        """Reloads the open and running tournaments, for the guilds `owns_guild` accepts."""
+        for row in self.storage.active_tournaments():
+            if owns_guild is not None and not owns_guild(row['guild_id']):
+                continue
+            self.tournaments[row['guild_id']] = Tournament.from_dict(row['tournament_id'], json.loads(row['state']))
+        return len(self.tournaments)
+
+    # --- BACKGROUND LOOP ---
+    def start_loop(self, interval=1.0):
+        """Starts ticking every `interval` seconds if the loop is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(interval))
+
+    def stop_loop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self, interval):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Error in tournament loop: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,150 @@
+# verification.py
+
+import asyncio
+import re
+import time
+
+from codeforces import CodeforcesError
+
+# --- CONFIGURATION ---
+VERIFY_INTERVAL = 3  # Seconds between batched user.info calls
+VERIFY_FIRST_CHECK = 10  # Give Codeforces this long to pick up a name change
+VERIFY_RETRY = 15  # Seconds between checks of a token that did not match yet
+VERIFY_GRACE = 120  # A token that still does not match after this long fails
+VERIFY_BATCH_SIZE = 300  # Handles per user.info call
+
+NOT_FOUND = re.compile(r'User with handle (\S+) not found')
+
+
+class HandleVerifier:
+    """Groups handle lookups and verification-token checks into batched user.info calls.
+
+    Commands await `lookup()` or `verify()`; a single background task wakes
+    every VERIFY_INTERVAL seconds and answers all of them with one
+    `user.info?handles=a;b;c` request per VERIFY_BATCH_SIZE handles. Token
+    checks are retried until the first name matches or VERIFY_GRACE runs out.
+    """
+
+    def __init__(self, client, interval=VERIFY_INTERVAL, first_check=VERIFY_FIRST_CHECK, retry=VERIFY_RETRY,
+                 grace=VERIFY_GRACE, batch_size=VERIFY_BATCH_SIZE):
+        self.client = client
+        self.interval = interval
+        self.first_check = first_check
+        self.retry = retry
+        self.grace = grace
+        self.batch_size = batch_size
+        self.calls = 0
+        self._lookups = {}  # lowercase handle -> (handle, [futures])
+        self._checks = []   # pending token checks
+        self._task = None
+
+    @property
+    def pending(self):
+        return len(self._lookups) + len(self._checks)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def lookup(self, handle):
+        """Returns the Codeforces `User` for `handle`, or None if it does not exist."""
+        future = asyncio.get_running_loop().create_future()
+        self._lookups.setdefault(handle.lower(), (handle, []))[1].append(future)
+        self._ensure_running()
+        return await future
+
+    async def verify(self, handle, token):
+        """Waits until the first name of `handle` equals `token`.
+
+        Returns False if it still does not match after the grace window.
+        """
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._checks.append({
+            'handle': handle,
+            'token': token,
+            'future': future,
+            'next_check': now + self.first_check,
+            'expires': now + self.grace,
+        })
+        self._ensure_running()
+        return await future
+
+    async def _fetch(self, handles):
+        """Returns `{lowercase handle: User or None}`, dropping unknown handles from a batch and retrying."""
+        found = {}
+        for i in range(0, len(handles), self.batch_size):
+            batch = handles[i:i + self.batch_size]
+            while batch:
+                try:
+                    self.calls += 1
+                    result = await self.client.user_info(batch)
+                except CodeforcesError as e:
+                    # One unknown handle fails the whole call, so take it out and ask again
+                    match = NOT_FOUND.search(str(e))
+                    if match is None:
+                        raise
+                    missing = match.group(1).lower()
+                    found[missing] = None
+                    remaining = [h for h in batch if h.lower() != missing]
+                    if len(remaining) == len(batch):
+                        raise
+                    batch = remaining
+                    continue
+                for user in result:
+                    found[user['handle'].lower()] = user
+                for handle in batch:
+                    found.setdefault(handle.lower(), None)
+                break
+        return found
+
+    async def _tick(self):
+        now = time.monotonic()
+        lookups, self._lookups = self._lookups, {}
+        due = [check for check in self._checks if check['next_check'] <= now]
+        handles = {key: handle for key, (handle, _) in lookups.items()}
+        for check in due:
+            handles.setdefault(check['handle'].lower(), check['handle'])
+        if not handles:
+            return
+
+        try:
+            found = await self._fetch(list(handles.values()))
+        except Exception as e:
+            for _, futures in lookups.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            for check in due:
+                check['next_check'] = now + self.retry
+                if now >= check['expires']:
+                    self._checks.remove(check)
+                    if not check['future'].done():
+                        check['future'].set_result(False)
+            print(f"Batched user.info failed: {e}")
+            return
+
+        for key, (_, futures) in lookups.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(key))
+        for check in due:
+            user = found.get(check['handle'].lower())
+            if user is not None and user.get('firstName') == check['token']:
+                result = True
+            elif user is None or now >= check['expires']:
+                result = False
+            else:
+                check['next_check'] = now + self.retry
+                continue
+            self._checks.remove(check)
+            if not check['future'].done():
+                check['future'].set_result(result)
+
+    async def _run(self):
+        while self._lookups or self._checks:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"Error in handle verification loop: {e}")